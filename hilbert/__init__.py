@@ -1,4 +1,5 @@
 import hilbert.CONSTANTS
+import hilbert.cache
 import hilbert.cooccurrence
 import hilbert.dependency
 import hilbert.dictionary
@@ -10,6 +11,7 @@ import hilbert.learner
 import hilbert.loader
 import hilbert.loss
 import hilbert.runners
+import hilbert.sampler
 import hilbert.scheduler
 import hilbert.shards
 import hilbert.solver
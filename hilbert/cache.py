@@ -0,0 +1,260 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+
+import hilbert as h
+
+
+# Bump this whenever the way shards are preprocessed or stored changes, so
+# that stale cache entries are never reused.
+CACHE_VERSION = 1
+
+
+# Default location of the ``SharedShardStore``, in memory where possible.
+SHARED_DIR = os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+    'hilbert-shards'
+)
+
+
+class ShardCache:
+    """
+    A content-addressed store of preprocessed training shards.  Each entry
+    holds the final per-shard tensors that a loader would otherwise have to
+    rebuild from the cooccurrence store, saved as ``.npy`` files so that
+    they can be memory-mapped when read back.
+
+    Entries are addressed by a key that hashes the store's location and
+    modification times together with all of the preprocessing options, so an
+    entry is never reused once the store or the options have changed.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(cooccurrence_path, **options):
+        """
+        Hash the cooccurrence store at ``cooccurrence_path`` (its absolute
+        path, and the name, size, and modification time of each of its files)
+        together with the preprocessing ``options``.  Options should have
+        stable string representations, e.g. floats, ints, and torch dtypes.
+        """
+        cooccurrence_path = os.path.abspath(cooccurrence_path)
+        files = []
+        for fname in sorted(os.listdir(cooccurrence_path)):
+            stat = os.stat(os.path.join(cooccurrence_path, fname))
+            files.append((fname, stat.st_size, stat.st_mtime_ns))
+        description = json.dumps({
+            'version': CACHE_VERSION,
+            'path': cooccurrence_path,
+            'files': files,
+            'options': {key: repr(options[key]) for key in sorted(options)}
+        })
+        return hashlib.sha256(description.encode('utf8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.path(key), 'manifest.json'))
+
+    def keys(self):
+        """List the keys of all complete entries."""
+        if not os.path.exists(self.cache_dir):
+            return []
+        return [key for key in os.listdir(self.cache_dir) if key in self]
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Hold an exclusive lock on ``key``, shared by all processes on the
+        machine, e.g. so that only one of them builds a missing entry while
+        the others wait to use it.
+        """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        with open('{}.lock'.format(self.path(key)), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, key, preloaded):
+        """
+        Store a list of preloaded shards, given as
+        ``(shard, (cooccurrence_data, unigram_data))`` pairs as produced by
+        ``DenseLoader``, under ``key``.  The entry is built in a temporary
+        directory and moved into place once complete, so readers never see a
+        partial entry.
+        """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = '{}.tmp-{}'.format(self.path(key), os.getpid())
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(temp_path)
+
+        manifest = []
+        num_tensors = 0
+        def write(array):
+            nonlocal num_tensors
+            fname = '{}.npy'.format(num_tensors)
+            np.save(os.path.join(temp_path, fname), array)
+            num_tensors += 1
+            return fname
+
+        for shard, (cooccurrence_data, unigram_data) in preloaded:
+            entry = {'shard': h.shards.serialize(shard)}
+            for name, tensors in (
+                ('cooccurrence', cooccurrence_data),
+                ('unigram', unigram_data)
+            ):
+                if tensors is None:
+                    entry[name] = None
+                    continue
+                entry[name] = []
+                for tensor in tensors:
+                    # Sparse tensors are stored as their indices and values.
+                    if tensor.is_sparse:
+                        tensor = tensor.cpu().coalesce()
+                        entry[name].append({
+                            'indices': write(tensor.indices().numpy()),
+                            'values': write(tensor.values().numpy()),
+                            'shape': list(tensor.shape)
+                        })
+                    else:
+                        entry[name].append(write(tensor.cpu().numpy()))
+            manifest.append(entry)
+
+        with open(os.path.join(temp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        # Another process may have finished the same entry first, in which
+        # case its copy is just as good.
+        try:
+            os.rename(temp_path, self.path(key))
+        except OSError:
+            shutil.rmtree(temp_path)
+
+    def load(self, key, mmap=True):
+        """
+        Read back the preloaded shards stored under ``key``, or return
+        ``None`` if there is no such entry.  Unless ``mmap`` is ``False``, the
+        tensors are backed by copy-on-write memory maps of the cached files,
+        so only the pages that are used get read from disk.
+        """
+        if key not in self:
+            return None
+        path = self.path(key)
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+
+        mmap_mode = 'c' if mmap else None
+        def read_array(fname):
+            return torch.from_numpy(
+                np.load(os.path.join(path, fname), mmap_mode=mmap_mode))
+
+        def read_tensor(stored):
+            if isinstance(stored, str):
+                return read_array(stored)
+            # Shards are coalesced before they are saved.  Marking them as
+            # such, rather than coalescing again, keeps them mapped instead
+            # of copied.
+            return torch.sparse_coo_tensor(
+                read_array(stored['indices']), read_array(stored['values']),
+                stored['shape'], is_coalesced=True
+            )
+
+        def read(stored_tensors):
+            if stored_tensors is None:
+                return None
+            return tuple(read_tensor(stored) for stored in stored_tensors)
+
+        preloaded = []
+        for entry in manifest:
+            i, j, step = entry['shard']
+            shard = h.shards.Shard(
+                (slice(i, None, step), slice(j, None, step)))
+            preloaded.append(
+                (shard, (read(entry['cooccurrence']), read(entry['unigram']))))
+        return preloaded
+
+
+class SharedShardStore(ShardCache):
+    """
+    A ``ShardCache`` kept in shared memory (by default in ``/dev/shm``), so
+    that several training processes on one machine can use a single copy of
+    the same preprocessed shards.  Loaded entries are memory-mapped, so the
+    processes read the same physical pages rather than each holding a copy.
+
+    Entries are reference counted.  Each process using an entry registers
+    with ``attach``, which creates a file in the entry's ``refs`` directory
+    and holds a lock on it.  When the last user calls ``release``, the entry
+    is deleted to free the memory.  The lock is dropped by the operating
+    system when a process exits, so users that died without releasing are
+    recognized and not counted.  Attaching and releasing must be done while
+    holding ``lock(key)``.
+    """
+
+    def __init__(self, cache_dir=None):
+        super(SharedShardStore, self).__init__(
+            SHARED_DIR if cache_dir is None else cache_dir)
+
+    def refs_path(self, key):
+        return os.path.join(self.path(key), 'refs')
+
+    def attach(self, key):
+        """
+        Register this process as a user of the entry under ``key``.  Returns
+        a handle to pass to ``release``.
+        """
+        refs_path = self.refs_path(key)
+        if not os.path.exists(refs_path):
+            os.makedirs(refs_path)
+        fd, ref_path = tempfile.mkstemp(
+            prefix='{}-'.format(os.getpid()), dir=refs_path)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd, ref_path
+
+    def release(self, key, handle):
+        """
+        Unregister the user identified by ``handle``, and delete the entry if
+        it was the last one.
+        """
+        fd, ref_path = handle
+        os.remove(ref_path)
+        os.close(fd)
+        if self.num_users(key) == 0:
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+    def num_users(self, key):
+        """
+        Count the live users of the entry under ``key``, clearing out those
+        left behind by processes that exited without releasing it.
+        """
+        refs_path = self.refs_path(key)
+        if not os.path.exists(refs_path):
+            return 0
+        num_users = 0
+        for fname in os.listdir(refs_path):
+            ref_path = os.path.join(refs_path, fname)
+            fd = os.open(ref_path, os.O_RDONLY)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                num_users += 1
+            else:
+                os.remove(ref_path)
+            finally:
+                os.close(fd)
+        return num_users
+
@@ -1,3 +1,4 @@
+from .pair_index import PairIndex
 from .cooccurrence import Cooccurrence
 from .cooccurrence_sector import CooccurrenceSector
 from .cooccurrence_mutable import (
@@ -5,3 +6,4 @@ from .cooccurrence_mutable import (
 from .extractor import CooccurrenceExtractor
 import hilbert.cooccurrence.extractor
 import hilbert.cooccurrence.extraction
+import hilbert.cooccurrence.pruning
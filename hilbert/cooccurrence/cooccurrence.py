@@ -39,7 +39,7 @@ class Cooccurrence(object):
             matrix, or a list of lists), in which the (i,j)th element contains
             the number of cooccurrence for words having IDs i and j.
 
-        Cooccurence statistics are represented as a scipy.sparse.lil_matrix.
+        Cooccurence statistics are represented as a scipy.sparse.csr_matrix.
         """
 
         if not unigram.sorted:
@@ -63,24 +63,26 @@ class Cooccurrence(object):
             self.unigram.N, dtype=dtype, device=MEM_DEVICE)
 
         # Own cooccurrence statistics and marginalized totals.
-        self.Nxx = sparse.lil_matrix(Nxx)
-
-        # Marginalizing counts actually takes long.  This seems to be faster
-        # than just calling self.Nxx.sum().
+        self.Nxx = self.as_sparse(Nxx)
         if marginalize:
-            Nx = np.zeros((self.Nxx.shape[0],1))
-            Nxt = np.zeros((1,self.Nxx.shape[1]))
-            for i in range(len(self.Nxx.data)):
-                # put in the marginal sums!
-                Nx[i] = sum(self.Nxx.data[i])
-                Nxt[:,self.Nxx.rows[i]] += self.Nxx.data[i]
-            self.Nx = torch.tensor(Nx, dtype=dtype)
-            self.Nxt = torch.tensor(Nxt, dtype=dtype)
+            self.Nx = torch.tensor(
+                np.asarray(self.Nxx.sum(axis=1)), dtype=dtype)
+            self.Nxt = torch.tensor(
+                np.asarray(self.Nxx.sum(axis=0)), dtype=dtype)
             self.N = self.Nx.sum()
         self.validate_shape()
         self.undersampled = False
 
 
+    @staticmethod
+    def as_sparse(Nxx):
+        """
+        Convert ``Nxx`` into the sparse format used to hold it.  CSR is used
+        since it is fast to slice by row, sum, multiply, and convert.
+        """
+        return sparse.csr_matrix(Nxx)
+
+
     def validate_shape(self):
         uNx_match = self.Nxx.shape[0] == self.uNx.shape[0] 
         uNxt_match = self.Nxx.shape[1] == self.uNxt.shape[1]
@@ -111,7 +113,7 @@ class Cooccurrence(object):
         the directory at `path`.
         """
         unigram = h.unigram.Unigram.load(path, verbose=verbose)
-        Nxx = sparse.load_npz(os.path.join(path, 'Nxx.npz')).tolil()
+        Nxx = sparse.load_npz(os.path.join(path, 'Nxx.npz'))
         return Cooccurrence(
             unigram, Nxx, marginalize=marginalize, verbose=verbose)
 
@@ -185,6 +187,35 @@ class Cooccurrence(object):
         return self.Nxx[id1, id2]
 
 
+    @property
+    def pair_index(self):
+        """
+        A ``PairIndex`` of the cooccurrence counts, built when first needed,
+        and rebuilt whenever ``Nxx`` is replaced.
+        """
+        if getattr(self, '_pair_index', None) is None or (
+            self._pair_index[0] is not self.Nxx
+        ):
+            self._pair_index = (self.Nxx, h.cooccurrence.PairIndex(self.Nxx))
+        return self._pair_index[1]
+
+
+    def count_ids(self, I, J):
+        """
+        Get the cooccurrence counts of many pairs of IDs at once, as an array
+        (or tensor, if ``I`` and ``J`` are tensors) whose ``k``th element is
+        the count for ``I[k]``, ``J[k]``.
+        """
+        return self.pair_index.lookup(I, J)
+
+
+    def counts(self, tokens1, tokens2):
+        """Get the cooccurrence counts of many pairs of tokens at once."""
+        I = np.array([self.dictionary.get_id(token) for token in tokens1])
+        J = np.array([self.dictionary.get_id(token) for token in tokens2])
+        return self.count_ids(I, J)
+
+
     def load_shard(self, shard=None, device=None):
         """
         Provides tensors corresponding to the cooccurrence data, marginalized
@@ -237,7 +268,7 @@ class Cooccurrence(object):
         if not isinstance(other, Cooccurrence):
             return NotImplemented
 
-        self.Nxx += other.Nxx
+        self.Nxx = self.as_sparse(self.Nxx + other.Nxx)
         self.Nx = np.array(np.sum(self.Nxx, axis=1))
         self.Nxt = np.array(np.sum(self.Nxx, axis=0))
         self.N = np.sum(self.Nx)
@@ -275,13 +306,13 @@ class Cooccurrence(object):
         self.undersampled = True
 
         # First calculate probability of dropping row-word and col-words
-        p_i = w2v_prob_keep(self.uNx, self.uN, t)
-        p_i = sparse.lil_matrix(p_i)
-        p_j = w2v_prob_keep(self.uNxt, self.uN, t)
-        p_j = sparse.lil_matrix(p_j)
+        p_i = w2v_prob_keep(self.uNx, self.uN, t).view(-1).numpy()
+        p_j = w2v_prob_keep(self.uNxt, self.uN, t).view(-1).numpy()
 
-        # Calculate the expectation cooccurrence after undersampling
-        self.Nxx = self.Nxx.multiply(p_i).multiply(p_j).tolil()
+        # Calculate the expectation cooccurrence after undersampling, by
+        # scaling rows and columns with diagonal matrices.
+        self.Nxx = self.as_sparse(
+            sparse.diags(p_i) @ self.Nxx @ sparse.diags(p_j))
 
         # Recalculate marginals.
         self.Nx = np.array(np.sum(self.Nxx, axis=1))
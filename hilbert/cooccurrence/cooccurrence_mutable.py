@@ -78,6 +78,14 @@ class CooccurrenceMutable(Cooccurrence):
             unigram, Nxx=Nxx, marginalize=True, verbose=verbose)
 
 
+    @staticmethod
+    def as_sparse(Nxx):
+        """
+        Counts are accumulated one cell at a time, which LIL supports well.
+        """
+        return sparse.lil_matrix(Nxx)
+
+
     def __copy__(self):
         return deepcopy(self)
 
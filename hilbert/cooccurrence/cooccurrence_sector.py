@@ -1,6 +1,8 @@
 import re
 import os
+import zipfile
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import torch
 import hilbert as h
@@ -42,7 +44,7 @@ class CooccurrenceSector(object):
             self.unigram.N, dtype=self.dtype, device=MEM_DEVICE)
 
         # Own cooccurrence statistics and marginalized totals.
-        self.Nxx = sparse.lil_matrix(Nxx)
+        self.Nxx = sparse.csr_matrix(Nxx)
         self._Nx = torch.tensor(Nx, dtype=self.dtype, device=MEM_DEVICE)
         self._Nxt = torch.tensor(Nxt, dtype=self.dtype, device=MEM_DEVICE)
         self.N = torch.sum(self._Nx)
@@ -50,10 +52,10 @@ class CooccurrenceSector(object):
         self.sector = sector
 
         # Distinct subsamples of the dictionary to index rows and columns.
-        self.row_dictionary = h.dictionary.Dictionary(
-            self.unigram.dictionary.tokens[sector[0]])
-        self.column_dictionary = h.dictionary.Dictionary(
-            self.unigram.dictionary.tokens[sector[1]])
+        self.row_dictionary = h.dictionary.DictionaryView(
+            self.unigram.dictionary, sector[0])
+        self.column_dictionary = h.dictionary.DictionaryView(
+            self.unigram.dictionary, sector[1])
 
         # Check all is good
         self.validate_shape()
@@ -61,13 +63,18 @@ class CooccurrenceSector(object):
 
 
     @staticmethod
-    def load(path, sector, min_cooccurrence_count=None, verbose=True):
+    def load(
+            path, sector, min_cooccurrence_count=None, verbose=True,
+            unigram=None
+        ):
         """
         Load the token-ID mapping and cooccurrence data previously saved in
-        the directory at `path`.
+        the directory at `path`.  When loading several sectors, pass the
+        store's `unigram` to share it rather than reading it again.
         """
         # Read Unigram
-        unigram = h.unigram.Unigram.load(path, verbose=verbose)
+        if unigram is None:
+            unigram = h.unigram.Unigram.load(path, verbose=verbose)
 
         # Read Nxx, Nx, and Nxt.
         if sector is None:
@@ -78,69 +85,117 @@ class CooccurrenceSector(object):
         Nx = np.load(os.path.join(path, 'Nx.npy'))
         Nxt = np.load(os.path.join(path, 'Nxt.npy'))
         # Remove low cooccurrence counts
+        Nxx = sparse.load_npz(os.path.join(path, Nxx_fname))
         if min_cooccurrence_count is not None:
-            Nxx = sparse.load_npz(os.path.join(path, Nxx_fname))
             Nxx = h.cooccurrence.CooccurrenceSector.remove_infrequent_cooccurrence(Nxx, min_cooccurrence_count)
-        else:
-            Nxx = sparse.load_npz(os.path.join(path, Nxx_fname)).tolil()
 
         return CooccurrenceSector(
             unigram, Nxx=Nxx, Nx=Nx, Nxt=Nxt, sector=sector, verbose=verbose)
 
 
     @staticmethod
-    def load_coo(cooccurrence_path, include_marginals=True, min_cooccurrence_count=None, verbose=True):
+    def load_coo(
+            cooccurrence_path, include_marginals=True,
+            min_cooccurrence_count=None, verbose=True, num_workers=None
+        ):
         """ 
         Reads in sectorized cooccurrence data from disk, and converts it
         into a sparse tensor representation using COO format.  If desired,
         marginal sums are included.
-        """
-
-        # Go though each sector and accumulate all of the non-zero data
-        # into a single sparse tensor representation.
-        data = torch.tensor([], dtype=h.utils.get_dtype(), device=MEM_DEVICE)
-        I = torch.tensor([], dtype=torch.int32, device=MEM_DEVICE)
-        J = torch.tensor([], dtype=torch.int32, device=MEM_DEVICE)
 
+        Sectors are read concurrently by ``num_workers`` threads (by default,
+        one per CPU), each writing straight into its own slice of the
+        output, which is allocated once.  Output is ordered by sector, and
+        then by row and column within each sector.
+        """
         sector_factor = h.cooccurrence.CooccurrenceSector.get_sector_factor(
             cooccurrence_path)
-
-        for sector_id in h.shards.Shards(sector_factor):
-
-            # Read the sector, and get the statistics in sparse COO-format
-            sector = h.cooccurrence.CooccurrenceSector.load(
-                cooccurrence_path, sector_id, min_cooccurrence_count=min_cooccurrence_count)
-            # reduced_sector = h.cooccurrence.CooccurrenceSector.remove_small_numbers(sector.Nxx)
-            sector_coo = sector.Nxx.tocoo()
-
-            # Tensorfy the data, and the row and column indices
-            add_Nxx = torch.tensor(sector_coo.data, dtype=h.utils.get_dtype())
-            add_i_idxs = torch.tensor(sector_coo.row, dtype=torch.int)
-            add_j_idxs = torch.tensor(sector_coo.col, dtype=torch.int)
-
-            # Adjust the row and column indices to account for sharding
-            add_i_idxs = add_i_idxs * sector_id.step + sector_id.i
-            add_j_idxs = add_j_idxs * sector_id.step + sector_id.j
-
-            # Concatenate
-            # I is a 1D indices tensor of i(covector); J is a 1D indices tensor of j(vector)
-            data = torch.cat((data, add_Nxx))
-            I = torch.cat((I, add_i_idxs))
-            J = torch.cat((J, add_j_idxs))
+        sector_ids = list(h.shards.Shards(sector_factor))
+        paths = [
+            os.path.join(cooccurrence_path, 'Nxx-{}-{}-{}.npz'.format(
+                *h.shards.serialize(sector_id)))
+            for sector_id in sector_ids
+        ]
+        if num_workers is None:
+            num_workers = min(len(sector_ids), os.cpu_count() or 1)
+
+        def read_sector(path):
+            Nxx = sparse.load_npz(path)
+            if min_cooccurrence_count is not None:
+                Nxx = h.cooccurrence.pruning.prune_min_count(
+                    Nxx, min_cooccurrence_count)
+            return Nxx.tocoo()
+
+        # Without pruning, sizes are known from the files' headers, so each
+        # sector can be decoded directly into place.  Otherwise the pruned
+        # sectors are kept until their sizes are known.
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            if min_cooccurrence_count is None:
+                sizes = [read_npz_nnz(path) for path in paths]
+                sectors = None
+            else:
+                sectors = list(executor.map(read_sector, paths))
+                sizes = [sector.nnz for sector in sectors]
+
+            offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+            data = torch.empty(
+                (offsets[-1],), dtype=h.utils.get_dtype(), device=MEM_DEVICE)
+            I = torch.empty((offsets[-1],), dtype=torch.int32, device=MEM_DEVICE)
+            J = torch.empty((offsets[-1],), dtype=torch.int32, device=MEM_DEVICE)
+            data_np, I_np, J_np = data.numpy(), I.numpy(), J.numpy()
+
+            def fill(k):
+                sector_coo = (
+                    read_sector(paths[k]) if sectors is None else sectors[k])
+                if sector_coo.nnz != sizes[k]:
+                    raise ValueError(
+                        'Sector {} holds {} counts, but {} were expected.'
+                        .format(paths[k], sector_coo.nnz, sizes[k])
+                    )
+                # Adjust the row and column indices to account for sharding
+                # I is a 1D indices tensor of i(covector); J is a 1D indices
+                # tensor of j(vector)
+                sector_id = sector_ids[k]
+                start, stop = offsets[k], offsets[k+1]
+                data_np[start:stop] = sector_coo.data
+                I_np[start:stop] = sector_coo.row * sector_id.step + sector_id.i
+                J_np[start:stop] = sector_coo.col * sector_id.step + sector_id.j
+
+            # Consuming the results surfaces any errors raised in workers.
+            list(executor.map(fill, range(len(sector_ids))))
 
         if include_marginals:
-            # Every sector has global marginals, so get marginals from last
-            # sector.
-            Nx = sector._Nx.clone().detach().requires_grad_(False)
-            Nxt = sector._Nxt.clone().detach().requires_grad_(False)
-            # Nx = torch.tensor(sector._Nx, dtype=h.utils.get_dtype())
-            # Nxt = torch.tensor(sector._Nxt, dtype=h.utils.get_dtype())
+            # Every sector has global marginals, so read them just once.
+            Nx = torch.tensor(
+                np.load(os.path.join(cooccurrence_path, 'Nx.npy')),
+                dtype=h.utils.get_dtype(), device=MEM_DEVICE
+            )
+            Nxt = torch.tensor(
+                np.load(os.path.join(cooccurrence_path, 'Nxt.npy')),
+                dtype=h.utils.get_dtype(), device=MEM_DEVICE
+            )
             return data, I, J, Nx, Nxt
         else:
             return data, I, J
+
     @staticmethod
     def remove_infrequent_cooccurrence(cooc, threshold):
-        return sparse.lil_matrix(np.where(cooc.todense() > threshold, cooc.todense(), 0))
+        return h.cooccurrence.pruning.prune_min_count(cooc, threshold)
+
+
+    def prune(self, min_count=None, top_k=None, pmi_threshold=None, mass=None):
+        """
+        Prune this sector's counts in place, using the transforms in
+        ``hilbert.cooccurrence.pruning``.  PMI uses the corpus marginals.  The
+        per-row top-k and the mass cutoff only see this sector, and marginals
+        are left unchanged; use ``pruning.prune_store`` to prune a whole
+        store offline with consistent marginals.
+        """
+        self.Nxx = h.cooccurrence.pruning.prune(
+            self.Nxx, min_count=min_count, top_k=top_k,
+            pmi_threshold=pmi_threshold, mass=mass,
+            Nx=self.Nx.numpy(), Nxt=self.Nxt.numpy(), N=self.N.item()
+        )
 
     @property
     def shape(self):
@@ -226,6 +281,35 @@ class CooccurrenceSector(object):
         return self.Nxx[id1, id2]
 
 
+    @property
+    def pair_index(self):
+        """
+        A ``PairIndex`` of the cooccurrence counts, built when first needed,
+        and rebuilt whenever ``Nxx`` is replaced.
+        """
+        if getattr(self, '_pair_index', None) is None or (
+            self._pair_index[0] is not self.Nxx
+        ):
+            self._pair_index = (self.Nxx, h.cooccurrence.PairIndex(self.Nxx))
+        return self._pair_index[1]
+
+
+    def count_ids(self, I, J):
+        """
+        Get the cooccurrence counts of many pairs of IDs at once, as an array
+        (or tensor, if ``I`` and ``J`` are tensors) whose ``k``th element is
+        the count for ``I[k]``, ``J[k]``.
+        """
+        return self.pair_index.lookup(I, J)
+
+
+    def counts(self, tokens1, tokens2):
+        """Get the cooccurrence counts of many pairs of tokens at once."""
+        I = np.array([self.row_dictionary.get_id(token) for token in tokens1])
+        J = np.array([self.column_dictionary.get_id(token) for token in tokens2])
+        return self.count_ids(I, J)
+
+
     def load_shard(self, shard=None, device=None):
         """
         Provides tensors corresponding to the cooccurrence data, marginalized
@@ -276,6 +360,50 @@ class CooccurrenceSector(object):
         return loaded_Nxx, loaded_Nx, loaded_Nxt, loaded_N
 
 
+    def load_relative_shards(
+            self, shard_factor, device=None, pin_memory=False, sparse=False,
+            out=None
+    ):
+        """
+        Provides the same data as ``load_relative_shard``, for every shard in
+        ``h.shards.Shards(shard_factor)`` at once, as a list of
+        ``(shard_id, (Nxx, Nx, Nxt, N))`` pairs.
+
+        All of the dense ``Nxx`` shards are made in a single pass over the
+        stored counts, into one preallocated buffer, which is page-locked if
+        ``pin_memory`` is ``True``.  This is much faster than densifying each
+        shard separately.
+
+        If ``sparse`` is ``True``, each ``Nxx`` is instead a sparse COO
+        tensor holding only the stored counts, and it is up to the caller to
+        densify it (the marginals are dense either way).  Otherwise, a buffer
+        to reuse for the dense shards can be given as ``out`` (see
+        ``h.utils.densify_shards``).
+        """
+        device = h.utils.get_device(device)
+        if sparse:
+            Nxx_shards = h.utils.sparse_shards(
+                self.Nxx, shard_factor or 1, dtype=self.dtype)
+        else:
+            Nxx_shards = h.utils.densify_shards(
+                self.Nxx, shard_factor or 1, dtype=self.dtype,
+                pin_memory=pin_memory, out=out
+            )
+
+        loaded = []
+        for shard_id, loaded_Nxx in zip(
+            h.shards.Shards(shard_factor), Nxx_shards
+        ):
+            loaded_Nx = h.utils.load_shard(
+                self.Nx, shard_id[0], device=device)
+            loaded_Nxt = h.utils.load_shard(
+                self.Nxt, (slice(None), shard_id[1]), device=device)
+            loaded_N = h.utils.load_shard(self.N, device=device)
+            loaded.append((shard_id, (
+                loaded_Nxx.to(device), loaded_Nx, loaded_Nxt, loaded_N)))
+        return loaded
+
+
     def load_unigram_shard(self, shard=None, device=None):
         """
         Provides tensors corresponding to the word occurrence (unigram) data,
@@ -327,14 +455,15 @@ class CooccurrenceSector(object):
     def apply_unigram_smoothing(self, alpha):
         """
         Smooth the unigram distribution by raising all frequencies to the 
-        exponent `alpha`, followed by re-normalization.  This irreversibly
-        mutates the underlying unigram object.
+        exponent `alpha`, followed by re-normalization.  The sector switches
+        to the unigram's smoothed version, leaving the unigram itself (which
+        may be shared with other sectors) unchanged.
         """
 
         if alpha == 1 or alpha is None:
             return
 
-        self.unigram.apply_smoothing(alpha)
+        self.unigram = self.unigram.get_smoothed(alpha)
 
         # We keep unigram data locally as a tensor, so we need to recopy it all
         dtype = h.CONSTANTS.DEFAULT_DTYPE
@@ -376,9 +505,10 @@ class CooccurrenceSector(object):
 
         # Calculate the expectation cooccurrence counts given undersampling.
         # This needs to be estimated in a different way.
-        p_i = sparse.lil_matrix(p_i[self.sector[0]].numpy())
-        p_j = sparse.lil_matrix(p_j[:,self.sector[1]].numpy())
-        self.Nxx = self.Nxx.multiply(p_i).multiply(p_j).tolil()
+        p_i = p_i[self.sector[0]].view(-1).numpy()
+        p_j = p_j[:,self.sector[1]].view(-1).numpy()
+        self.Nxx = sparse.csr_matrix(
+            sparse.diags(p_i) @ self.Nxx @ sparse.diags(p_j))
 
 
 
@@ -466,3 +596,17 @@ class CooccurrenceSector(object):
             )
 
 
+def read_npz_nnz(path):
+    """
+    Read the number of stored values in a sparse matrix saved by
+    ``scipy.sparse.save_npz``, from the header of its ``data`` array, without
+    decompressing anything.
+    """
+    with zipfile.ZipFile(path) as archive:
+        with archive.open('data.npy') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, _ = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, _ = np.lib.format.read_array_header_2_0(f)
+    return shape[0]
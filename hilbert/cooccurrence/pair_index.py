@@ -0,0 +1,49 @@
+import numpy as np
+import torch
+from scipy import sparse
+
+
+class PairIndex:
+    """
+    Looks up the stored values of a sparse matrix for whole batches of
+    ``(i, j)`` pairs at once.  Each stored entry gets the linear key
+    ``i * num_cols + j``.  The keys are kept sorted, so that a batch of pairs
+    can be found with a single call to ``searchsorted``, rather than
+    indexing the sparse matrix pair by pair.
+    """
+
+    def __init__(self, matrix):
+        matrix = sparse.coo_matrix(matrix)
+        matrix.sum_duplicates()
+        self.shape = matrix.shape
+        keys = matrix.row.astype(np.int64) * self.shape[1] + matrix.col
+        order = np.argsort(keys, kind='stable')
+        self.keys = torch.from_numpy(keys[order])
+        self.values = torch.from_numpy(matrix.data[order])
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def lookup(self, I, J, default=0):
+        """
+        Get the values stored at ``(I[k], J[k])`` for all ``k``, or
+        ``default`` for pairs with no stored value.  ``I`` and ``J`` can be
+        numpy arrays or torch tensors; the result is of the same kind.
+        """
+        as_numpy = isinstance(I, np.ndarray)
+        I = torch.as_tensor(I, dtype=torch.int64)
+        J = torch.as_tensor(J, dtype=torch.int64)
+        keys = I * self.shape[1] + J
+
+        if len(self.keys) == 0:
+            values = torch.full(keys.shape, default, dtype=self.values.dtype)
+        else:
+            positions = torch.searchsorted(self.keys, keys)
+            positions.clamp_(max=len(self.keys) - 1)
+            values = torch.where(
+                self.keys[positions] == keys, self.values[positions],
+                torch.tensor(default, dtype=self.values.dtype)
+            )
+        return values.numpy() if as_numpy else values
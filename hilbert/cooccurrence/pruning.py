@@ -0,0 +1,207 @@
+"""
+Transforms that prune cooccurrence counts while keeping them sparse.  Each
+works directly on the ``data`` array of a CSR matrix, so memory scales with
+the number of stored counts rather than with the size of the matrix.
+"""
+import os
+import shutil
+
+import numpy as np
+from scipy import sparse
+
+import hilbert as h
+
+
+def keep(Nxx, mask):
+    """
+    Return a copy of the CSR matrix ``Nxx`` keeping only the stored counts
+    for which ``mask`` (aligned with ``Nxx.data``) is ``True``.
+    """
+    Nxx = sparse.csr_matrix(Nxx, copy=True)
+    Nxx.data[~mask] = 0
+    Nxx.eliminate_zeros()
+    return Nxx
+
+
+def prune_min_count(Nxx, threshold):
+    """Keep only counts strictly greater than ``threshold``."""
+    Nxx = sparse.csr_matrix(Nxx)
+    return keep(Nxx, Nxx.data > threshold)
+
+
+def prune_top_k(Nxx, k):
+    """
+    Keep only the ``k`` largest counts in each row.  Ties are broken in favor
+    of lower column indices.
+    """
+    Nxx = sparse.csr_matrix(Nxx)
+    Nxx.sum_duplicates()
+    row_lengths = np.diff(Nxx.indptr)
+    rows = np.repeat(np.arange(Nxx.shape[0]), row_lengths)
+
+    # Sort by row, then by decreasing count; the rank of a count within its
+    # row is then its position past the start of the row.
+    order = np.lexsort((-Nxx.data, rows))
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - Nxx.indptr[rows[order]]
+    return keep(Nxx, ranks < k)
+
+
+def prune_pmi(Nxx, Nx, Nxt, N, threshold):
+    """
+    Keep only the counts whose pointwise mutual information, calculated using
+    the row marginals ``Nx``, column marginals ``Nxt``, and total ``N``,
+    is strictly greater than ``threshold``.
+    """
+    Nxx = sparse.csr_matrix(Nxx)
+    Nx = np.asarray(Nx, dtype=np.float64).reshape(-1)
+    Nxt = np.asarray(Nxt, dtype=np.float64).reshape(-1)
+    rows = np.repeat(np.arange(Nxx.shape[0]), np.diff(Nxx.indptr))
+    pmi = np.log(Nxx.data * float(N) / (Nx[rows] * Nxt[Nxx.indices]))
+    return keep(Nxx, pmi > threshold)
+
+
+def mass_threshold(counts, mass):
+    """
+    Find the smallest count such that keeping all ``counts`` at least that
+    large retains at least the fraction ``mass`` of their total.
+    """
+    if not 0 < mass <= 1:
+        raise ValueError('mass must be in (0, 1].  Got {}.'.format(mass))
+    counts = np.sort(np.asarray(counts).reshape(-1))[::-1]
+    if len(counts) == 0:
+        return 0
+    cumulative = np.cumsum(counts)
+    idx = np.searchsorted(cumulative, mass * cumulative[-1], side='left')
+    return counts[min(idx, len(counts) - 1)]
+
+
+def prune_mass(Nxx, mass):
+    """
+    Keep the largest counts that together account for at least the fraction
+    ``mass`` of the total count, dropping the long tail of small counts.
+    """
+    Nxx = sparse.csr_matrix(Nxx)
+    return keep(Nxx, Nxx.data >= mass_threshold(Nxx.data, mass))
+
+
+def prune(
+        Nxx, min_count=None, top_k=None, pmi_threshold=None, mass=None,
+        Nx=None, Nxt=None, N=None
+):
+    """
+    Apply the requested pruning transforms to ``Nxx``, in the order: minimum
+    count, per-row top-k, PMI threshold, mass cutoff.  Marginals ``Nx``,
+    ``Nxt``, and ``N`` are needed only for the PMI threshold.
+    """
+    Nxx = sparse.csr_matrix(Nxx)
+    if min_count is not None:
+        Nxx = prune_min_count(Nxx, min_count)
+    if top_k is not None:
+        Nxx = prune_top_k(Nxx, top_k)
+    if pmi_threshold is not None:
+        if Nx is None or Nxt is None or N is None:
+            raise ValueError('Pruning by PMI requires Nx, Nxt, and N.')
+        Nxx = prune_pmi(Nxx, Nx, Nxt, N, pmi_threshold)
+    if mass is not None:
+        Nxx = prune_mass(Nxx, mass)
+    return Nxx
+
+
+def prune_store(
+        in_path, out_path, min_count=None, top_k=None, pmi_threshold=None,
+        mass=None, verbose=True
+):
+    """
+    Write a pruned copy of the cooccurrence store at ``in_path`` to
+    ``out_path``, with the same sectors, and with marginals ``Nx`` and
+    ``Nxt`` recalculated from the pruned counts so that they stay consistent.
+
+    Sectors are processed one stripe of rows at a time: all sectors sharing
+    rows are joined so that per-row top-k sees whole rows.  PMI is calculated
+    using the original marginals.  The mass cutoff is global, so it is found
+    after the other transforms, using the counts kept in every sector.
+    """
+    sector_factor = h.cooccurrence.CooccurrenceSector.get_sector_factor(
+        in_path)
+    factor = 1 if sector_factor is None else sector_factor
+    def fname(i, j):
+        if sector_factor is None:
+            return 'Nxx.npz'
+        return 'Nxx-{}-{}-{}.npz'.format(i, j, sector_factor)
+
+    Nx = np.load(os.path.join(in_path, 'Nx.npy'))
+    Nxt = np.load(os.path.join(in_path, 'Nxt.npy'))
+    N = Nx.sum()
+    vocab = Nx.shape[0]
+
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+
+    # Prune one stripe of rows at a time.
+    kept_counts = []
+    for i in range(factor):
+        if verbose:
+            print('pruning row stripe {} of {}'.format(i + 1, factor))
+        rows, cols, data = [], [], []
+        for j in range(factor):
+            sector = sparse.load_npz(os.path.join(in_path, fname(i, j)))
+            sector = sector.tocoo()
+            rows.append(sector.row)
+            cols.append(sector.col * factor + j)
+            data.append(sector.data)
+        num_rows = len(range(i, vocab, factor))
+        stripe = sparse.csr_matrix(
+            (np.concatenate(data),
+                (np.concatenate(rows), np.concatenate(cols))),
+            shape=(num_rows, vocab)
+        )
+        stripe = prune(
+            stripe, min_count=min_count, top_k=top_k,
+            pmi_threshold=pmi_threshold, Nx=Nx[i::factor], Nxt=Nxt, N=N
+        )
+        kept_counts.append(stripe.data)
+        save_stripe(out_path, stripe, i, factor, fname)
+
+    # The mass cutoff considers the counts kept across all stripes.
+    threshold = None
+    if mass is not None:
+        threshold = mass_threshold(np.concatenate(kept_counts), mass)
+
+    # Apply the mass cutoff and recalculate marginals from what remains.
+    pruned_Nx = np.zeros(Nx.shape, dtype=Nx.dtype)
+    pruned_Nxt = np.zeros(Nxt.shape, dtype=Nxt.dtype)
+    for i in range(factor):
+        for j in range(factor):
+            path = os.path.join(out_path, fname(i, j))
+            sector = sparse.load_npz(path)
+            if threshold is not None:
+                sector = keep(sector, sector.data >= threshold)
+                sparse.save_npz(path, sector)
+            pruned_Nx[i::factor] += np.asarray(sector.sum(axis=1))
+            pruned_Nxt[:,j::factor] += np.asarray(sector.sum(axis=0))
+    np.save(os.path.join(out_path, 'Nx.npy'), pruned_Nx)
+    np.save(os.path.join(out_path, 'Nxt.npy'), pruned_Nxt)
+
+    # Unigram statistics describe the corpus, and are unaffected.
+    for unigram_fname in ('Nx.txt', 'dictionary'):
+        shutil.copy(
+            os.path.join(in_path, unigram_fname),
+            os.path.join(out_path, unigram_fname)
+        )
+
+
+def save_stripe(out_path, stripe, i, factor, fname):
+    """
+    Split a stripe of rows, whose columns are absolute, back into its
+    sectors and save them.
+    """
+    stripe = stripe.tocoo()
+    for j in range(factor):
+        mask = stripe.col % factor == j
+        num_cols = len(range(j, stripe.shape[1], factor))
+        sector = sparse.csr_matrix(
+            (stripe.data[mask], (stripe.row[mask], stripe.col[mask] // factor)),
+            shape=(stripe.shape[0], num_cols)
+        )
+        sparse.save_npz(os.path.join(out_path, fname(i, j)), sector)
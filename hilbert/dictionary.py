@@ -66,12 +66,74 @@ class Dictionary(object):
         return num_lines
 
     @staticmethod
-    def load(path):
+    def from_tokens(tokens):
+        """
+        Build a dictionary from a list of distinct tokens in bulk, without
+        checking each token individually as ``add_token`` does.
+        """
         dictionary = Dictionary()
-        with open(path) as f:
-            dictionary.tokens = f.read().split('\n')
+        dictionary.tokens = tokens
         dictionary.token_ids = {
             token: idx
             for idx, token in enumerate(dictionary.tokens)
         }
         return dictionary
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            return Dictionary.from_tokens(f.read().split('\n'))
+
+
+class DictionaryView(Dictionary):
+    """
+    A read-only view of the tokens of ``dictionary`` selected by the slice
+    ``index``, e.g. the rows or columns of a sector.  Looking up ids and
+    tokens is done arithmetically against the underlying dictionary, so a
+    view costs nothing to make; the view's own ``tokens`` list and
+    ``token_ids`` mapping are only built if they are asked for.
+    """
+
+    def __init__(self, dictionary, index):
+        self.dictionary = dictionary
+        self.range = range(*index.indices(len(dictionary)))
+        self._tokens = None
+        self._token_ids = None
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = self.dictionary.tokens[
+                self.range.start:self.range.stop:self.range.step]
+        return self._tokens
+
+    @property
+    def token_ids(self):
+        if self._token_ids is None:
+            self._token_ids = {
+                token: idx for idx, token in enumerate(self.tokens)}
+        return self._token_ids
+
+    def __contains__(self, key):
+        return self.get_id_safe(key) is not None
+
+    def __len__(self):
+        return len(self.range)
+
+    def get_id(self, token):
+        idx = self.get_id_safe(token)
+        if idx is None:
+            raise KeyError(token)
+        return idx
+
+    def get_id_safe(self, token, default=None):
+        idx = self.dictionary.get_id_safe(token)
+        if idx is None or idx not in self.range:
+            return default
+        return self.range.index(idx)
+
+    def get_token(self, idx):
+        return self.dictionary.tokens[self.range[idx]]
+
+    def add_token(self, token):
+        raise TypeError('Tokens cannot be added to a DictionaryView.')
@@ -1,4 +1,7 @@
+import itertools
+import mmap
 import os
+import struct
 import warnings
 
 import hilbert as h
@@ -11,6 +14,22 @@ except ImportError:
     np = None
 
 
+# Layout of the single-file embeddings container written by
+# ``Embeddings.save_mapped``.  The header holds the magic string, format
+# version, vocabulary size, dimensionality, and numpy dtype of the vectors,
+# followed by an (offset, nbytes) entry for each block.  Blocks start on page
+# boundaries so that each can be memory-mapped independently.
+MAPPED_MAGIC = b'HILBEMB\x00'
+MAPPED_VERSION = 1
+MAPPED_BLOCKS = ('V', 'W', 'vb', 'wb', 'dictionary')
+MAPPED_HEADER = struct.Struct('<8sIQQ8s' + 'QQ' * len(MAPPED_BLOCKS))
+MAPPED_ALIGNMENT = 4096
+
+# Number of embeddings handled at a time when reading or writing word2vec and
+# GloVe files, which bounds the memory used beyond the embeddings themselves.
+EXPORT_CHUNK_SIZE = 10000
+
+
 def random(
         vocab, d, include_covectors=True, include_biases=False, dictionary=None,
         seed=None, distribution='uniform', scale=0.2, device=None, verbose=True
@@ -72,8 +91,12 @@ class Embeddings:
 
     Optionally specify the ``device``.
 
-    If ``normalize`` is True, then normalize the vectors if they are not 
+    If ``normalize`` is True, then normalize the vectors if they are not
     already normalized.
+
+    By default the provided tensors are copied.  Pass ``copy=False`` to share
+    memory with them instead, whenever they already have the right dtype and
+    device.
     """
 
     def __init__(
@@ -85,7 +108,8 @@ class Embeddings:
             dictionary=None,
             device=None,
             normalize=False,
-            verbose=True
+            verbose=True,
+            copy=True
     ):
 
         self.verbose = verbose
@@ -94,13 +118,14 @@ class Embeddings:
         self.device = h.utils.get_device(device)
         self.dtype = h.utils.get_dtype()
 
-        # Own the provided tensors (note, this copies)
-        self.V = torch.tensor(V, dtype=self.dtype, device=self.device)
-        self.W = (None if W is None else torch.tensor(
+        # Own the provided tensors (note, this copies unless copy=False)
+        as_tensor = torch.tensor if copy else torch.as_tensor
+        self.V = as_tensor(V, dtype=self.dtype, device=self.device)
+        self.W = (None if W is None else as_tensor(
             W, dtype=self.dtype, device=self.device))
-        self.vb = (None if vb is None else torch.tensor(
+        self.vb = (None if vb is None else as_tensor(
             vb, dtype=self.dtype, device=self.device))
-        self.wb = (None if wb is None else torch.tensor(
+        self.wb = (None if wb is None else as_tensor(
             wb, dtype=self.dtype, device=self.device))
         self.set_dictionary(dictionary)
 
@@ -110,7 +135,10 @@ class Embeddings:
         self._unkW = None
         self._unkvb = None
         self._unkwb = None
-        self.check_normalized()
+
+        # Whether the vectors are normalized is only worked out when needed,
+        # since it requires a full pass over V and W.
+        self._normed = None
         if normalize:
             self.normalize()
 
@@ -298,9 +326,23 @@ class Embeddings:
                 )
             )
 
+    @property
+    def normed(self):
+        """
+        ``True`` if vectors and covectors have unit norm.  Checked lazily, the
+        first time it is needed.
+        """
+        if self._normed is None:
+            self.check_normalized()
+        return self._normed
+
+    @normed.setter
+    def normed(self, normed):
+        self._normed = normed
+
     def check_normalized(self):
         """
-        Returns ``True`` if vectors and covectors have unit norm.  
+        Returns ``True`` if vectors and covectors have unit norm.
         Sets ``self.normed``
         """
         ones = torch.ones(self.V.shape[0], device=self.device)
@@ -426,6 +468,91 @@ class Embeddings:
         if self.dictionary is not None:
             self.dictionary.save(os.path.join(path, 'dictionary'))
 
+    def save_mapped(self, path):
+        """
+        Save the vectors, covectors, biases, and dictionary together in a
+        single file at ``path``, which can later be memory-mapped using
+        ``Embeddings.load_mapped``.
+        """
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        np_dtype = np.dtype(torch.empty((), dtype=self.dtype).numpy().dtype)
+        blocks = {
+            'V': self.V, 'W': self.W, 'vb': self.vb, 'wb': self.wb,
+            'dictionary': None
+        }
+        for name in ('V', 'W', 'vb', 'wb'):
+            if blocks[name] is not None:
+                blocks[name] = np.ascontiguousarray(
+                    blocks[name].detach().cpu().numpy(), dtype=np_dtype)
+        if self.dictionary is not None:
+            blocks['dictionary'] = np.frombuffer(
+                '\n'.join(self.dictionary.tokens).encode('utf8'),
+                dtype=np.uint8
+            )
+
+        # Lay out the blocks, each starting on a page boundary.
+        offsets = []
+        cursor = MAPPED_HEADER.size
+        for name in MAPPED_BLOCKS:
+            if blocks[name] is None:
+                offsets.extend((0, 0))
+                continue
+            cursor = -(-cursor // MAPPED_ALIGNMENT) * MAPPED_ALIGNMENT
+            offsets.extend((cursor, blocks[name].nbytes))
+            cursor += blocks[name].nbytes
+
+        header = MAPPED_HEADER.pack(
+            MAPPED_MAGIC, MAPPED_VERSION, self.V.shape[0], self.V.shape[1],
+            np_dtype.str.encode('ascii'), *offsets
+        )
+        with open(path, 'wb') as f:
+            f.write(header)
+            for name, offset in zip(MAPPED_BLOCKS, offsets[::2]):
+                if blocks[name] is None:
+                    continue
+                f.write(b'\x00' * (offset - f.tell()))
+                f.write(memoryview(blocks[name]).cast('B'))
+
+    def save_word2vec(
+            self, path, binary=True, fmt='%.6f', chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        """
+        Write the vectors to ``path`` in word2vec's format, which is binary
+        by default, or text if ``binary`` is ``False`` (in which case values
+        are formatted using ``fmt``).  Requires a dictionary.  As in word2vec,
+        tokens in the binary format can't contain spaces.
+        """
+        self._require_dictionary()
+        with open(path, 'wb') as f:
+            f.write('{} {}\n'.format(*self.V.shape).encode('utf8'))
+            if binary:
+                _write_binary_vectors(
+                    f, self.dictionary.tokens, self.V, chunk_size)
+            else:
+                _write_text_vectors(
+                    f, self.dictionary.tokens, self.V, fmt, chunk_size)
+
+    def save_glove(self, path, fmt='%.6f', chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Write the vectors to ``path`` in GloVe's text format, one token per
+        line followed by its components formatted using ``fmt``.  Requires a
+        dictionary.
+        """
+        self._require_dictionary()
+        with open(path, 'wb') as f:
+            _write_text_vectors(
+                f, self.dictionary.tokens, self.V, fmt, chunk_size)
+
+    def _require_dictionary(self):
+        if self.dictionary is None:
+            raise ValueError(
+                "Can't export embeddings without a dictionary: word2vec and "
+                "GloVe formats store a token with each vector."
+            )
+
     def _as_slice(self, key):
         if isinstance(key, str):
             if self.dictionary is None:
@@ -582,3 +709,197 @@ class Embeddings:
             V, W=W, vb=vb, wb=wb, dictionary=dictionary,
             device=device
         )
+
+    @staticmethod
+    def load_mapped(path, device=None, verbose=True):
+        """
+        Static method for loading embeddings saved using
+        ``Embeddings.save_mapped``.  The file is memory-mapped, so on the
+        CPU no vectors are read from disk until they are accessed, and the
+        tensors share memory with the mapping rather than copying it.  Writing
+        to the tensors does not alter the file.
+        """
+        with open(path, 'rb') as f:
+            header = f.read(MAPPED_HEADER.size)
+        if len(header) < MAPPED_HEADER.size or header[:8] != MAPPED_MAGIC:
+            raise ValueError(
+                "{} is not a memory-mappable embeddings file.".format(path))
+        fields = MAPPED_HEADER.unpack(header)
+        version, vocab, d, np_dtype = fields[1:5]
+        if version != MAPPED_VERSION:
+            raise ValueError(
+                "Unsupported embeddings file version {} (expected {})."
+                .format(version, MAPPED_VERSION)
+            )
+        np_dtype = np.dtype(np_dtype.rstrip(b'\x00').decode('ascii'))
+        offsets = dict(zip(MAPPED_BLOCKS, zip(fields[5::2], fields[6::2])))
+
+        shapes = {'V': (vocab, d), 'W': (vocab, d), 'vb': (vocab,),
+                  'wb': (vocab,)}
+        tensors = {}
+        for name, shape in shapes.items():
+            offset, nbytes = offsets[name]
+            if nbytes == 0:
+                tensors[name] = None
+                continue
+            # Copy-on-write mapping keeps the array writable (as torch expects)
+            # while leaving the file untouched.
+            mapped = np.memmap(
+                path, dtype=np_dtype, mode='c', offset=offset, shape=shape)
+            tensors[name] = torch.from_numpy(mapped)
+
+        dictionary = None
+        offset, nbytes = offsets['dictionary']
+        if nbytes > 0:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                tokens = f.read(nbytes).decode('utf8').split('\n')
+            dictionary = h.dictionary.Dictionary.from_tokens(tokens)
+
+        return Embeddings(
+            tensors['V'], W=tensors['W'], vb=tensors['vb'], wb=tensors['wb'],
+            dictionary=dictionary, device=device, verbose=verbose, copy=False
+        )
+
+    @staticmethod
+    def load_word2vec(
+            path, binary=True, device=None, verbose=True,
+            chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        """
+        Static method for loading vectors stored in word2vec's format at
+        ``path``, which is binary by default, or text if ``binary`` is
+        ``False``.
+        """
+        with open(path, 'rb') as f:
+            vocab, d = (int(n) for n in f.readline().split())
+            header_size = f.tell()
+        if binary:
+            V, tokens = _read_binary_vectors(
+                path, header_size, vocab, d, chunk_size)
+        else:
+            V, tokens = _read_text_vectors(
+                path, header_size, vocab, d, chunk_size)
+        return Embeddings(
+            torch.from_numpy(V), dictionary=h.dictionary.Dictionary.from_tokens(
+                tokens), device=device, verbose=verbose, copy=False
+        )
+
+    @staticmethod
+    def load_glove(
+            path, d=None, device=None, verbose=True,
+            chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        """
+        Static method for loading vectors stored in GloVe's text format at
+        ``path``.  The dimension is read off the first line unless ``d`` is
+        given, which is needed if the first token contains spaces.
+        """
+        # GloVe files have no header, so count lines to size the vectors.
+        # Blank lines are counted too, but the vectors are trimmed to the
+        # lines actually read.
+        vocab = 0
+        last_byte = b'\n'
+        with open(path, 'rb') as f:
+            first_line = f.readline()
+            f.seek(0)
+            for block in iter(lambda: f.read(1 << 24), b''):
+                vocab += block.count(b'\n')
+                last_byte = block[-1:]
+        if last_byte != b'\n':
+            vocab += 1
+        if d is None:
+            d = len(first_line.rstrip().split(b' ')) - 1
+        V, tokens = _read_text_vectors(path, 0, vocab, d, chunk_size)
+        return Embeddings(
+            torch.from_numpy(V), dictionary=h.dictionary.Dictionary.from_tokens(
+                tokens), device=device, verbose=verbose, copy=False
+        )
+
+
+def _write_binary_vectors(f, tokens, V, chunk_size):
+    for start in range(0, V.shape[0], chunk_size):
+        chunk = V[start:start+chunk_size].detach().cpu().numpy()
+        chunk = np.ascontiguousarray(chunk, dtype='<f4')
+        row_bytes = chunk.shape[1] * 4
+        raw = chunk.tobytes()
+        f.write(b''.join(
+            token.encode('utf8') + b' '
+            + raw[i * row_bytes:(i + 1) * row_bytes] + b'\n'
+            for i, token in enumerate(tokens[start:start+chunk_size])
+        ))
+
+
+def _write_text_vectors(f, tokens, V, fmt, chunk_size):
+    line_fmt = '%s' + (' ' + fmt) * V.shape[1] + '\n'
+    for start in range(0, V.shape[0], chunk_size):
+        chunk = V[start:start+chunk_size].detach().cpu().numpy()
+        # Lay out each line's token and values in order, and format the
+        # whole chunk with a single format string.
+        fields = np.empty((chunk.shape[0], chunk.shape[1] + 1), dtype=object)
+        fields[:, 0] = tokens[start:start+chunk_size]
+        fields[:, 1:] = chunk.astype(np.float64)
+        f.write(
+            (line_fmt * chunk.shape[0] % tuple(fields.ravel())).encode('utf8'))
+
+
+def _read_binary_vectors(path, offset, vocab, d, chunk_size):
+    """
+    Read ``vocab`` records of the form ``token<space><d float32s>``, each
+    optionally followed by a newline, starting at byte ``offset`` of ``path``.
+    Only token boundaries are found one record at a time; vectors are gathered
+    a chunk at a time, directly into the preallocated array.
+    """
+    V = np.empty((vocab, d), dtype=np.float32)
+    tokens = []
+    vector_bytes = np.arange(d * 4)
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data = np.frombuffer(mapped, dtype=np.uint8)
+        try:
+            cursor = offset
+            for start in range(0, vocab, chunk_size):
+                stop = min(start + chunk_size, vocab)
+                vector_offsets = np.empty(stop - start, dtype=np.int64)
+                for i in range(stop - start):
+                    while mapped[cursor] == 10:
+                        cursor += 1
+                    space = mapped.find(b' ', cursor)
+                    tokens.append(mapped[cursor:space].decode('utf8'))
+                    vector_offsets[i] = space + 1
+                    cursor = space + 1 + d * 4
+                V[start:stop] = (
+                    data[vector_offsets[:,None] + vector_bytes].view('<f4'))
+        finally:
+            # The mapping can't be closed while numpy holds a view of it.
+            del data
+    return V, tokens
+
+
+def _read_text_vectors(path, offset, vocab, d, chunk_size):
+    """
+    Read up to ``vocab`` lines of the form ``token v1 v2 ... vd`` starting at
+    byte ``offset`` of ``path``, skipping blank lines.  Fields may be
+    separated by any run of whitespace, and tokens may contain spaces.  Values are parsed a chunk of lines at a time, directly into the
+    preallocated array, which is trimmed to the lines actually found.
+    """
+    V = np.empty((vocab, d), dtype=np.float32)
+    tokens = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        lines = (line for line in f if line.strip())
+        for start in range(0, vocab, chunk_size):
+            stop = min(start + chunk_size, vocab)
+            values = []
+            for line in itertools.islice(lines, stop - start):
+                fields = line.rsplit(None, d)
+                tokens.append(fields[0].decode('utf8'))
+                values.extend(fields[1:])
+            V[start:len(tokens)] = np.array(
+                values, dtype=np.float32).reshape(-1, d)
+            if len(tokens) < stop:
+                break
+    # Don't keep the rest of the preallocated array alive.
+    if len(tokens) < vocab:
+        V = V[:len(tokens)].copy()
+    return V, tokens
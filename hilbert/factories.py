@@ -175,6 +175,16 @@ def build_mle_sample_solver(
         gibbs=False,
         gibbs_iteration=1,
         get_distr=False,
+        sampler='categorical',
+        num_workers=None,
+        ring_size=None,
+        table_dir=None,
+        temperature_milestones=None,
+        temperature_schedule=None,
+        max_sectors=None,
+        without_replacement=False,
+        coalesce=False,
+        num_bands=None,
         bias=False,
         init_embeddings_path=None,
         dimensions=300,
@@ -197,7 +207,55 @@ def build_mle_sample_solver(
 
     min_cooccurrence_count: A small number threshold of cooc counts to be
     removed to fit into the GPU memory.
+
+    sampler: Which sampler the loader draws from, 'categorical' or 'alias'
+    (see ``h.sampler``).
+
+    num_workers: Draw batches ahead of time in this many background
+    processes, keeping up to ring_size batches ready.  Gibbs sampling depends
+    on the current model, so it can't be done ahead of time.
+
+    table_dir: Memory-map the sampling tables from this directory, building
+    them there if they are missing (see ``h.sampler.SamplingTables``, or
+    ``h.sampler.SectorTables`` for the sector-streaming loader).  Not used
+    by the balanced loaders.
+
+    temperature_milestones, temperature_schedule: Anneal the loader's
+    temperature, switching to temperature_schedule[k] after
+    temperature_milestones[k] updates (see ``h.scheduler.TempScheduler``).
+
+    max_sectors: Stream positive samples from the cooccurrence sectors on
+    disk, keeping at most this many sectors in memory, instead of loading
+    all counts (see ``h.loader.SectorSampleLoader``).
+
+    without_replacement: Take positive samples in turn from a shuffled
+    permutation of the nonzero pairs, weighting them by their tempered
+    probabilities, rather than drawing them (see ``h.loader.GPUSampleLoader``).
+
+    coalesce: Reduce each batch to its distinct pairs, weighting each in the
+    loss by its multiplicity, so the model works out each pair only once.
+
+    num_bands: For balanced samples, split the vocabulary into this many
+    frequency bands, and draw a fixed number of samples from each pair of
+    bands, weighted so the loss stays unbiased but varies less (see
+    ``h.loader.StratifiedSampleLoader``).  Only used with balanced, and
+    rejected otherwise.
     """
+    if gibbs and num_workers:
+        raise ValueError("Gibbs samples can't be drawn by background workers.")
+    if gibbs and coalesce:
+        raise ValueError("Gibbs samples can't be coalesced.")
+    if num_bands is not None and not balanced:
+        raise ValueError("num_bands stratifies balanced samples only.")
+    if max_sectors is not None and (balanced or gibbs):
+        raise ValueError(
+            "Sector streaming only draws positive and negative samples, so "
+            "max_sectors can't be used with balanced or gibbs.")
+    if without_replacement and (balanced or gibbs or max_sectors is not None):
+        raise ValueError(
+            "Only positive samples drawn from all counts at once can be "
+            "taken without replacement, so without_replacement can't be "
+            "used with balanced, gibbs, or max_sectors.")
 
     np.random.seed(seed)
     torch.random.manual_seed(seed)
@@ -231,24 +289,46 @@ def build_mle_sample_solver(
             get_distr=get_distr,
             temperature=temperature,
             batch_size=batch_size,
+            sampler=sampler,
             device=device,
             verbose=verbose,
             min_cooccurrence_count=min_cooccurrence_count,
+            table_dir=table_dir,
         )
     else:
-        if balanced:
+        if balanced and num_bands is not None:
+            print('Stratified loader for balanced samples.')
+            loader_class = h.loader.StratifiedSampleLoader
+            loader_options = {'num_bands': num_bands}
+        elif balanced:
             print('CPU loader for balanced samples.')
             loader_class = h.loader.CPUSampleLoader
+            loader_options = {}
+        elif max_sectors is not None:
+            loader_class = h.loader.SectorSampleLoader
+            loader_options = {
+                'max_sectors': max_sectors,
+                'table_dir': table_dir,
+            }
         else:
             loader_class = h.loader.GPUSampleLoader
+            loader_options = {
+                'table_dir': table_dir,
+                'without_replacement': without_replacement
+            }
 
         loader = loader_class(
             cooccurrence_path=corpus_stats_path,
             temperature=temperature,
             batch_size=batch_size,
+            sampler=sampler,
             device=device,
             verbose=verbose,
             min_cooccurrence_count=min_cooccurrence_count,
+            num_workers=num_workers,
+            ring_size=ring_size,
+            coalesce=coalesce,
+            **loader_options
         )
 
     optimizer = get_optimizer(opt_str, learner, learning_rate)
@@ -267,12 +347,20 @@ def build_mle_sample_solver(
     else:
         lr_scheduler = []
 
+    schedulers = list(lr_scheduler)
+    if temperature_schedule is not None:
+        if len(temperature_milestones or ()) != len(temperature_schedule):
+            raise ValueError(
+                "Each temperature in the schedule needs a milestone.")
+        schedulers.append(h.scheduler.TempScheduler(
+            loader, temperature_milestones, temperature_schedule))
+
     solver = h.solver.Solver(
         loader=loader,
         loss=loss,
         learner=learner,
         optimizer=optimizer,
-        schedulers=lr_scheduler,
+        schedulers=schedulers,
         dictionary=dictionary,
         verbose=verbose,
         gradient_accumulation=gradient_accumulation,
@@ -406,6 +494,14 @@ def build_mle_solver(
         corpus_stats_path,
         temperature=2,  # MLE option
         shard_factor=1,  # Dense option
+        cache_dir=None,  # Dense option
+        sparse=False,  # Dense option
+        sparse_loss=False,  # Dense option
+        buffer_size=None,  # Dense option
+        pin_memory=False,  # Dense option
+        prefetch_depth=0,  # Dense option
+        num_workers=None,  # Dense option
+        shared_dir=None,  # Dense option
         bias=False,
         init_embeddings_path=None,
         dimensions=300,
@@ -421,7 +517,8 @@ def build_mle_solver(
     dictionary = h.dictionary.Dictionary.load(
         os.path.join(corpus_stats_path, 'dictionary'))
 
-    loss = h.loss.MLELoss(ncomponents=len(dictionary) ** 2)
+    loss_class = h.loss.SparseMLELoss if sparse_loss else h.loss.MLELoss
+    loss = loss_class(ncomponents=len(dictionary) ** 2)
 
     learner = h.learner.DenseLearner(
         vocab=len(dictionary),
@@ -438,6 +535,14 @@ def build_mle_solver(
         include_unigrams=loss.REQUIRES_UNIGRAMS,
         device=device,
         verbose=verbose,
+        cache_dir=cache_dir,
+        sparse=sparse or sparse_loss,
+        densify=not sparse_loss,
+        buffer_size=buffer_size,
+        pin_memory=pin_memory,
+        prefetch_depth=prefetch_depth,
+        num_workers=num_workers,
+        shared_dir=shared_dir,
     )
 
     optimizer = get_optimizer(opt_str, learner, learning_rate)
@@ -460,6 +565,14 @@ def build_sgns_solver(
         undersampling=2.45e-5,  # SGNS option
         smoothing=0.75,  # SGNS option
         shard_factor=1,  # Dense option
+        cache_dir=None,  # Dense option
+        sparse=False,  # Dense option
+        sparse_loss=False,  # Dense option
+        buffer_size=None,  # Dense option
+        pin_memory=False,  # Dense option
+        prefetch_depth=0,  # Dense option
+        num_workers=None,  # Dense option
+        shared_dir=None,  # Dense option
         bias=False,
         init_embeddings_path=None,
         dimensions=300,
@@ -475,7 +588,8 @@ def build_sgns_solver(
     dictionary = h.dictionary.Dictionary.load(
         os.path.join(corpus_stats_path, 'dictionary'))
 
-    loss = h.loss.SGNSLoss(ncomponents=len(dictionary) ** 2, k=k)
+    loss_class = h.loss.SparseSGNSLoss if sparse_loss else h.loss.SGNSLoss
+    loss = loss_class(ncomponents=len(dictionary) ** 2, k=k)
 
     learner = h.learner.DenseLearner(
         vocab=len(dictionary),
@@ -494,6 +608,14 @@ def build_sgns_solver(
         smoothing=smoothing,
         device=device,
         verbose=verbose,
+        cache_dir=cache_dir,
+        sparse=sparse or sparse_loss,
+        densify=not sparse_loss,
+        buffer_size=buffer_size,
+        pin_memory=pin_memory,
+        prefetch_depth=prefetch_depth,
+        num_workers=num_workers,
+        shared_dir=shared_dir,
     )
 
     optimizer = get_optimizer(opt_str, learner, learning_rate)
@@ -515,6 +637,14 @@ def build_glove_solver(
         X_max=100,  # Glove option
         alpha=3 / 4,  # Glove option
         shard_factor=1,  # Dense option
+        cache_dir=None,  # Dense option
+        sparse=False,  # Dense option
+        sparse_loss=False,  # Dense option
+        buffer_size=None,  # Dense option
+        pin_memory=False,  # Dense option
+        prefetch_depth=0,  # Dense option
+        num_workers=None,  # Dense option
+        shared_dir=None,  # Dense option
         bias=True,
         init_embeddings_path=None,
         dimensions=300,
@@ -539,7 +669,8 @@ def build_glove_solver(
         device=device
     )
 
-    loss = h.loss.GloveLoss(
+    loss_class = h.loss.SparseGloveLoss if sparse_loss else h.loss.GloveLoss
+    loss = loss_class(
         ncomponents=len(dictionary) ** 2, X_max=100, alpha=3 / 4)
 
     loader = h.loader.DenseLoader(
@@ -548,6 +679,14 @@ def build_glove_solver(
         include_unigrams=loss.REQUIRES_UNIGRAMS,
         device=device,
         verbose=verbose,
+        cache_dir=cache_dir,
+        sparse=sparse or sparse_loss,
+        densify=not sparse_loss,
+        buffer_size=buffer_size,
+        pin_memory=pin_memory,
+        prefetch_depth=prefetch_depth,
+        num_workers=num_workers,
+        shared_dir=shared_dir,
     )
 
     optimizer = get_optimizer(opt_str, learner, learning_rate)
@@ -1,9 +1,367 @@
+import os
+import time
+import queue
+import weakref
+import threading
+import traceback
+from collections import deque, OrderedDict
+
+import numpy as np
 import torch
-from pytorch_categorical import Categorical
 
 import hilbert as h
 
 
+def as_dense(tensor):
+    """Materialize ``tensor`` if it is sparse, otherwise leave it be."""
+    return tensor.to_dense() if tensor.is_sparse else tensor
+
+
+def preload_sector(
+        cooccurrence_path,
+        sector_id,
+        unigram,
+        shard_factor,
+        include_unigrams=True,
+        undersampling=None,
+        smoothing=None,
+        sparse=False,
+        pin_memory=False,
+        get_buffer=None,
+        verbose=True
+):
+    """
+    Read one sector of the cooccurrence store at ``cooccurrence_path``,
+    apply undersampling and smoothing, and split it into shards.  Returns
+    the ``CooccurrenceSector`` and a list of its preloaded batches, as
+    ``(shard, (cooccurrence_data, unigram_data))`` pairs.  See
+    ``DenseLoader`` and ``DenseLoader._preload_iter`` for the options.
+    """
+    cooccurrence_sector = h.cooccurrence.CooccurrenceSector.load(
+        cooccurrence_path, sector_id, verbose=verbose, unigram=unigram)
+    cooccurrence_sector.apply_w2v_undersampling(undersampling)
+    cooccurrence_sector.apply_unigram_smoothing(smoothing)
+
+    out = None
+    if get_buffer is not None and not sparse:
+        num_rows, num_cols = cooccurrence_sector.shape
+        out = get_buffer(num_rows * num_cols)
+    sector_shards = cooccurrence_sector.load_relative_shards(
+        shard_factor, device='cpu', sparse=sparse, pin_memory=pin_memory,
+        out=out
+    )
+
+    preloaded = []
+    for shard_id, cooccurrence_data in sector_shards:
+        unigram_data = None
+        if include_unigrams:
+            unigram_data = cooccurrence_sector.load_relative_unigram_shard(
+                shard=shard_id, device='cpu')
+        preloaded.append(
+            (shard_id * sector_id, (cooccurrence_data, unigram_data)))
+    return cooccurrence_sector, preloaded
+
+
+# State of a sector preprocessing worker process.
+_sector_worker = {}
+
+def _init_sector_worker(options):
+    # Workers share the machine, so each gets one thread.
+    torch.set_num_threads(1)
+    _sector_worker['options'] = options
+    _sector_worker['unigram'] = h.unigram.Unigram.load(
+        options['cooccurrence_path'], verbose=False)
+
+
+def _preload_sector_worker(sector_num):
+    options = _sector_worker['options']
+    sector_id = h.shards.Shards(options['sector_factor'])[sector_num]
+    cooccurrence_sector, preloaded = preload_sector(
+        options['cooccurrence_path'], sector_id, _sector_worker['unigram'],
+        options['shard_factor'], include_unigrams=options['include_unigrams'],
+        undersampling=options['undersampling'],
+        smoothing=options['smoothing'], sparse=options['sparse'],
+        verbose=False
+    )
+    # Move tensors into shared memory, so that only handles are pickled.
+    for batch_id, batch_data in preloaded:
+        for tensors in batch_data:
+            for tensor in tensors or ():
+                if not tensor.is_sparse:
+                    tensor.share_memory_()
+    return preloaded
+
+
+def release_shared(store, key, handle):
+    """Stop using an entry of a ``SharedShardStore``."""
+    with store.lock(key):
+        store.release(key, handle)
+
+
+class ShardStream:
+    """
+    Runs a ``DenseLoader``'s ``_preload_iter`` in a background thread,
+    keeping up to ``buffer_size`` shards ready ahead of the consumer.
+
+    Dense shards are written into a fixed pool of sector-sized buffers,
+    page-locked if ``pin_memory`` is ``True``.  A sector's buffer is returned
+    to the pool once all of its shards have been served and the consumer has
+    asked for the next one, so memory use stays bounded however large the
+    cooccurrence store is.  A consumer that keeps using the last ``hold``
+    shards it was served (e.g. because their transfer to the device is still
+    in flight) should say so, and their buffers will be kept until later.
+    """
+
+    # Marks the end of the stream in the queue of ready shards.
+    END = object()
+
+    def __init__(self, loader, buffer_size, hold=0, pin_memory=False):
+        self.dtype = h.utils.get_dtype()
+        self.pin_memory = pin_memory
+        self.hold = hold
+        self.shards_per_sector = len(h.shards.Shards(loader.shard_factor))
+        self.ready = queue.Queue(maxsize=buffer_size)
+
+        # Enough buffers for the queued and held shards, plus the sectors
+        # being produced and consumed.  They are allocated when first needed.
+        num_buffers = (
+            -(-buffer_size // self.shards_per_sector)
+            + -(-hold // self.shards_per_sector) + 2
+        )
+        self.free_buffers = queue.Queue()
+        for i in range(num_buffers):
+            self.free_buffers.put(None)
+        self.used_buffers = deque()
+        self.num_served = 0
+        self.num_released = 0
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._produce, args=(loader,), daemon=True)
+        self.thread.start()
+
+    def get_buffer(self, num_elements):
+        """
+        Take a buffer from the pool, with at least ``num_elements`` elements,
+        waiting until one is free.
+        """
+        buffer = self._wait(self.free_buffers.get)
+        if buffer is None or buffer.numel() < num_elements:
+            buffer = torch.empty(
+                num_elements, dtype=self.dtype, pin_memory=self.pin_memory)
+        self.used_buffers.append(buffer)
+        return buffer
+
+    def _wait(self, operation, *args):
+        # Block on a queue, but give up if the stream is closed.
+        while not self.stopped.is_set():
+            try:
+                return operation(*args, timeout=0.1)
+            except (queue.Empty, queue.Full):
+                pass
+        raise StreamClosed()
+
+    def _produce(self, loader):
+        try:
+            for preloaded in loader._preload_iter(get_buffer=self.get_buffer):
+                self._wait(self.ready.put, preloaded)
+            self._wait(self.ready.put, self.END)
+        except StreamClosed:
+            pass
+        except Exception as e:
+            # Pass errors on, to be raised in the consumer's thread.
+            try:
+                self._wait(self.ready.put, e)
+            except StreamClosed:
+                pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # All but the last ``hold`` of the shards served so far are done
+        # with.  Recycle the buffers of sectors whose shards are all done.
+        num_done = self.num_served - self.hold
+        while self.used_buffers and (
+            num_done >= (self.num_released + 1) * self.shards_per_sector
+        ):
+            self.free_buffers.put(self.used_buffers.popleft())
+            self.num_released += 1
+
+        preloaded = self.ready.get()
+        if preloaded is self.END:
+            raise StopIteration
+        if isinstance(preloaded, Exception):
+            raise preloaded
+        self.num_served += 1
+        return preloaded
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class StreamClosed(Exception):
+    """Raised in a ``ShardStream``'s producer when the stream is closed."""
+
+
+def coalesce_pairs(IJ, num_cols):
+    """
+    Find the distinct ``(i, j)`` pairs among the rows of ``IJ``, where
+    ``j < num_cols``.  Returns them, the position among them of each row's
+    pair, and the number of rows holding each.
+    """
+    keys, inverse, counts = torch.unique(
+        IJ[:, 0] * num_cols + IJ[:, 1], return_inverse=True,
+        return_counts=True
+    )
+    return torch.stack((keys // num_cols, keys % num_cols), 1), inverse, counts
+
+
+def coalesce_sample_batch(IJ_sample, batch_data, num_cols):
+    """
+    Coalesce a batch of positive samples followed by as many negative
+    samples, like those of ``GPUSampleLoader``, so that each distinct pair
+    appears once in each half.  ``batch_data`` then gives the multiplicity
+    of each pair in ``counts``, the number of distinct positive pairs in
+    ``boundary``, and the number of samples in each half in
+    ``num_samples``.  Any ``positive_weights`` are kept, one per distinct
+    positive pair.
+    """
+    num_samples = IJ_sample.shape[0] // 2
+    positives, positive_inverse, positive_counts = coalesce_pairs(
+        IJ_sample[:num_samples], num_cols)
+    negatives, negative_inverse, negative_counts = coalesce_pairs(
+        IJ_sample[num_samples:], num_cols)
+    coalesced_data = {
+        'counts': torch.cat((positive_counts, negative_counts)).float(),
+        'boundary': len(positives),
+        'num_samples': num_samples,
+    }
+    if batch_data is not None and 'positive_weights' in batch_data:
+        weights = batch_data['positive_weights']
+        coalesced_data['positive_weights'] = weights.new_empty(
+            len(positives)).scatter_(0, positive_inverse, weights)
+    return torch.cat((positives, negatives)), coalesced_data
+
+
+def _flatten_batch(batch):
+    # A sample batch is ``(IJ, batch_data)``, where ``batch_data`` is
+    # ``None`` or a dict of tensors.  List its tensors in a fixed order.
+    IJ, batch_data = batch
+    if batch_data is None:
+        return [IJ]
+    return [IJ] + [batch_data[key] for key in sorted(batch_data)]
+
+
+def _produce_samples(draw, ring, free_slots, ready_slots, seed):
+    # Body of a sample producer process.  Fill free slots of the ring with
+    # new batches until given ``None``.
+    torch.set_num_threads(1)
+    torch.manual_seed(seed)
+    np.random.seed(seed % 2**32)
+    try:
+        while True:
+            slot = free_slots.get()
+            if slot is None:
+                return
+            for buffer, tensor in zip(ring, _flatten_batch(draw())):
+                buffer[slot].copy_(tensor)
+            ready_slots.put(slot)
+    except Exception:
+        ready_slots.put(traceback.format_exc())
+
+
+def _stop_producers(processes, free_slots):
+    for process in processes:
+        free_slots.put(None)
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+class SampleProducerPool:
+    """
+    Draws sample batches in ``num_workers`` background processes, so that
+    sampling overlaps with training and scales across cores.
+
+    ``draw`` is called with no arguments to make a batch, as an
+    ``(IJ, batch_data)`` pair whose tensors are on the CPU.  Workers are
+    forked, so they read the sampling tables already built by the parent
+    from the same physical pages, rather than each building or holding a
+    copy.  Batches are written into a ring of ``ring_size`` preallocated
+    slots in shared memory, and only the slot numbers travel between
+    processes.  ``next`` copies the oldest ready batch to ``device`` and
+    hands its slot back to the workers.  Each worker seeds its own random
+    number generators, starting from ``seed``.
+    """
+
+    def __init__(
+            self, draw, num_workers, ring_size=None, seed=None, device=None
+    ):
+        if num_workers < 1:
+            raise ValueError(
+                "``num_workers`` should be at least 1.  Got {}.".format(
+                    num_workers))
+        self.device = h.utils.get_device(device)
+        ring_size = 2 * num_workers if ring_size is None else ring_size
+        if seed is None:
+            seed = int(torch.randint(2**62, ()))
+
+        # Draw one batch here to learn the shapes of the slots.
+        template = draw()
+        self.keys = None if template[1] is None else sorted(template[1])
+        self.ring = [
+            torch.empty(
+                (ring_size,) + tensor.shape, dtype=tensor.dtype
+            ).share_memory_()
+            for tensor in _flatten_batch(template)
+        ]
+
+        context = torch.multiprocessing.get_context('fork')
+        self.free_slots = context.Queue()
+        self.ready_slots = context.Queue()
+        for slot in range(ring_size):
+            self.free_slots.put(slot)
+        self.processes = [
+            context.Process(
+                target=_produce_samples, daemon=True, args=(
+                    draw, self.ring, self.free_slots, self.ready_slots,
+                    seed + worker
+                )
+            )
+            for worker in range(num_workers)
+        ]
+        for process in self.processes:
+            process.start()
+        self.stop = weakref.finalize(
+            self, _stop_producers, self.processes, self.free_slots)
+
+    def _get_ready_slot(self):
+        while True:
+            try:
+                return self.ready_slots.get(timeout=1)
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    raise RuntimeError("A sample producer process died.")
+
+    def next(self):
+        """Take the next ready batch, as an ``(IJ, batch_data)`` pair."""
+        slot = self._get_ready_slot()
+        if isinstance(slot, str):
+            raise RuntimeError("A sample producer failed:\n{}".format(slot))
+        tensors = [
+            buffer[slot].to(self.device, copy=True) for buffer in self.ring]
+        self.free_slots.put(slot)
+        if self.keys is None:
+            return tensors[0], None
+        return tensors[0], dict(zip(self.keys, tensors[1:]))
+
+    def close(self):
+        self.stop()
+
+
 class DenseLoader:
     """
     Base class for any LoaderModel that implements the common functionality,
@@ -19,7 +377,61 @@ class DenseLoader:
             smoothing=None,
             device=None,
             verbose=True,
+            cache_dir=None,
+            sparse=False,
+            densify=True,
+            buffer_size=None,
+            pin_memory=False,
+            prefetch_depth=0,
+            num_workers=None,
+            shared_dir=None,
     ):
+        """
+        If ``cache_dir`` is given, the preprocessed shards are kept in a
+        ``ShardCache`` there, so that later loaders using the same
+        cooccurrence store and preprocessing options can skip straight to
+        memory-mapping them.
+
+        If ``sparse`` is ``True``, cooccurrence counts are held as sparse COO
+        tensors, and only densified after being moved to ``device``, just
+        before they are served.  Resident memory and transfer volume then
+        scale with the number of nonzero counts rather than with the size of
+        the shards.  Set ``densify`` to ``False`` to serve the sparse
+        tensors as they are, for losses that accept them, like
+        ``h.loss.SparseMLELoss``.
+
+        By default, all shards are preloaded into memory.  If ``buffer_size``
+        is given, shards are instead streamed from disk by a background
+        thread on each pass, keeping at most ``buffer_size`` shards ready, so
+        that cooccurrence stores larger than memory can be used.  (A cached
+        entry, if found, is still used, since it is memory-mapped.)
+
+        When loading onto a CUDA device, ``pin_memory`` keeps shards in
+        page-locked memory, so that they can be copied to the device
+        asynchronously.  Copies for the next ``prefetch_depth`` shards are
+        then started on a separate CUDA stream while the current shard is
+        being used.  The total time spent waiting for shards to be copied to
+        the device (or, with ``prefetch_depth=0``, copying them) is kept in
+        ``transfer_wait_time``, in seconds.  Time spent waiting for streamed
+        shards to be read and prepared is kept apart, in
+        ``stream_wait_time``.  Shards memory-mapped
+        from a ``shared_dir`` are not pinned, since pinning would copy them
+        into memory private to this process, undoing the sharing.
+
+        If ``num_workers`` is given, sectors are read and preprocessed by
+        that many worker processes when preloading.  The batches are the
+        same, and in the same order, as when preloading serially.  (Streamed
+        shards are always prepared by a single thread, to keep their memory
+        bounded.)
+
+        If ``shared_dir`` is given (e.g. ``h.cache.SHARED_DIR``, in
+        ``/dev/shm``), preloaded shards are published to a
+        ``SharedShardStore`` there, and memory-mapped from it.  Other loaders
+        on the machine with the same store and preprocessing attach to the
+        same entry instead of building their own copy.  The entry is deleted
+        once the last loader using it is garbage collected, or its
+        ``release()`` is called.
+        """
 
         # Own your biz.
         self.cooccurrence_path = cooccurrence_path
@@ -29,11 +441,30 @@ class DenseLoader:
         self.smoothing = smoothing
         self.verbose = verbose
         self.device = h.utils.get_device(device)
+        self.cache_dir = cache_dir
+        self.sparse = sparse
+        self.densify = densify
+        self.buffer_size = buffer_size
+        self.prefetch_depth = prefetch_depth
+        self.num_workers = num_workers
+        self.shared_dir = shared_dir
+        self.release = lambda: None
+
+        # Pinning and asynchronous copies only help in reaching a GPU.
+        on_cuda = torch.device(self.device).type == 'cuda'
+        self.pin_memory = pin_memory and on_cuda
+        self.transfer_stream = None
+        if on_cuda and prefetch_depth > 0:
+            self.transfer_stream = torch.cuda.Stream(device=self.device)
 
         # these will be used for preloading and loading
         self.cooccurrence_sector = None
         self.preloaded_batches = None
         self.crt_batch_id = None
+        self.stream = None
+        self.in_flight = deque()
+        self.transfer_wait_time = 0.
+        self.stream_wait_time = 0.
 
         # Preload everything into cRAM.
         self._preload()
@@ -41,10 +472,62 @@ class DenseLoader:
     def _preload(self):
         """
         Preload iterates over a generator that generates preloaded batches.
-        This fills up cRAM with all batches, but a smarter implementation could
-        just buffer some batches if they don't fit in cRAM, hence separating
-        this iteration over all batches from the generator of batches.
+        This fills up cRAM with all batches, unless a ``buffer_size`` was
+        given, in which case batches are streamed from the generator by a
+        ``ShardStream`` during iteration instead.
         """
+        cache = None
+        if self.shared_dir is not None:
+            cache = h.cache.SharedShardStore(self.shared_dir)
+        elif self.cache_dir is not None:
+            cache = h.cache.ShardCache(self.cache_dir)
+
+        if cache is None:
+            self._preload_all()
+            return
+
+        key = cache.key(
+            self.cooccurrence_path,
+            loader=self.__class__.__name__,
+            shard_factor=self.shard_factor,
+            include_unigrams=self.include_unigrams,
+            undersampling=self.undersampling,
+            smoothing=self.smoothing,
+            dtype=h.utils.get_dtype(),
+            sparse=self.sparse
+        )
+
+        # Only one process builds a missing entry; others wait to use it.
+        with cache.lock(key):
+            if key not in cache and self.buffer_size is None:
+                self._preload_all()
+                cache.save(key, self.preloaded_batches)
+
+                # Privately cached shards are already in memory.  Shared
+                # ones are used from the store, so that there's one copy.
+                if self.shared_dir is None:
+                    return
+
+            if key not in cache:
+                return
+            self.preloaded_batches = cache.load(key)
+            if self.shared_dir is not None:
+                handle = cache.attach(key)
+                self.release = weakref.finalize(
+                    self, release_shared, cache, key, handle)
+
+        if self.verbose:
+            print('Loaded cached shards {}'.format(key))
+        # Pinning would copy shared shards into this process' own memory.
+        if self.pin_memory and self.shared_dir is None:
+            self.preloaded_batches = [
+                self._pin(preloaded) for preloaded in self.preloaded_batches]
+
+    def _preload_all(self):
+        # Streamed shards are produced during iteration.
+        if self.buffer_size is not None:
+            return
+
         self.preloaded_batches = []
         if self.verbose:
             print('Preloading all shards...')
@@ -53,64 +536,202 @@ class DenseLoader:
         if self.verbose:
             print('Preloading complete!')
 
-    def _preload_iter(self, *args, **kwargs):
+    def _preload_iter(self, get_buffer=None):
+        """
+        Generate preloaded batches, sector by sector.  If ``get_buffer`` is
+        given, it is called with a number of elements, and should return a
+        buffer at least that large in which to write each sector's dense
+        shards.
+        """
 
         sector_factor = h.cooccurrence.CooccurrenceSector.get_sector_factor(
             self.cooccurrence_path)
 
+        # Sectors can be preprocessed in parallel, when preloading them all.
+        if self.num_workers is not None and get_buffer is None:
+            for sector_batches in self._parallel_preload_iter(sector_factor):
+                for preloaded in sector_batches:
+                    if self.pin_memory:
+                        preloaded = self._pin(preloaded)
+                    yield preloaded
+            return
+
+        # All sectors share the store's unigram.
+        unigram = h.unigram.Unigram.load(
+            self.cooccurrence_path, verbose=self.verbose)
+
         for i, sector_id in enumerate(h.shards.Shards(sector_factor)):
 
             if self.verbose:
                 print('loading sector {}'.format(i))
 
-            # Read the sector and transform as desired.
-            self.cooccurrence_sector = h.cooccurrence.CooccurrenceSector.load(
-                self.cooccurrence_path, sector_id)
-            self.cooccurrence_sector.apply_w2v_undersampling(
-                self.undersampling)
-            self.cooccurrence_sector.apply_unigram_smoothing(
-                self.smoothing)
-
-            # Yield cRAM-preloaded shards from this sector
-            for shard_id in h.shards.Shards(self.shard_factor):
-                cooccurrence_data = (
-                    self.cooccurrence_sector.load_relative_shard(
-                        shard=shard_id, device='cpu'
-                    )
-                )
-                unigram_data = None
-                if self.include_unigrams:
-                    unigram_data = (
-                        self.cooccurrence_sector.load_relative_unigram_shard(
-                            shard=shard_id, device='cpu'
-                        )
-                    )
-                yield shard_id * sector_id, (cooccurrence_data, unigram_data)
-
-    def _load(self, preloaded):
+            # Read the sector and transform as desired, and yield
+            # cRAM-preloaded shards from it.
+            self.cooccurrence_sector, sector_batches = preload_sector(
+                self.cooccurrence_path, sector_id, unigram,
+                self.shard_factor, include_unigrams=self.include_unigrams,
+                undersampling=self.undersampling, smoothing=self.smoothing,
+                sparse=self.sparse, pin_memory=self.pin_memory,
+                get_buffer=get_buffer, verbose=self.verbose
+            )
+            for preloaded in sector_batches:
+                if self.pin_memory:
+                    preloaded = self._pin(preloaded)
+                yield preloaded
+
+    def _parallel_preload_iter(self, sector_factor):
+        """
+        Preprocess sectors in a pool of ``num_workers`` processes, generating
+        each sector's list of preloaded batches, in order.  Workers hand back
+        their tensors in shared memory, so only handles to them are pickled.
+        Workers are started with ``spawn``, so it is safe to use this after
+        CUDA has been initialized.
+        """
+        options = {
+            'cooccurrence_path': self.cooccurrence_path,
+            'sector_factor': sector_factor,
+            'shard_factor': self.shard_factor,
+            'include_unigrams': self.include_unigrams,
+            'undersampling': self.undersampling,
+            'smoothing': self.smoothing,
+            'sparse': self.sparse,
+        }
+        num_sectors = len(h.shards.Shards(sector_factor))
+        context = torch.multiprocessing.get_context('spawn')
+        with context.Pool(
+            min(self.num_workers, num_sectors),
+            initializer=_init_sector_worker, initargs=(options,)
+        ) as pool:
+            sector_batches = pool.imap(
+                _preload_sector_worker, range(num_sectors))
+            for i, batches in enumerate(sector_batches):
+                if self.verbose:
+                    print('loaded sector {}'.format(i))
+                yield batches
+
+    @staticmethod
+    def _pin(preloaded):
+        """Move the tensors of a preloaded batch into page-locked memory."""
+        batch_id, batch_data = preloaded
+        return batch_id, tuple(
+            None if tensors is None else tuple(
+                tensor if tensor.is_pinned() else tensor.pin_memory()
+                for tensor in tensors
+            )
+            for tensors in batch_data
+        )
+
+    def _load(self, preloaded, non_blocking=False):
         batch_id, (cooccurrence_data, unigram_data) = preloaded
         cooccurrence_data = tuple(
-            tensor.to(self.device) for tensor in cooccurrence_data)
+            tensor.to(self.device, non_blocking=non_blocking)
+            for tensor in cooccurrence_data
+        )
+        if self.densify:
+            cooccurrence_data = tuple(
+                as_dense(tensor) for tensor in cooccurrence_data)
         if self.include_unigrams:
             unigram_data = tuple(
-                tensor.to(self.device) for tensor in unigram_data)
+                tensor.to(self.device, non_blocking=non_blocking)
+                for tensor in unigram_data
+            )
         return batch_id, (cooccurrence_data, unigram_data)
 
+    def _start_load(self, preloaded):
+        """
+        Start loading a batch onto the device.  Returns the loaded batch,
+        and, if the copies were issued asynchronously, an event marking when
+        they will be done.
+        """
+        if self.transfer_stream is None:
+            return self._load(preloaded), None
+        with torch.cuda.stream(self.transfer_stream):
+            loaded = self._load(preloaded, non_blocking=self.pin_memory)
+            done = torch.cuda.Event()
+            done.record()
+        return loaded, done
+
+    def _finish_load(self, loaded, done):
+        """Wait for a batch started by ``_start_load`` to be ready to use."""
+        if done is not None:
+            start = time.time()
+            done.synchronize()
+            self.transfer_wait_time += time.time() - start
+
+            # The batch was allocated on the transfer stream, but will be
+            # used on the current one.
+            batch_id, batch_data = loaded
+            for tensors in batch_data:
+                for tensor in tensors or ():
+                    tensor.record_stream(torch.cuda.current_stream())
+        return loaded
+
+    def _next_preloaded(self):
+        self.crt_batch_id += 1
+        if self.preloaded_batches is None:
+            if self.stream is None:
+                raise StopIteration
+            start = time.time()
+            try:
+                return next(self.stream)
+            except StopIteration:
+                self.close()
+                raise
+            finally:
+                self.stream_wait_time += time.time() - start
+        if self.crt_batch_id >= len(self.preloaded_batches):
+            raise StopIteration
+        return self.preloaded_batches[self.crt_batch_id]
+
     def __iter__(self):
         self.crt_batch_id = -1
+        self.in_flight.clear()
+        if self.preloaded_batches is None:
+            self.close()
+            self.stream = ShardStream(
+                self, self.buffer_size, hold=self.prefetch_depth,
+                pin_memory=self.pin_memory
+            )
         return self
 
     def __next__(self):
-        self.crt_batch_id += 1
-        if self.crt_batch_id >= len(self.preloaded_batches):
+        if self.prefetch_depth == 0:
+            preloaded = self._next_preloaded()
+            start = time.time()
+            loaded = self._load(preloaded)
+            self.transfer_wait_time += time.time() - start
+            return loaded
+
+        # Keep loads for the next ``prefetch_depth`` batches in flight,
+        # beyond the one being served.
+        while len(self.in_flight) <= self.prefetch_depth:
+            try:
+                preloaded = self._next_preloaded()
+            except StopIteration:
+                break
+            self.in_flight.append(self._start_load(preloaded))
+        if not self.in_flight:
             raise StopIteration
-        preloaded = self.preloaded_batches[self.crt_batch_id]
-        return self._load(preloaded)
+        return self._finish_load(*self.in_flight.popleft())
+
+    def close(self):
+        """Stop streaming shards, if a pass is in progress."""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
 
     def describe(self):
         return 'CooccurenceLoader'
 
     def __len__(self):
+        if self.preloaded_batches is None:
+            sector_factor = (
+                h.cooccurrence.CooccurrenceSector.get_sector_factor(
+                    self.cooccurrence_path))
+            return (
+                len(h.shards.Shards(sector_factor))
+                * len(h.shards.Shards(self.shard_factor))
+            )
         return len(self.preloaded_batches)
 
 
@@ -121,50 +742,167 @@ class GPUSampleLoader:
             cooccurrence_path,
             temperature=1,
             batch_size=100000,
+            sampler='categorical',
             device=None,
             verbose=True,
             min_cooccurrence_count=None,
+            num_workers=None,
+            ring_size=None,
+            table_dir=None,
+            without_replacement=False,
+            coalesce=False,
     ):
+        """
+        If ``num_workers`` is given, batches are drawn ahead of time by that
+        many background processes (see ``SampleProducerPool``), holding up to
+        ``ring_size`` batches ready.  The sampling tables are then kept on the
+        CPU, and finished batches are copied to ``device``.
+
+        If ``table_dir`` is given, the sampling tables are memory-mapped from
+        there, and only built (and saved there) if they are missing.  See
+        ``h.sampler.SamplingTables``.
+
+        If ``without_replacement`` is ``True``, positive samples are not drawn
+        from the tempered counts, but taken in turn from a shuffled
+        permutation of all nonzero pairs, reshuffled every epoch, so that
+        every pair is visited once per epoch.  Each positive sample then
+        comes with a weight, in ``batch_data['positive_weights']``, which is
+        its tempered probability times the number of pairs.  Weighting the
+        positive terms of the loss by these gives an unbiased estimate of
+        the loss under the tempered distribution.  The position in the
+        epoch is saved by ``state_dict``.
+
+        If ``coalesce`` is ``True``, each batch is reduced to its distinct
+        pairs before it is yielded, with their multiplicities in
+        ``batch_data['counts']`` (see ``coalesce_sample_batch``), so that
+        the model and loss only work out each distinct pair once.
+        """
+        if without_replacement and num_workers:
+            raise ValueError(
+                "Background producers can't share a walk through the pairs, "
+                "so ``without_replacement`` needs ``num_workers=None``.")
         self.cooccurrence_path = cooccurrence_path
-        Nxx_data, I, J, Nx, Nxt = h.cooccurrence.CooccurrenceSector.load_coo(
-            cooccurrence_path, min_cooccurrence_count=min_cooccurrence_count,
-            verbose=verbose)
-
+        self.without_replacement = without_replacement
+        self.coalesce = coalesce
+        self.sampler = sampler
         self.temperature = temperature
         self.device = h.utils.get_device(device)
+        self.sample_device = 'cpu' if num_workers else self.device
 
-        # Calculate the probabilities and then temper them.
-        # After tempering, probabilities are scores -- they don't sum to one
-        # The Categorical sampler will automatically normalize them.
-        Pi = Nx.view((-1,)) / Nx.sum()
-        Pi_raised = Pi ** (1 / temperature - 1)
-        Pi_tempered = Pi_raised * Pi
-
-        Pj = Nxt.view((-1,)) / Nx.sum()
-        Pj_raised = Pj ** (1 / temperature - 1)
-        Pj_tempered = Pj_raised * Pj
+        self.tables = h.sampler.SamplingTables.get(
+            cooccurrence_path, temperature,
+            min_cooccurrence_count=min_cooccurrence_count,
+            table_dir=table_dir, verbose=verbose
+        )
+        self._make_samplers()
+        self.I = self.tables['I'].to(self.sample_device)
+        self.J = self.tables['J'].to(self.sample_device)
+        self.num_cols = self.tables['Nxt'].numel()
 
-        Nxx_tempered = Nxx_data * Pi_raised[I.long()] * Pj_raised[J.long()]
+        self.batch_size = batch_size
+        self.yielded = False
 
-        self.positive_sampler = Categorical(Nxx_tempered, device=self.device)
-        self.negative_sampler = Categorical(Pi_tempered, device=self.device)
-        self.negative_sampler_t = Categorical(Pj_tempered, device=self.device)
+        # Position in the walk through the shuffled pairs.  Each epoch's
+        # permutation is generated from the seed, so it needn't be saved.
+        self.permutation_seed = int(torch.randint(2**62, ()))
+        self.epoch = 0
+        self.position = 0
+        self.permutation = None
+
+        self.num_workers = num_workers
+        self.ring_size = ring_size
+        self.producer_seed = (
+            int(torch.randint(2**62, ())) if num_workers else None)
+        self.producer_starts = 0
+        self.producers = None
+        self._start_producers()
+
+    def _make_samplers(self):
+        if self.without_replacement:
+            Nxx_tempered = self.tables['Nxx_tempered']
+            self.positive_weights = (
+                Nxx_tempered.to(torch.float64)
+                * (len(Nxx_tempered) / Nxx_tempered.sum(dtype=torch.float64))
+            ).to(self.sample_device, dtype=torch.float32)
+        else:
+            self.positive_sampler = self.tables.get_sampler(
+                self.sampler, 'Nxx_tempered', device=self.sample_device)
+        self.negative_sampler = self.tables.get_sampler(
+            self.sampler, 'Pi_tempered', device=self.sample_device)
+        self.negative_sampler_t = self.tables.get_sampler(
+            self.sampler, 'Pj_tempered', device=self.sample_device)
+
+    def _start_producers(self):
+        # Each start gets its own seeds, so restarted producers don't
+        # repeat the batches drawn before.
+        if self.num_workers:
+            self.producers = SampleProducerPool(
+                self._draw, self.num_workers, self.ring_size,
+                seed=(
+                    self.producer_seed
+                    + self.producer_starts * self.num_workers
+                ),
+                device=self.device
+            )
+            self.producer_starts += 1
 
-        self.I = I.to(self.device)
-        self.J = J.to(self.device)
+    def _load_producer_state(self, state):
+        # Restart the producers with the seeds they would have had next.
+        self.producer_seed = state['producer_seed']
+        self.producer_starts = state['producer_starts']
+        if self.producers is not None:
+            self.close()
+            self._start_producers()
 
-        self.batch_size = batch_size
-        self.yielded = False
+    def set_temperature(self, temperature):
+        """
+        Start drawing samples at a new ``temperature``.  The tempered
+        distributions are recalculated from the logs of the counts, and only
+        the samplers are rebuilt.  Background producers are restarted, so
+        batches drawn at the old temperature are dropped.
+        """
+        if temperature == self.temperature:
+            return
+        self.close()
+        self.temperature = temperature
+        self.tables.temper(temperature)
+        self._make_samplers()
+        self._start_producers()
 
-    def sample(self, batch_size):
+    def next_positives(self, batch_size):
+        """
+        Take the next ``batch_size`` positive outcomes from the walk through
+        the shuffled nonzero pairs, starting a new epoch if they run out.
+        """
+        chunks = []
+        while batch_size > 0:
+            if self.permutation is None:
+                generator = torch.Generator()
+                generator.manual_seed(self.permutation_seed + self.epoch)
+                self.permutation = torch.randperm(
+                    len(self.I), generator=generator
+                ).to(self.sample_device)
+            chunk = self.permutation[self.position:self.position+batch_size]
+            chunks.append(chunk)
+            batch_size -= len(chunk)
+            self.position += len(chunk)
+            if self.position == len(self.permutation):
+                self.epoch += 1
+                self.position = 0
+                self.permutation = None
+        return torch.cat(chunks)
+
+    def sample(self, batch_size, positive_choices=None):
         # Allocate space for the positive and negative samples.
         # To index using tensor contents, torch requires they be int64.
         IJ_sample = torch.empty(
-            (batch_size * 2, 2), device=self.device, dtype=torch.int64)
+            (batch_size * 2, 2), device=self.sample_device, dtype=torch.int64)
 
-        # Randomly draw positive outcomes, and map them to ij pairs
-        positive_choices = self.positive_sampler.sample(
-            sample_shape=(batch_size,))
+        # Randomly draw positive outcomes, unless they were given, and map
+        # them to ij pairs
+        if positive_choices is None:
+            positive_choices = self.positive_sampler.sample(
+                sample_shape=(batch_size,))
         IJ_sample[:batch_size, 0] = self.I[positive_choices]
         IJ_sample[:batch_size, 1] = self.J[positive_choices]
 
@@ -184,16 +922,309 @@ class GPUSampleLoader:
         self.yielded = False
         return self
 
+    def _draw(self):
+        if not self.without_replacement:
+            return self.sample(self.batch_size), None
+        positive_choices = self.next_positives(self.batch_size)
+        IJ_sample = self.sample(self.batch_size, positive_choices)
+        return IJ_sample, {
+            'positive_weights': self.positive_weights[positive_choices]}
+
+    def state_dict(self):
+        return {
+            'permutation_seed': self.permutation_seed,
+            'epoch': self.epoch,
+            'position': self.position,
+            'producer_seed': self.producer_seed,
+            'producer_starts': self.producer_starts,
+        }
+
+    def load_state_dict(self, state):
+        """
+        Resume the walk through the shuffled pairs where it was saved.
+        Batches that background producers had drawn ahead are lost, so with
+        ``num_workers`` the resumed samples are fresh ones, drawn with seeds
+        that weren't used before the checkpoint.
+        """
+        self.permutation_seed = state['permutation_seed']
+        self.epoch = state['epoch']
+        self.position = state['position']
+        self.permutation = None
+        self._load_producer_state(state)
+
     def __next__(self):
         if self.yielded:
             raise StopIteration
         self.yielded = True
+        if self.producers is not None:
+            IJ_sample, batch_data = self.producers.next()
+        else:
+            IJ_sample, batch_data = self._draw()
+        if self.coalesce:
+            return coalesce_sample_batch(IJ_sample, batch_data, self.num_cols)
+        return IJ_sample, batch_data
+
+    def close(self):
+        """Stop the background producers, if there are any."""
+        if self.producers is not None:
+            self.producers.close()
+            self.producers = None
+
+    def describe(self):
+        s = '\tcooccurrence_path = {}\n'.format(self.cooccurrence_path)
+        s += '\tbatch_size = {}\n'.format(self.batch_size)
+        s += '\ttemperature = {}\n'.format(self.temperature)
+        s += '\tsampler = {}\n'.format(self.sampler)
+        s += '\twithout_replacement = {}\n'.format(self.without_replacement)
+        s += '\tcoalesce = {}\n'.format(self.coalesce)
+        return s
+
+
+class SectorSampleLoader:
+    """
+    Draws the same samples as ``GPUSampleLoader``, but without ever holding
+    all of the cooccurrence counts in memory, so that it can be used with
+    stores larger than RAM.
+
+    Positive samples are drawn in two stages.  First, the number of samples
+    to come from each sector is drawn from a multinomial distribution, in
+    proportion to the sectors' total tempered masses.  These are worked out
+    from ``h.sampler.SectorTables``, which hold the logs of every sector's
+    counts in memory-mapped files, written in one pass over the sectors
+    when the loader is first made (and kept in ``table_dir``, if given).
+    Retempering then takes one vectorized pass over the mapped logs,
+    without reading the sectors' files again.  Then each sector
+    is visited in turn, and its share of the samples is drawn from the
+    tempered counts within it.  Given the numbers per sector, the samples
+    within each sector are drawn from that sector's conditional
+    distribution, so together they are exact samples from the global one.
+
+    To make reading sectors worthwhile, positive samples for
+    ``batches_per_draw`` batches are drawn at once, shuffled, and split into
+    batches.  At most ``max_sectors`` sectors' samplers are kept in memory.
+    Sectors are visited in alternating order on successive draws, so the
+    ones kept from the end of one draw are used at the start of the next.
+    Negative samples only need the marginals, and are drawn as in
+    ``GPUSampleLoader``.  Batches can be drawn by background processes, as
+    in ``GPUSampleLoader``, each of which then reads sectors of its own,
+    and coalesced as in ``GPUSampleLoader``.
+    """
+
+    def __init__(
+            self,
+            cooccurrence_path,
+            temperature=1,
+            batch_size=100000,
+            batches_per_draw=10,
+            max_sectors=1,
+            sampler='categorical',
+            device=None,
+            verbose=True,
+            min_cooccurrence_count=None,
+            num_workers=None,
+            ring_size=None,
+            coalesce=False,
+            table_dir=None,
+    ):
+        self.cooccurrence_path = cooccurrence_path
+        self.batch_size = batch_size
+        self.batches_per_draw = batches_per_draw
+        self.coalesce = coalesce
+        self.max_sectors = max_sectors
+        self.sampler = sampler
+        self.device = h.utils.get_device(device)
+        self.verbose = verbose
+        self.min_cooccurrence_count = min_cooccurrence_count
+        self.yielded = False
+
+        self.tables = h.sampler.SectorTables.get(
+            cooccurrence_path, min_cooccurrence_count, table_dir=table_dir,
+            verbose=verbose
+        )
+        Nx = torch.tensor(np.load(os.path.join(cooccurrence_path, 'Nx.npy')))
+        Nxt = torch.tensor(
+            np.load(os.path.join(cooccurrence_path, 'Nxt.npy')))
+        dtype = h.utils.get_dtype()
+        self.log_Pi = torch.log(Nx.view((-1,)).to(dtype) / Nx.sum())
+        self.log_Pj = torch.log(Nxt.view((-1,)).to(dtype) / Nx.sum())
+        self.num_cols = Nxt.numel()
+
+        self.num_workers = num_workers
+        self.ring_size = ring_size
+        self.producer_seed = (
+            int(torch.randint(2**62, ())) if num_workers else None)
+        self.producer_starts = 0
+        self.producers = None
+        self.sectors = OrderedDict()
+        self.temperature = None
+        self.set_temperature(temperature)
+
+    def set_temperature(self, temperature):
+        """
+        Start drawing samples at a new ``temperature``.  This takes a pass
+        over the mapped logs of the counts, to work out the sectors' tempered
+        masses.  Their samplers are only built as the sectors are next used.
+        """
+        if temperature == self.temperature:
+            return
+        self.close()
+        self.temperature = temperature
+        exponent = 1 / temperature
+        self.negative_sampler = h.sampler.get_sampler(
+            self.sampler, torch.exp(self.log_Pi * exponent), device='cpu')
+        self.negative_sampler_t = h.sampler.get_sampler(
+            self.sampler, torch.exp(self.log_Pj * exponent), device='cpu')
+
+        # Samplers for the old temperature are dropped.
+        self.sectors.clear()
+        self.sector_masses = self.tables.masses(temperature)
+        self.reverse = False
+        self.positives = deque()
+        self._start_producers()
+
+    def _start_producers(self):
+        # Each start gets its own seeds, so restarted producers don't
+        # repeat the batches drawn before.
+        if self.num_workers:
+            self.producers = SampleProducerPool(
+                self._draw, self.num_workers, self.ring_size,
+                seed=(
+                    self.producer_seed
+                    + self.producer_starts * self.num_workers
+                ),
+                device=self.device
+            )
+            self.producer_starts += 1
+
+    def _load_producer_state(self, state):
+        # Restart the producers with the seeds they would have had next.
+        self.producer_seed = state['producer_seed']
+        self.producer_starts = state['producer_starts']
+        if self.producers is not None:
+            self.close()
+            self._start_producers()
+
+    def state_dict(self):
+        return {
+            'positives': list(self.positives),
+            'reverse': self.reverse,
+            'producer_seed': self.producer_seed,
+            'producer_starts': self.producer_starts,
+        }
+
+    def load_state_dict(self, state):
+        """
+        Resume with the positive samples that were drawn but not yet used,
+        and the order in which sectors were being visited.  Batches that
+        background producers had drawn ahead are lost, so with
+        ``num_workers`` the resumed samples are fresh ones, rather than
+        those an uninterrupted run would have used.
+        """
+        self.positives = deque(state['positives'])
+        self.reverse = state['reverse']
+        self._load_producer_state(state)
+
+    def _get_sector(self, k):
+        """
+        Get the pair indices and sampler for sector ``k``, building the
+        sampler if it isn't one of the ones kept in memory.
+        """
+        if k in self.sectors:
+            self.sectors.move_to_end(k)
+            return self.sectors[k]
+        sector = self.tables.sector(k)
+        scores = h.sampler.SectorTables.temper(
+            sector['log_Nxx'], sector['log_PiPj'], self.temperature)
+        self.sectors[k] = (
+            sector['I'].long(), sector['J'].long(),
+            h.sampler.get_sampler(
+                self.sampler, scores.to(h.utils.get_dtype()), device='cpu')
+        )
+        while len(self.sectors) > self.max_sectors:
+            self.sectors.popitem(last=False)
+        return self.sectors[k]
+
+    def sample_positives(self, num_samples):
+        """
+        Draw ``num_samples`` positive ``(i, j)`` pairs, grouped by sector.
+        """
+        sector_choices = torch.multinomial(
+            self.sector_masses, num_samples, replacement=True)
+        counts = torch.bincount(
+            sector_choices, minlength=len(self.tables)).tolist()
+
+        # Visit the sectors kept in memory first.
+        order = range(len(self.tables))
+        self.reverse = not self.reverse
+        if self.reverse:
+            order = reversed(order)
+
+        IJ = torch.empty((num_samples, 2), dtype=torch.int64)
+        start = 0
+        for k in order:
+            if counts[k] == 0:
+                continue
+            I, J, sampler = self._get_sector(k)
+            choices = sampler.sample(sample_shape=(counts[k],))
+            IJ[start:start+counts[k], 0] = I[choices]
+            IJ[start:start+counts[k], 1] = J[choices]
+            start += counts[k]
+        return IJ
+
+    def sample(self, batch_size):
+        # Take this batch's positive samples from a shuffled draw for
+        # several batches, making a new draw when they run out.
+        if len(self.positives) == 0 or len(self.positives[0]) != batch_size:
+            num_samples = batch_size * self.batches_per_draw
+            positives = self.sample_positives(num_samples)
+            positives = positives[torch.randperm(num_samples)]
+            self.positives = deque(torch.split(positives, batch_size))
+        positives = self.positives.popleft()
+
+        IJ_sample = torch.empty((batch_size * 2, 2), dtype=torch.int64)
+        IJ_sample[:batch_size] = positives
+        IJ_sample[batch_size:, 0] = self.negative_sampler.sample(
+            sample_shape=(batch_size,))
+        IJ_sample[batch_size:, 1] = self.negative_sampler_t.sample(
+            sample_shape=(batch_size,))
+        device = 'cpu' if self.num_workers else self.device
+        return IJ_sample.to(device)
+
+    def __len__(self):
+        return 1
+
+    def __iter__(self):
+        self.yielded = False
+        return self
+
+    def _draw(self):
         return self.sample(self.batch_size), None
 
+    def __next__(self):
+        if self.yielded:
+            raise StopIteration
+        self.yielded = True
+        if self.producers is not None:
+            IJ_sample, batch_data = self.producers.next()
+        else:
+            IJ_sample, batch_data = self._draw()
+        if self.coalesce:
+            return coalesce_sample_batch(IJ_sample, batch_data, self.num_cols)
+        return IJ_sample, batch_data
+
+    def close(self):
+        """Stop the background producers, if there are any."""
+        if self.producers is not None:
+            self.producers.close()
+            self.producers = None
+
     def describe(self):
         s = '\tcooccurrence_path = {}\n'.format(self.cooccurrence_path)
         s += '\tbatch_size = {}\n'.format(self.batch_size)
         s += '\ttemperature = {}\n'.format(self.temperature)
+        s += '\tsampler = {}\n'.format(self.sampler)
+        s += '\tmax_sectors = {}\n'.format(self.max_sectors)
+        s += '\tcoalesce = {}\n'.format(self.coalesce)
         return s
 
 
@@ -206,16 +1237,23 @@ class GibbsSampleLoader:
             batch_size=1000,
             gibbs_iteration=1,
             get_distr=False,
+            sampler='categorical',
             device=None,
             verbose=True,
             min_cooccurrence_count=None,
+            table_dir=None,
     ):
-
+        """
+        If ``table_dir`` is given, the sampling tables are memory-mapped from
+        there, and only built (and saved there) if they are missing.  See
+        ``h.sampler.SamplingTables``.
+        """
         # Ownage.
         self.cooccurrence_path = cooccurrence_path
         self.learner = learner
         self.batch_size = batch_size
         self.temperature = temperature
+        self.sampler = sampler
         self.device = h.utils.get_device(device)
         self.yielded = False
         self.adaptive_softmax = False
@@ -223,30 +1261,34 @@ class GibbsSampleLoader:
         self.get_distr = get_distr
         self.gibbs_iteration = gibbs_iteration
 
-        Nxx_data, I, J, Nx, Nxt = h.cooccurrence.CooccurrenceSector.load_coo(
-            cooccurrence_path, min_cooccurrence_count=min_cooccurrence_count,
-            verbose=verbose)
-
-        # Calculate the probabilities and then temper them.
-        # After tempering, probabilities are scores -- they don't sum to one
-        Pi = Nx.view((-1,)) / Nx.sum()
-        Pi_raised = Pi ** (1 / temperature - 1)
-        Pi_tempered = Pi_raised * Pi
-
-        Pj = Nxt.view((-1,)) / Nx.sum()
-        Pj_raised = Pj ** (1 / temperature - 1)
-        Pj_tempered = Pj_raised * Pj
-
-        Nxx_tempered = Nxx_data * Pi_raised[I.long()] * Pj_raised[J.long()]
+        self.tables = h.sampler.SamplingTables.get(
+            cooccurrence_path, temperature,
+            min_cooccurrence_count=min_cooccurrence_count,
+            table_dir=table_dir, verbose=verbose
+        )
+        self._make_samplers()
 
-        self.positive_sampler = Categorical(Nxx_tempered, device=self.device)
+        self.Nxx_data = self.tables['Nxx_data']
+        self.I = self.tables['I'].to(self.device)
+        self.J = self.tables['J'].to(self.device)
 
-        self.Nxx_data = Nxx_data
-        self.I = I.to(self.device)
-        self.J = J.to(self.device)
+    def _make_samplers(self):
+        self.positive_sampler = self.tables.get_sampler(
+            self.sampler, 'Nxx_tempered', device=self.device)
+        self.Pi = self.tables['Pi_tempered'].to(self.device)
+        self.Pj = self.tables['Pj_tempered'].to(self.device)
 
-        self.Pi = Pi_tempered.to(self.device)
-        self.Pj = Pj_tempered.to(self.device)
+    def set_temperature(self, temperature):
+        """
+        Start drawing samples at a new ``temperature``.  The tempered
+        distributions are recalculated from the logs of the counts, and only
+        the samplers are rebuilt.
+        """
+        if temperature == self.temperature:
+            return
+        self.temperature = temperature
+        self.tables.temper(temperature)
+        self._make_samplers()
 
     def get_batch_words(self, batch_id, dictionary):
         # help function for investigating problematic pairs of words
@@ -442,6 +1484,7 @@ class GibbsSampleLoader:
         s = '\tcooccurrence_path = {}\n'.format(self.cooccurrence_path)
         s += '\tbatch_size = {}\n'.format(self.batch_size)
         s += '\ttemperature = {}\n'.format(self.temperature)
+        s += '\tsampler = {}\n'.format(self.sampler)
         return s
 
 
@@ -452,12 +1495,28 @@ class CPUSampleLoader:
             cooccurrence_path,
             temperature=1,
             batch_size=100000,
+            sampler='categorical',
             device=None,
             min_cooccurrence_count=None,
-            verbose=True
+            verbose=True,
+            num_workers=None,
+            ring_size=None,
+            coalesce=False,
     ):
+        """
+        If ``num_workers`` is given, batches are drawn ahead of time by that
+        many background processes (see ``SampleProducerPool``), holding up to
+        ``ring_size`` batches ready.
+
+        If ``coalesce`` is ``True``, each batch is reduced to its distinct
+        pairs before it is yielded.  ``batch_data`` then gives their
+        multiplicities in ``counts``, and the size of the batch in
+        ``num_samples``.
+        """
         # Ownage.
         self.cooccurrence_path = cooccurrence_path
+        self.sampler = sampler
+        self.coalesce = coalesce
         self.batch_size = batch_size
         self.yielded = False
 
@@ -466,34 +1525,101 @@ class CPUSampleLoader:
 
         self.temperature = temperature
         self.device = h.utils.get_device(device)
+        self.sample_device = 'cpu' if num_workers else self.device
 
-        # Calculate the probabilities and then temper them.
-        # After tempering, probabilities are scores -- they don't sum to one
-        # The Categorical sampler will automatically normalize them.
+        # Calculate the probabilities.  They are tempered when the samplers
+        # are made.
         Pi = Nx / Nx.sum()
-        Pi_tempered = (Pi ** (1 / temperature)).view((-1,))
         Pj = Nxt / Nx.sum()
-        Pj_tempered = (Pj ** (1 / temperature)).view((-1,))
+        self.log_Pi = torch.log(Pi).view((-1,))
+        self.log_Pj = torch.log(Pj).view((-1,))
 
         # Calculate the exponential of PMI for ij pairs, according to the
         # corpus. These are needed because we are importance-sampling
         # the corpus distribution using the independent distribution.
-        self.exp_pmi = Nxx.multiply(
-            1 / N).multiply(1 / Pi.numpy()).multiply(1 / Pj.numpy()).tolil()
+        # They are kept in a PairIndex, so batches can be looked up at once.
+        self.exp_pmi = h.cooccurrence.PairIndex(Nxx.multiply(
+            1 / N).multiply(1 / Pi.numpy()).multiply(1 / Pj.numpy()))
+
+        self._make_samplers()
+
+        self.num_workers = num_workers
+        self.ring_size = ring_size
+        self.producer_seed = (
+            int(torch.randint(2**62, ())) if num_workers else None)
+        self.producer_starts = 0
+        self.producers = None
+        self._start_producers()
+
+    def _make_samplers(self):
+        # Make samplers for the tempered independent distribution.
+        # After tempering, probabilities are scores -- they don't sum to one
+        # The samplers will automatically normalize them.
+        self.I_sampler = h.sampler.get_sampler(
+            self.sampler, torch.exp(self.log_Pi / self.temperature),
+            device='cpu'
+        )
+        self.J_sampler = h.sampler.get_sampler(
+            self.sampler, torch.exp(self.log_Pj / self.temperature),
+            device='cpu'
+        )
 
-        # Make samplers for the independent distribution.
-        self.I_sampler = Categorical(Pi_tempered, device='cpu')
-        self.J_sampler = Categorical(Pj_tempered, device='cpu')
+    def _start_producers(self):
+        # Each start gets its own seeds, so restarted producers don't
+        # repeat the batches drawn before.
+        if self.num_workers:
+            self.producers = SampleProducerPool(
+                self._draw, self.num_workers, self.ring_size,
+                seed=(
+                    self.producer_seed
+                    + self.producer_starts * self.num_workers
+                ),
+                device=self.device
+            )
+            self.producer_starts += 1
+
+    def _load_producer_state(self, state):
+        # Restart the producers with the seeds they would have had next.
+        self.producer_seed = state['producer_seed']
+        self.producer_starts = state['producer_starts']
+        if self.producers is not None:
+            self.close()
+            self._start_producers()
+
+    def state_dict(self):
+        return {
+            'producer_seed': self.producer_seed,
+            'producer_starts': self.producer_starts,
+        }
+
+    def load_state_dict(self, state):
+        """
+        Restart any background producers with seeds that weren't used before
+        the checkpoint.  Batches they had drawn ahead are lost, so the
+        resumed samples are fresh ones.
+        """
+        self._load_producer_state(state)
+
+    def set_temperature(self, temperature):
+        """
+        Start drawing samples at a new ``temperature``, rebuilding only the
+        samplers.  Background producers are restarted, so batches drawn at
+        the old temperature are dropped.
+        """
+        if temperature == self.temperature:
+            return
+        self.close()
+        self.temperature = temperature
+        self._make_samplers()
+        self._start_producers()
 
     def sample(self, batch_size):
         # Randomly draw independent outcomes.
         IJ = torch.zeros((batch_size, 2), dtype=torch.int64)
         IJ[:, 0] = self.I_sampler.sample(sample_shape=(batch_size,))
         IJ[:, 1] = self.J_sampler.sample(sample_shape=(batch_size,))
-        exp_pmi = torch.tensor(
-            self.exp_pmi[IJ[:, 0], IJ[:, 1]].toarray().reshape((-1,)),
-            dtype=torch.float32, device=self.device
-        )
+        exp_pmi = self.exp_pmi.lookup(IJ[:, 0], IJ[:, 1]).to(
+            dtype=torch.float32, device=self.sample_device)
         return IJ, {'exp_pmi': exp_pmi}
 
     def __len__(self):
@@ -503,16 +1629,223 @@ class CPUSampleLoader:
         self.yielded = False
         return self
 
+    def _draw(self):
+        return self.sample(self.batch_size)
+
+    def _coalesce(self, IJ, batch_data):
+        # Everything in batch_data is a function of the pair, so any copy of
+        # a repeated pair's values will do.
+        unique_IJ, inverse, counts = coalesce_pairs(IJ, self.log_Pj.numel())
+        coalesced_data = {}
+        for name, values in batch_data.items():
+            coalesced_data[name] = values.new_empty(len(unique_IJ)).scatter_(
+                0, inverse.to(values.device), values)
+        coalesced_data['counts'] = counts.to(
+            dtype=torch.float32, device=batch_data['exp_pmi'].device)
+        coalesced_data['num_samples'] = IJ.shape[0]
+        return unique_IJ, coalesced_data
+
     def __next__(self):
         if self.yielded:
             raise StopIteration
         self.yielded = True
-        return self.sample(self.batch_size)
+        if self.producers is not None:
+            IJ, batch_data = self.producers.next()
+        else:
+            IJ, batch_data = self._draw()
+        if self.coalesce:
+            return self._coalesce(IJ, batch_data)
+        return IJ, batch_data
+
+    def close(self):
+        """Stop the background producers, if there are any."""
+        if self.producers is not None:
+            self.producers.close()
+            self.producers = None
 
     def describe(self):
         s = '\tcooccurrence_path = {}\n'.format(self.cooccurrence_path)
         s += '\tbatch_size = {}\n'.format(self.batch_size)
         s += '\ttemperature = {}\n'.format(self.temperature)
+        s += '\tsampler = {}\n'.format(self.sampler)
+        s += '\tcoalesce = {}\n'.format(self.coalesce)
+        return s
+
+
+class StratifiedSampleLoader(CPUSampleLoader):
+    """
+    Estimates the same loss as ``CPUSampleLoader``, but with less variance,
+    by stratifying its proposal distribution.  Words are ordered by
+    frequency, so the rows and the columns are each split into
+    ``num_bands`` contiguous bands of roughly equal tempered probability,
+    and each pair of a row band and a column band forms a stratum.  Every
+    batch draws a fixed number of samples from within each stratum.
+
+    Samples are allocated to strata in proportion to each stratum's
+    probability under the proposal times the spread of ``exp_pmi`` within it
+    (Neyman allocation), since the large ``exp_pmi`` of rare pairs is where
+    the importance weights vary most.  A ``proportional_fraction`` of the
+    batch is instead allocated in proportion to the strata's probabilities
+    alone, to cover the ``exp(response)`` term, and every stratum gets at
+    least one sample.  Each sample comes with a weight in
+    ``batch_data['weights']``, which is its stratum's probability times the
+    batch size, divided by the number of samples drawn from that stratum.
+    Weighting the loss by these keeps it an unbiased estimate.
+    """
+
+    def __init__(
+            self,
+            cooccurrence_path,
+            temperature=1,
+            batch_size=100000,
+            num_bands=4,
+            proportional_fraction=0.1,
+            sampler='categorical',
+            device=None,
+            min_cooccurrence_count=None,
+            verbose=True,
+            num_workers=None,
+            ring_size=None,
+            coalesce=False,
+    ):
+        if not 0 <= proportional_fraction <= 1:
+            raise ValueError("proportional_fraction must be between 0 and 1.")
+        self.num_bands = num_bands
+        self.proportional_fraction = proportional_fraction
+        super(StratifiedSampleLoader, self).__init__(
+            cooccurrence_path, temperature=temperature, batch_size=batch_size,
+            sampler=sampler, device=device,
+            min_cooccurrence_count=min_cooccurrence_count, verbose=verbose,
+            num_workers=num_workers, ring_size=ring_size, coalesce=coalesce
+        )
+
+    def get_bands(self, probs):
+        """
+        Split the frequency-sorted ``probs`` into at most ``num_bands``
+        contiguous, non-empty bands of roughly equal probability.  Returns
+        the edges of the bands, starting at zero and ending at
+        ``len(probs)``.
+        """
+        cumulative = torch.cumsum(probs, 0)
+        targets = cumulative[-1] * (
+            torch.arange(1, self.num_bands, dtype=probs.dtype)
+            / self.num_bands
+        )
+        edges = (torch.searchsorted(cumulative, targets) + 1).clamp(
+            max=len(probs))
+        return torch.cat((
+            torch.tensor([0]), edges, torch.tensor([len(probs)]))).unique()
+
+    def _make_samplers(self):
+        Qi = torch.exp(self.log_Pi.to(torch.float64) / self.temperature)
+        Qj = torch.exp(self.log_Pj.to(torch.float64) / self.temperature)
+        Qi, Qj = Qi / Qi.sum(), Qj / Qj.sum()
+        self.row_edges = self.get_bands(Qi)
+        self.col_edges = self.get_bands(Qj)
+        num_rows, num_cols = len(self.row_edges) - 1, len(self.col_edges) - 1
+        row_bands = torch.repeat_interleave(
+            torch.arange(num_rows), self.row_edges[1:] - self.row_edges[:-1])
+        col_bands = torch.repeat_interleave(
+            torch.arange(num_cols), self.col_edges[1:] - self.col_edges[:-1])
+
+        # Probability of each stratum under the proposal, and the mean and
+        # spread of exp_pmi within it.  exp_pmi is zero off its stored pairs.
+        self.stratum_probs = torch.outer(
+            torch.zeros(num_rows, dtype=torch.float64).index_add_(
+                0, row_bands, Qi),
+            torch.zeros(num_cols, dtype=torch.float64).index_add_(
+                0, col_bands, Qj)
+        ).view(-1)
+        I = self.exp_pmi.keys // self.exp_pmi.shape[1]
+        J = self.exp_pmi.keys % self.exp_pmi.shape[1]
+        pair_probs = Qi[I] * Qj[J]
+        strata = row_bands[I] * num_cols + col_bands[J]
+        values = self.exp_pmi.values.to(torch.float64)
+        num_strata = num_rows * num_cols
+        mean = torch.zeros(num_strata, dtype=torch.float64).index_add_(
+            0, strata, pair_probs * values) / self.stratum_probs
+        mean_square = torch.zeros(num_strata, dtype=torch.float64).index_add_(
+            0, strata, pair_probs * values ** 2) / self.stratum_probs
+        self.stratum_stds = torch.sqrt((mean_square - mean ** 2).clamp(min=0))
+
+        shares = self.stratum_probs * self.stratum_stds
+        if shares.sum() > 0:
+            shares = (
+                (1 - self.proportional_fraction) * shares / shares.sum()
+                + self.proportional_fraction * self.stratum_probs
+            )
+        else:
+            shares = self.stratum_probs
+        self.stratum_shares = shares
+        if self.batch_size < len(shares):
+            raise ValueError(
+                "Every stratum needs a sample, but batches of {} samples "
+                "can't cover {} strata.".format(self.batch_size, len(shares)))
+
+        # Each band gets a sampler of its own, over the words in it.
+        self.I_samplers = [
+            h.sampler.get_sampler(
+                self.sampler, Qi[start:stop], device='cpu')
+            for start, stop in zip(self.row_edges[:-1], self.row_edges[1:])
+        ]
+        self.J_samplers = [
+            h.sampler.get_sampler(
+                self.sampler, Qj[start:stop], device='cpu')
+            for start, stop in zip(self.col_edges[:-1], self.col_edges[1:])
+        ]
+
+    def allocate(self, batch_size):
+        """
+        Work out how many of ``batch_size`` samples to draw from each
+        stratum: one each, and the rest according to the strata's shares,
+        rounded so that they add up to ``batch_size``.
+        """
+        num_strata = len(self.stratum_shares)
+        if batch_size < num_strata:
+            raise ValueError(
+                "Batches of {} samples can't cover {} strata.".format(
+                    batch_size, num_strata))
+        ideal = self.stratum_shares * (batch_size - num_strata)
+        counts = torch.floor(ideal).long()
+        shortfall = batch_size - num_strata - int(counts.sum())
+        counts[torch.argsort(ideal - counts, descending=True)[:shortfall]] += 1
+        return counts + 1
+
+    def sample(self, batch_size):
+        counts = self.allocate(batch_size)
+        num_cols = len(self.J_samplers)
+        strata = torch.repeat_interleave(torch.arange(len(counts)), counts)
+        weights = self.stratum_probs * batch_size / counts
+
+        # Samples are grouped by stratum, in order of row band, so the rows
+        # for each row band are contiguous.
+        IJ = torch.zeros((batch_size, 2), dtype=torch.int64)
+        IJ[:, 0] = torch.cat([
+            sampler.sample(sample_shape=(int(num_samples),)) + start
+            for sampler, num_samples, start in zip(
+                self.I_samplers, counts.view(-1, num_cols).sum(1),
+                self.row_edges
+            )
+        ])
+        sample_col_bands = strata % num_cols
+        for band, sampler in enumerate(self.J_samplers):
+            positions = torch.nonzero(sample_col_bands == band).view(-1)
+            IJ[positions, 1] = sampler.sample(
+                sample_shape=(len(positions),)) + self.col_edges[band]
+
+        exp_pmi = self.exp_pmi.lookup(IJ[:, 0], IJ[:, 1]).to(
+            dtype=torch.float32, device=self.sample_device)
+        return IJ, {
+            'exp_pmi': exp_pmi,
+            'weights': weights[strata].to(
+                dtype=torch.float32, device=self.sample_device),
+        }
+
+    def describe(self):
+        s = super(StratifiedSampleLoader, self).describe()
+        s += '\tnum_bands = {}\n'.format(self.num_bands)
+        s += '\tproportional_fraction = {}\n'.format(
+            self.proportional_fraction)
         return s
 
 
@@ -100,17 +100,114 @@ class MLELoss(TemperedLoss):
         return - (term1 - term2), pxx_independent
 
 
+### Losses that only touch the nonzero cooccurrence counts.
+def nonzero_counts(Nxx):
+    """
+    Get the row indices, column indices, and values of the nonzero counts in
+    ``Nxx``, which may be a sparse COO tensor (as served by
+    ``DenseLoader(sparse=True, densify=False)``) or a dense tensor.
+    """
+    if Nxx.is_sparse:
+        Nxx = Nxx.coalesce()
+        I, J = Nxx.indices()
+        return I, J, Nxx.values()
+    I, J = torch.nonzero(Nxx, as_tuple=True)
+    return I, J, Nxx[I, J]
+
+
+class SparseGloveLoss(GloveLoss):
+    """
+    GloVe loss for a sparse ``Nxx``.  Cells where ``Nxx`` is zero have zero
+    weight, so the loss is calculated only at the nonzero counts.  Agrees
+    with ``GloveLoss``.
+    """
+    def forward(self, response, batch_data):
+        cooccurrence_data, unigram_data = batch_data
+        Nxx, Nx, Nxt, N = cooccurrence_data
+        I, J, Nxx_values = nonzero_counts(Nxx)
+        weights = torch.clamp((Nxx_values / self.X_max).pow(self.alpha), max=1.)
+        deviations = response[I, J] - torch.log(Nxx_values)
+        return torch.sum(weights * deviations ** 2)
+
+
+class SparseSGNSLoss(SGNSLoss):
+    """
+    SGNS loss for a sparse ``Nxx``.  The negative samples are split into a
+    part that depends only on the marginals, which is calculated densely,
+    and a correction at the nonzero counts, as are the positive samples.
+    Agrees with ``SGNSLoss``.
+    """
+    def forward(self, response, batch_data):
+        cooccurrence_data, unigram_data = batch_data
+        Nxx, Nx, Nxt, N = cooccurrence_data
+        uNx, uNxt, uN = unigram_data
+        I, J, Nxx_values = nonzero_counts(Nxx)
+        unigram_probs = uNxt / uN
+        logfactor = torch.log(torch.exp(response) + 1)
+        independent_term = torch.sum(self.k * Nx * unigram_probs * logfactor)
+        nonzero_logfactor = logfactor[I, J]
+        nonzero_term = Nxx_values * (
+            nonzero_logfactor - response[I, J]
+            - self.k * unigram_probs[0, J] * nonzero_logfactor
+        )
+        return independent_term + torch.sum(nonzero_term)
+
+
+class SparseMLELoss(MLELoss):
+    """
+    MLE loss for a sparse ``Nxx``.  The term for the model distribution
+    depends only on the marginals, and is calculated densely, while the term
+    for the data distribution is calculated only at the nonzero counts.
+    Agrees with ``MLELoss``.
+    """
+    def forward(self, response, batch_data):
+        cooccurrence_data, unigram_data = batch_data
+        Nxx, Nx, Nxt, N = cooccurrence_data
+        I, J, Nxx_values = nonzero_counts(Nxx)
+        pxx_independent = self.get_pxx_independent(batch_data)
+        model_term = pxx_independent * torch.exp(response)
+        data_term = Nxx_values / N * response[I, J]
+        if self.temperature != 1:
+            exponent = 1 / self.temperature - 1
+            model_term = model_term * pxx_independent ** exponent
+            data_term = data_term * (
+                (Nx[I, 0] / N) * (Nxt[0, J] / N)) ** exponent
+        return torch.sum(model_term) - torch.sum(data_term)
+
+
 class SampleMLELoss(nn.Module):
     def forward(self, response, batch_data):
         boundary = int(response.shape[0] / 2)
-        term1 = response[:boundary].sum()
-        term2 = torch.exp(response[boundary:]).sum()
-        return - (term1 - term2) / float(boundary)
+        num_samples = boundary
+        # Coalesced batches hold each distinct pair once, with its count.
+        counts = None
+        if batch_data is not None and 'counts' in batch_data:
+            boundary = batch_data['boundary']
+            num_samples = batch_data['num_samples']
+            counts = batch_data['counts']
+        positive_response = response[:boundary]
+        negative_response = torch.exp(response[boundary:])
+        # Positives taken without replacement carry importance weights.
+        if batch_data is not None and 'positive_weights' in batch_data:
+            positive_response = positive_response * batch_data[
+                'positive_weights']
+        if counts is not None:
+            positive_response = positive_response * counts[:boundary]
+            negative_response = negative_response * counts[boundary:]
+        term1 = positive_response.sum()
+        term2 = negative_response.sum()
+        return - (term1 - term2) / float(num_samples)
 
 
 class BalancedSampleMLELoss(nn.Module):
     def forward(self, response, batch_data):
         deviations = torch.exp(response) - batch_data['exp_pmi'] * response
+        # Stratified samples carry weights for their strata.
+        if 'weights' in batch_data:
+            deviations = deviations * batch_data['weights']
+        if 'counts' in batch_data:
+            deviations = deviations * batch_data['counts']
+            return deviations.sum() / batch_data['num_samples']
         return deviations.sum() / response.shape[0]
 
 
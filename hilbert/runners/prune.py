@@ -0,0 +1,61 @@
+import os
+import argparse
+import hilbert as h
+
+
+def absolutize_paths(args):
+    if h.CONSTANTS.RC['cooccurrence_dir'] is not None:
+        for key in ('in_path', 'out_path'):
+            args[key] = os.path.join(
+                h.CONSTANTS.RC['cooccurrence_dir'], args[key])
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=(
+        "Writes a pruned copy of cooccurrence statistics, with marginals "
+        "recalculated to match the pruned counts."
+    ))
+    parser.add_argument(
+        '--in-dir', '-i', required=True, dest='in_path',
+        help=(
+            "Name of directory holding the cooccurrence data to be pruned.  "
+            "If you have specified a ``cooccurrence_dir`` in your "
+            "~/.hilbertrc, then relative paths will be interpreted relative "
+            "to it.  Use an absolute path to override."
+        )
+    )
+    parser.add_argument(
+        '--out-dir', '-o', required=True, dest='out_path',
+        help=(
+            "Name of directory in which to store the pruned cooccurrence "
+            "data.  It will be created if it does not exist."
+        )
+    )
+    parser.add_argument(
+        '--min-count', '-m', type=float, default=None, dest='min_count',
+        help="Drop cooccurrence counts less than or equal to MIN_COUNT."
+    )
+    parser.add_argument(
+        '--top-k', '-k', type=int, default=None, dest='top_k',
+        help="Keep only the TOP_K largest counts for each word."
+    )
+    parser.add_argument(
+        '--pmi', type=float, default=None, dest='pmi_threshold',
+        help="Drop counts whose PMI is less than or equal to PMI."
+    )
+    parser.add_argument(
+        '--mass', type=float, default=None,
+        help=(
+            "Keep only the largest counts that together make up at least "
+            "this fraction of the total count."
+        )
+    )
+    parser.add_argument(
+        '--quiet', '-q', dest='verbose', default=True, action='store_false',
+        help="Don't print to stdout during execution."
+    )
+
+    args = vars(parser.parse_args())
+    absolutize_paths(args)
+    h.cooccurrence.pruning.prune_store(**args)
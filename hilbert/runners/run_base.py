@@ -1,4 +1,6 @@
 import os
+import threading
+import torch
 import hilbert as h
 from hilbert.tracer import tracer
 from argparse import ArgumentParser
@@ -8,16 +10,138 @@ from argparse import ArgumentParser
 def factory_args(args):
     ignore = {
         'save_embeddings_dir', 'num_writes',
-        'monitor_closely', 'debug'
+        'monitor_closely', 'debug', 'checkpoint', 'resume'
     }
 
     return {key:args[key] for key in args if key not in ignore}
 
 
+class BackgroundWriter:
+    """
+    Writes the solver's embeddings (and optionally a checkpoint) to disk on a
+    background thread, so that training can continue while the previous
+    write is being serialized.  The embeddings, and the tensors of the full
+    training state (the learner's parameters, the optimizer's state, and so
+    on), are snapshotted into CPU buffers that are allocated once (pinned,
+    when training on the GPU) and reused for every write.  Copies from the
+    GPU are made asynchronously, so the training thread only queues them.
+    At most one write is in flight at a time, and any error raised while
+    writing is re-raised on the next call to ``write`` or ``wait``.
+    """
+
+    def __init__(self, solver):
+        self.solver = solver
+        self.buffers = None
+        self.state_buffers = []
+        self.thread = None
+        self.error = None
+
+    @staticmethod
+    def _copy_into(buffer, tensor):
+        """
+        Copy ``tensor`` into ``buffer``, first making a new buffer if there
+        is none, or if it doesn't fit.  Returns the buffer.
+        """
+        tensor = tensor.detach()
+        if (
+            buffer is None or buffer.shape != tensor.shape
+            or buffer.dtype != tensor.dtype
+        ):
+            buffer = torch.empty(
+                tensor.shape, dtype=tensor.dtype,
+                pin_memory=tensor.is_cuda and torch.cuda.is_available()
+            )
+        buffer.copy_(tensor, non_blocking=tensor.is_cuda)
+        return buffer
+
+    def snapshot(self):
+        """Copy the embedding parameters into the reusable CPU buffers."""
+        params = self.solver.learner.get_embedding_params()
+        if self.buffers is None:
+            self.buffers = [None] * len(params)
+        self.buffers = [
+            None if param is None else self._copy_into(buffer, param)
+            for buffer, param in zip(self.buffers, params)
+        ]
+        return self.buffers
+
+    def snapshot_state(self):
+        """
+        Copy the tensors of the solver's training state into the reusable
+        CPU buffers.  Tensors are matched to buffers in the order they are
+        found, which is the same from one write to the next.  Returns the
+        state, with the buffers in place of the live tensors.
+        """
+        position = 0
+        def snapshot(value):
+            nonlocal position
+            if isinstance(value, torch.Tensor):
+                if position == len(self.state_buffers):
+                    self.state_buffers.append(None)
+                self.state_buffers[position] = self._copy_into(
+                    self.state_buffers[position], value)
+                position += 1
+                return self.state_buffers[position - 1]
+            if isinstance(value, dict):
+                return {key: snapshot(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple)):
+                return type(value)(snapshot(item) for item in value)
+            return value
+        return snapshot(self.solver.state_dict())
+
+    def write(self, save_path, checkpoint_path=None, **extra):
+        """
+        Snapshot the solver, then write its embeddings to ``save_path`` and,
+        if given, its full training state to ``checkpoint_path`` in the
+        background.  Blocks only until the previous write has finished.
+        """
+        self.wait()
+        params = self.snapshot()
+        state = None
+        if checkpoint_path is not None:
+            state = self.snapshot_state()
+        copied = None
+        if torch.cuda.is_available():
+            copied = torch.cuda.Event()
+            copied.record()
+        self.thread = threading.Thread(
+            target=self._write,
+            args=(params, save_path, state, checkpoint_path, copied, extra),
+            daemon=True
+        )
+        self.thread.start()
+
+    def _write(self, params, save_path, state, checkpoint_path, copied, extra):
+        try:
+            # Wait for the asynchronous copies into the buffers to land.
+            if copied is not None:
+                copied.synchronize()
+            h.embeddings.Embeddings(
+                *params, dictionary=self.solver.dictionary, device='cpu',
+                verbose=False, copy=False
+            ).save(save_path)
+            # The checkpoint is written last, so it never refers to
+            # embeddings that aren't on disk yet.
+            if state is not None:
+                h.solver.save_checkpoint(checkpoint_path, state, **extra)
+        except BaseException as e:
+            self.error = e
+
+    def wait(self):
+        """Block until the write in flight (if any) has finished."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
 def run(solver_factory, **args):
     """
     Use run the solver for many updates, and periodically write the model 
-    parameters to disk.
+    parameters to disk.  Unless disabled, a checkpoint of the full training
+    state is also kept, from which an interrupted run can be resumed.
     """
     # Do some unpacking
     monitor_closely = args['monitor_closely']
@@ -25,13 +149,16 @@ def run(solver_factory, **args):
     num_updates = args['num_updates']
     save_dir = args['save_embeddings_dir']
     verbose = args['verbose']
+    checkpoint = args.get('checkpoint', True)
+    resume = args.get('resume', False)
+    checkpoint_path = os.path.join(save_dir, 'checkpoint')
 
     # Make sure the output dir exists.
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
 
     # Make the tracer (which helps us print / log), and generate a preamble.
-    tracer.open(os.path.join(save_dir, 'trace.txt'))
+    tracer.open(os.path.join(save_dir, 'trace.txt'), 'a' if resume else 'w')
     tracer.verbose = verbose
 
     # Make a little preamble in the trace.  Todays date, and the exact
@@ -49,17 +176,44 @@ def run(solver_factory, **args):
     if args['debug']:
         import pdb; pdb.set_trace()
 
-    # Train train train!  Write to disk once in awhile!
+    # Pick up where an interrupted run left off, if desired.
     updates_per_write = int(num_updates / num_writes)
-    for write_num in range(num_writes):
+    start_write = 0
+    if resume and os.path.exists(checkpoint_path):
+        extra = solver.load_checkpoint(checkpoint_path)
+        if extra['updates_per_write'] != updates_per_write:
+            raise ValueError(
+                "Checkpoint was made with {} updates per write, but this run "
+                "has {}.".format(extra['updates_per_write'], updates_per_write)
+            )
+        start_write = extra['num_writes']
+        tracer.declare('resumed_from_write', start_write)
+
+    # Train train train!  Write to disk once in awhile!  Writing happens in
+    # the background, while the next cycle runs.
+    writer = BackgroundWriter(solver)
+    try:
+        for write_num in range(start_write, num_writes):
+            try:
+                solver.cycle(updates_per_write, monitor_closely)
+            except h.exceptions.DivergenceError:
+                tracer.declare(key='wrote_num', value=write_num+1)
+                raise h.exceptions.DivergenceError("Model has diverged")
+            num_updates = updates_per_write * (write_num+1)
+            save_path = os.path.join(save_dir, '{}'.format(num_updates))
+            writer.write(
+                save_path, checkpoint_path if checkpoint else None,
+                num_writes=write_num+1, updates_per_write=updates_per_write
+            )
+    except BaseException:
+        # Let the last write finish, but don't let its failure hide the
+        # error that stopped training.
         try:
-            solver.cycle(updates_per_write, monitor_closely)
-        except h.exceptions.DivergenceError:
-            tracer.declare(key='wrote_num', value=write_num+1)
-            raise h.exceptions.DivergenceError("Model has diverged")
-        num_updates = updates_per_write * (write_num+1)
-        save_path = os.path.join(save_dir, '{}'.format(num_updates))
-        solver.get_embeddings().save(save_path)
+            writer.wait()
+        except Exception:
+            pass
+        raise
+    writer.wait()
 
     tracer.today()
 
@@ -139,6 +293,103 @@ def add_gibbs_arg(parser):
         )
     )
 
+
+def add_sampler_arg(parser):
+    parser.add_argument(
+        '--sampler', choices=sorted(h.sampler.SAMPLERS),
+        default='categorical',
+        help=(
+            "Sampler used to draw samples.  The alias sampler draws from a "
+            "packed alias table, and is faster for large vocabularies."
+        )
+    )
+
+
+def add_sample_workers_args(parser):
+    parser.add_argument(
+        '--num-workers', type=int, default=None, dest='num_workers',
+        help="Draw samples ahead of time using this many processes."
+    )
+    parser.add_argument(
+        '--ring-size', type=int, default=None, dest='ring_size',
+        help=(
+            "Number of batches that the sampling processes may keep ready.  "
+            "Defaults to twice the number of processes."
+        )
+    )
+
+
+def add_table_dir_arg(parser):
+    parser.add_argument(
+        '--table-dir', default=None, dest='table_dir',
+        help=(
+            "Memory-map precomputed sampling tables from this directory, "
+            "building and saving them there first if they are missing.  "
+            "See ``python -m hilbert.runners.sampling_tables``."
+        )
+    )
+
+
+def add_temperature_schedule_arg(parser):
+    parser.add_argument(
+        '--temperature-schedule', type=float, nargs='+', default=None,
+        dest='temperature_schedule',
+        help=(
+            "Temperatures to anneal to during training, applied in turn at "
+            "the matching --temperature-milestones."
+        )
+    )
+    parser.add_argument(
+        '--temperature-milestones', type=int, nargs='+', default=None,
+        dest='temperature_milestones',
+        help="Numbers of updates after which to apply each temperature."
+    )
+
+
+def add_max_sectors_arg(parser):
+    parser.add_argument(
+        '--max-sectors', type=int, default=None, dest='max_sectors',
+        help=(
+            "Stream cooccurrence sectors from disk while sampling, keeping "
+            "at most MAX_SECTORS of them in memory.  Use this when the "
+            "cooccurrence data doesn't fit in memory."
+        )
+    )
+
+
+def add_without_replacement_arg(parser):
+    parser.add_argument(
+        '--without-replacement', action='store_true', default=False,
+        dest='without_replacement',
+        help=(
+            "Visit every nonzero pair once per epoch, in shuffled order, "
+            "weighting each by its probability, instead of drawing positive "
+            "samples with replacement."
+        )
+    )
+
+
+def add_coalesce_arg(parser):
+    parser.add_argument(
+        '--coalesce', action='store_true', default=False, dest='coalesce',
+        help=(
+            "Merge repeated pairs within each batch, weighting each distinct "
+            "pair by how often it was drawn, so that it is only computed once."
+        )
+    )
+
+
+def add_num_bands_arg(parser):
+    parser.add_argument(
+        '--num-bands', type=int, default=None, dest='num_bands',
+        help=(
+            "With --balanced, split the vocabulary into NUM_BANDS frequency "
+            "bands, and draw a fixed share of each batch from every pair of "
+            "bands, to reduce the variance of the loss."
+        )
+    )
+
+
 def add_num_senses_arg(parser):
     parser.add_argument(
         '--num_senses', '-K', type=int, required=True,
@@ -164,6 +415,81 @@ def add_shard_factor_arg(parser):
         help="Divide sectors by shard_factor**2 to make it fit on GPU."
     )
 
+def add_shard_cache_arg(parser):
+    parser.add_argument(
+        '--shard-cache', default=None, dest='cache_dir',
+        help=(
+            "Directory in which to cache preprocessed shards, so that later "
+            "runs with the same data and preprocessing start quickly."
+        )
+    )
+
+def add_sparse_shards_arg(parser):
+    parser.add_argument(
+        '--sparse-shards', action='store_true', default=False, dest='sparse',
+        help=(
+            "Hold cooccurrence shards as sparse tensors, densifying them on "
+            "the device as they are used.  Saves memory and transfer time "
+            "when the cooccurrence matrix is sparse."
+        )
+    )
+
+def add_sparse_loss_arg(parser):
+    parser.add_argument(
+        '--sparse-loss', action='store_true', default=False,
+        dest='sparse_loss',
+        help=(
+            "Serve cooccurrence shards as sparse tensors, and calculate the "
+            "loss terms involving counts only at the nonzero counts."
+        )
+    )
+
+def add_buffer_size_arg(parser):
+    parser.add_argument(
+        '--buffer-size', type=int, default=None, dest='buffer_size',
+        help=(
+            "Stream shards from disk during training, keeping at most "
+            "BUFFER_SIZE shards ready, instead of preloading all of them.  "
+            "Use this when the cooccurrence data doesn't fit in memory."
+        )
+    )
+
+def add_prefetch_args(parser):
+    parser.add_argument(
+        '--pin-memory', action='store_true', default=False,
+        dest='pin_memory',
+        help=(
+            "Keep shards in page-locked memory, so that they can be copied "
+            "to the GPU asynchronously.  Shards from a shared store are not "
+            "pinned, since that would copy them into each process."
+        )
+    )
+    parser.add_argument(
+        '--prefetch-depth', type=int, default=0, dest='prefetch_depth',
+        help=(
+            "Start copying this many shards to the GPU ahead of the one "
+            "being trained on."
+        )
+    )
+
+def add_num_workers_arg(parser):
+    parser.add_argument(
+        '--num-workers', type=int, default=None, dest='num_workers',
+        help="Preprocess sectors using this many processes when preloading."
+    )
+
+def add_shared_store_arg(parser):
+    parser.add_argument(
+        '--shared-store', nargs='?', default=None, const=h.cache.SHARED_DIR,
+        dest='shared_dir',
+        help=(
+            "Share preloaded shards with other runs on this machine using the "
+            "same data and preprocessing, through a store in shared memory.  "
+            "Optionally give the store's directory (default {}).".format(
+                h.cache.SHARED_DIR)
+        )
+    )
+
 def add_remove_cooc_arg(parser):
     parser.add_argument(
         '--remove-threshold', '-thres', type=int, default=10, 
@@ -286,6 +612,20 @@ def get_argparser(**kwargs):
         '--debug', '-D', action='store_true',
         help="After making the solver, go into interactive debugger"
     )
+    parser.add_argument(
+        '--no-checkpoint', action='store_false', dest='checkpoint',
+        help=(
+            "Don't keep a checkpoint of the full training state (optimizer, "
+            "schedulers, random state) alongside the embeddings."
+        )
+    )
+    parser.add_argument(
+        '--resume', action='store_true',
+        help=(
+            "Resume training from the checkpoint in the output directory, "
+            "if there is one."
+        )
+    )
 
     # MOVED FROM COMMON CONSTRUCTOR ARGS
 
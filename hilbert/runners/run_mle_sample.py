@@ -4,9 +4,17 @@ import hilbert as h
 def add_model_args(parser):
     #h.runners.run_base.add_common_constructor_args(parser)
     h.runners.run_base.add_temperature_arg(parser)
+    h.runners.run_base.add_temperature_schedule_arg(parser)
     h.runners.run_base.add_batch_size_arg(parser)
     h.runners.run_base.add_balanced_arg(parser)
     h.runners.run_base.add_gibbs_arg(parser)
+    h.runners.run_base.add_sampler_arg(parser)
+    h.runners.run_base.add_sample_workers_args(parser)
+    h.runners.run_base.add_table_dir_arg(parser)
+    h.runners.run_base.add_max_sectors_arg(parser)
+    h.runners.run_base.add_without_replacement_arg(parser)
+    h.runners.run_base.add_coalesce_arg(parser)
+    h.runners.run_base.add_num_bands_arg(parser)
     h.runners.run_base.add_bias_arg(parser)
     h.runners.run_base.add_remove_cooc_arg(parser)
     h.runners.run_base.add_LR_scheduler_arg(parser)
@@ -5,6 +5,13 @@ def add_model_args(parser):
     #h.runners.run_base.add_common_constructor_args(parser)
     h.runners.run_base.add_bias_arg(parser)
     h.runners.run_base.add_shard_factor_arg(parser)
+    h.runners.run_base.add_shard_cache_arg(parser)
+    h.runners.run_base.add_sparse_shards_arg(parser)
+    h.runners.run_base.add_sparse_loss_arg(parser)
+    h.runners.run_base.add_buffer_size_arg(parser)
+    h.runners.run_base.add_prefetch_args(parser)
+    h.runners.run_base.add_num_workers_arg(parser)
+    h.runners.run_base.add_shared_store_arg(parser)
     parser.add_argument(
         '--undersampling', '-t', type=float, default=2.45e-5,
         dest='undersampling',
@@ -0,0 +1,44 @@
+import os
+import argparse
+import hilbert as h
+
+
+def absolutize_paths(args):
+    if h.CONSTANTS.RC['cooccurrence_dir'] is not None:
+        args['cooccurrence_path'] = os.path.join(
+            h.CONSTANTS.RC['cooccurrence_dir'], args['cooccurrence_path'])
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=(
+        "Precomputes the sampling tables used by sample-based loaders for a "
+        "cooccurrence store, temperature, and count threshold, so that "
+        "loaders given the same --table-dir can memory-map them."
+    ))
+    parser.add_argument(
+        '--corpus-stats-path', '-c', required=True, dest='cooccurrence_path',
+        help=(
+            "Name of directory holding the cooccurrence data.  If you have "
+            "specified a ``cooccurrence_dir`` in your ~/.hilbertrc, then "
+            "relative paths will be interpreted relative to it.  Use an "
+            "absolute path to override."
+        )
+    )
+    parser.add_argument(
+        '--table-dir', '-o', required=True, dest='table_dir',
+        help=(
+            "Directory in which to keep the sampling tables.  It will be "
+            "created if it does not exist."
+        )
+    )
+    h.runners.run_base.add_temperature_arg(parser)
+    h.runners.run_base.add_remove_cooc_arg(parser)
+    parser.add_argument(
+        '--quiet', '-q', dest='verbose', default=True, action='store_false',
+        help="Don't print to stdout during execution."
+    )
+
+    args = vars(parser.parse_args())
+    absolutize_paths(args)
+    h.sampler.SamplingTables.get(**args)
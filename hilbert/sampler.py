@@ -0,0 +1,554 @@
+import os
+import time
+import shutil
+import weakref
+import argparse
+import tempfile
+
+import numpy as np
+import torch
+from scipy import sparse
+from pytorch_categorical import Categorical
+
+import hilbert as h
+
+
+# Alias tables are packed into int64s, with the probability of keeping each
+# column in fixed point, scaled by ``PROB_SCALE``, above the 32 alias bits.
+PROB_SCALE = 2 ** 30
+ALIAS_MASK = 2 ** 32 - 1
+
+
+class AliasSampler:
+    """
+    Draws samples from the categorical distribution proportional to
+    ``probs`` using Walker's alias method.  Each outcome ``c`` gets a column
+    holding the probability ``prob[c]`` of keeping ``c`` and an ``alias[c]``
+    to use otherwise, so a whole batch is drawn with one random column and
+    one random number per sample, regardless of the number of outcomes.
+
+    The table is built in a single vectorized pass.  Outcomes whose scaled
+    probability falls short of one ("small" outcomes) are served, in order,
+    by those exceeding it ("large" outcomes), and each large outcome becomes
+    short itself once it has given away its surplus.  Which large outcome
+    serves which column follows from comparing cumulative sums of the
+    deficits and surpluses, found with ``searchsorted`` rather than by
+    repeatedly pairing outcomes up.  Sums are accumulated in float64 so that
+    tables over tens of millions of outcomes stay accurate.
+
+    Each column is packed into a single int64, so a draw reads just one
+    entry of the table, which matters once the table is far larger than the
+    CPU caches.  Samplers can be written with ``save`` and read back with
+    ``load``, so the table only needs to be built once per distribution.
+    """
+
+    def __init__(self, probs, device=None, table=None):
+        self.device = h.utils.get_device(device)
+        if table is None:
+            table = self.pack(*self.build_table(probs))
+        self.table = table.to(self.device, dtype=torch.int64)
+
+    def __len__(self):
+        return self.table.shape[0]
+
+    @property
+    def prob(self):
+        return (self.table >> 32).to(torch.float64) / PROB_SCALE
+
+    @property
+    def alias(self):
+        return self.table & ALIAS_MASK
+
+    @staticmethod
+    def pack(prob, alias):
+        """
+        Pack each column of the table into a single int64, holding
+        ``prob`` in fixed point in the high bits and ``alias`` in the low 32
+        bits, so that drawing a sample reads one entry rather than two.
+        """
+        if len(prob) > ALIAS_MASK:
+            raise ValueError(
+                "Alias tables hold at most {} outcomes.  Got {}.".format(
+                    ALIAS_MASK, len(prob)))
+        fixed = torch.round(prob.to(torch.float64) * PROB_SCALE).long()
+        return (fixed << 32) | alias.long()
+
+    @staticmethod
+    def build_table(probs):
+        """
+        Build the alias table for a 1D tensor (or numpy array) of
+        non-negative ``probs``, which need not be normalized.  Returns the
+        tensors ``prob`` and ``alias``.
+        """
+        probs = torch.as_tensor(probs)
+        if probs.dim() != 1:
+            raise ValueError(
+                "``probs`` should be 1D.  Got shape {}.".format(
+                    tuple(probs.shape)))
+        if probs.shape[0] == 0:
+            raise ValueError("``probs`` should not be empty.")
+        if (probs < 0).any():
+            raise ValueError("``probs`` should be non-negative.")
+        total = probs.sum(dtype=torch.float64)
+        if total <= 0:
+            raise ValueError("``probs`` should not sum to zero.")
+
+        device = probs.device
+        num_outcomes = probs.shape[0]
+        scaled = probs.to(torch.float64) * (num_outcomes / total)
+        prob = scaled.clone()
+        alias = torch.arange(num_outcomes, device=device)
+
+        is_small = scaled < 1
+        smalls = is_small.nonzero().view(-1)
+        larges = (~is_small).nonzero().view(-1)
+        if len(larges) == 0 or len(smalls) == 0:
+            prob.fill_(1)
+            return prob, alias
+
+        deficits = torch.cumsum(1 - scaled[smalls], 0)
+        surpluses = torch.cumsum(scaled[larges] - 1, 0)
+
+        # Each small outcome is served by the first large outcome that has
+        # not run short before the small outcome's turn.
+        served_before = torch.cat((deficits.new_zeros(1), deficits[:-1]))
+        server = torch.searchsorted(surpluses, served_before)
+        server.clamp_(max=len(larges) - 1)
+        alias[smalls] = larges[server]
+
+        # A large outcome runs short while serving the first small outcome
+        # that takes the cumulative deficit beyond its cumulative surplus.
+        # What it has left is kept, and the rest is taken from the next large
+        # outcome.  The last one (up to rounding) never runs short.
+        short_at = torch.searchsorted(deficits, surpluses, right=True)
+        runs_short = short_at < len(smalls)
+        runs_short[-1] = False
+        prob[larges] = torch.where(
+            runs_short,
+            1 + surpluses - deficits[short_at.clamp(max=len(smalls) - 1)],
+            torch.ones_like(surpluses)
+        )
+        next_large = torch.arange(1, len(larges) + 1, device=device)
+        next_large[-1] = len(larges) - 1
+        alias[larges] = larges[next_large]
+
+        prob.clamp_(0, 1)
+        return prob, alias
+
+    def sample(self, sample_shape=(1,)):
+        """Draw a tensor of outcomes of shape ``sample_shape``."""
+        columns = torch.randint(
+            len(self), sample_shape, device=self.device, dtype=torch.int64)
+        entries = self.table[columns]
+        keep = torch.randint(
+            PROB_SCALE, sample_shape, device=self.device, dtype=torch.int64
+        ) < (entries >> 32)
+        return torch.where(keep, columns, entries & ALIAS_MASK)
+
+    def save(self, path):
+        """
+        Save the alias table to disk.  A new directory will be created at
+        ``path``, holding the packed table as a ``.npy`` file.
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, 'table.npy'), self.table.cpu().numpy())
+
+    @staticmethod
+    def load(path, device=None):
+        """Load an alias table previously saved in the directory at ``path``."""
+        table = torch.from_numpy(np.load(os.path.join(path, 'table.npy')))
+        return AliasSampler(None, device=device, table=table)
+
+
+class SamplingTables:
+    """
+    Everything a sample loader derives from a cooccurrence store before it
+    can start drawing samples, for a given ``temperature`` and
+    ``min_cooccurrence_count``: the COO pair arrays ``I`` and ``J`` with the
+    counts ``Nxx_data``, the marginals ``Nx`` and ``Nxt``, the tempered
+    scores ``Nxx_tempered``, ``Pi_tempered`` and ``Pj_tempered``, and packed
+    alias tables over each of the tempered scores.
+
+    Tables can be written to disk with ``save`` and memory-mapped with
+    ``load``, so that loaders start without reading and tempering the
+    cooccurrence data, or building alias tables.  ``get`` does this
+    through a directory of entries keyed like a ``ShardCache``.
+    """
+
+    # The tempered distributions that samples are drawn from.
+    DISTRIBUTIONS = ('Nxx_tempered', 'Pi_tempered', 'Pj_tempered')
+
+    def __init__(self, tensors):
+        self.tensors = tensors
+        self.logs = None
+
+    def __getitem__(self, name):
+        return self.tensors[name]
+
+    @staticmethod
+    def build(
+            cooccurrence_path, temperature, min_cooccurrence_count=None,
+            verbose=True
+    ):
+        """
+        Read the cooccurrence store at ``cooccurrence_path`` and temper its
+        distributions.  Alias tables are built when first needed.
+        """
+        Nxx_data, I, J, Nx, Nxt = h.cooccurrence.CooccurrenceSector.load_coo(
+            cooccurrence_path, min_cooccurrence_count=min_cooccurrence_count,
+            verbose=verbose)
+        tables = SamplingTables({
+            'Nxx_data': Nxx_data, 'I': I, 'J': J, 'Nx': Nx, 'Nxt': Nxt})
+        tables.temper(temperature)
+        return tables
+
+    def temper(self, temperature):
+        """
+        Calculate the tempered distributions for ``temperature``, replacing
+        any calculated before.  The logs of the counts and marginals are kept
+        after the first call, so retempering is a single vectorized pass.
+        """
+        # After tempering, probabilities are scores -- they don't sum to one.
+        # The samplers will automatically normalize them.
+        if self.logs is None:
+            Nx, Nxt = self['Nx'], self['Nxt']
+            log_Pi = torch.log(Nx.view((-1,)) / Nx.sum())
+            log_Pj = torch.log(Nxt.view((-1,)) / Nx.sum())
+            self.logs = {
+                'Pi': log_Pi,
+                'Pj': log_Pj,
+                'Nxx': torch.log(self['Nxx_data']),
+                'PiPj': log_Pi[self['I'].long()] + log_Pj[self['J'].long()],
+            }
+        exponent = 1 / temperature
+        self.tensors['Pi_tempered'] = torch.exp(self.logs['Pi'] * exponent)
+        self.tensors['Pj_tempered'] = torch.exp(self.logs['Pj'] * exponent)
+        self.tensors['Nxx_tempered'] = torch.exp(
+            self.logs['Nxx'] + self.logs['PiPj'] * (exponent - 1))
+        for name in self.DISTRIBUTIONS:
+            self.tensors.pop('{}_alias'.format(name), None)
+
+    def alias_table(self, name):
+        """Get the packed alias table over the tempered distribution ``name``."""
+        key = '{}_alias'.format(name)
+        if key not in self.tensors:
+            self.tensors[key] = AliasSampler.pack(
+                *AliasSampler.build_table(self[name]))
+        return self.tensors[key]
+
+    def get_sampler(self, sampler, name, device=None):
+        """
+        Make a sampler of the kind named by ``sampler`` over the tempered
+        distribution ``name``, reusing its alias table if there is one.
+        """
+        if sampler == 'alias':
+            return AliasSampler(
+                None, device=device, table=self.alias_table(name))
+        return get_sampler(sampler, self[name], device=device)
+
+    def save(self, path):
+        """
+        Save all of the tables, including the alias tables, to disk.  A new
+        directory will be created at ``path``, holding a ``.npy`` file for
+        each table.
+        """
+        for name in self.DISTRIBUTIONS:
+            self.alias_table(name)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for name, tensor in self.tensors.items():
+            np.save(
+                os.path.join(path, '{}.npy'.format(name)),
+                tensor.cpu().numpy()
+            )
+
+    @staticmethod
+    def load(path, mmap=True):
+        """
+        Load the tables previously saved in the directory at ``path``.
+        Unless ``mmap`` is ``False``, the tensors are backed by copy-on-write
+        memory maps of the saved files.
+        """
+        mmap_mode = 'c' if mmap else None
+        return SamplingTables({
+            fname[:-len('.npy')]: torch.from_numpy(
+                np.load(os.path.join(path, fname), mmap_mode=mmap_mode))
+            for fname in os.listdir(path) if fname.endswith('.npy')
+        })
+
+    @staticmethod
+    def get(
+            cooccurrence_path, temperature, min_cooccurrence_count=None,
+            table_dir=None, verbose=True
+    ):
+        """
+        Get the tables for the given cooccurrence store and options.  If
+        ``table_dir`` is ``None``, they are built in memory.  Otherwise they
+        are memory-mapped from ``table_dir``, after building and saving them
+        there first if needed.  Entries there are keyed by hashing the store
+        together with the options, as in ``h.cache.ShardCache``, so they are
+        never reused once the store has changed.
+        """
+        if table_dir is None:
+            return SamplingTables.build(
+                cooccurrence_path, temperature, min_cooccurrence_count,
+                verbose=verbose
+            )
+        cache = h.cache.ShardCache(table_dir)
+        key = cache.key(
+            cooccurrence_path, tables='sampling',
+            temperature=float(temperature),
+            min_cooccurrence_count=min_cooccurrence_count
+        )
+        path = cache.path(key)
+        with cache.lock(key):
+            if not os.path.exists(path):
+                if verbose:
+                    print('Building sampling tables in {}'.format(path))
+                tables = SamplingTables.build(
+                    cooccurrence_path, temperature, min_cooccurrence_count,
+                    verbose=verbose
+                )
+                # Write the entry in full before moving it into place.
+                temp_path = '{}.tmp-{}'.format(path, os.getpid())
+                if os.path.exists(temp_path):
+                    shutil.rmtree(temp_path)
+                tables.save(temp_path)
+                os.rename(temp_path, path)
+        return SamplingTables.load(path)
+
+
+class SectorTables:
+    """
+    The nonzero counts of a sectorized cooccurrence store, as needed by
+    ``SectorSampleLoader``: the pair arrays ``I`` and ``J``, the logs of the
+    counts ``log_Nxx``, and the logs of the products of the pairs' marginal
+    probabilities ``log_PiPj``.  The pairs of each sector are contiguous,
+    starting at ``offsets[k]`` for sector ``k``.
+
+    The arrays are written once, sector by sector, into flat files, and
+    memory-mapped from there, so they needn't fit in memory.  Tempering
+    only needs the logs, so the tempered mass of every sector can be found
+    in one vectorized pass over the mapped arrays, without reading the
+    sectors' files again.
+    """
+
+    ARRAYS = {
+        'I': np.int32, 'J': np.int32,
+        'log_Nxx': np.float32, 'log_PiPj': np.float32,
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = torch.from_numpy(
+            np.load(os.path.join(path, 'offsets.npy')))
+        self.arrays = {}
+        for name, dtype in self.ARRAYS.items():
+            # Empty files can't be mapped.
+            if self.offsets[-1] == 0:
+                array = np.empty(0, dtype=dtype)
+            else:
+                array = np.memmap(
+                    os.path.join(path, '{}.bin'.format(name)),
+                    dtype=dtype, mode='c'
+                )
+            self.arrays[name] = torch.from_numpy(array)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def sector(self, k):
+        """Get the arrays for sector ``k``, as a dict of tensors."""
+        start, stop = int(self.offsets[k]), int(self.offsets[k + 1])
+        return {name: array[start:stop] for name, array in self.arrays.items()}
+
+    @staticmethod
+    def temper(log_Nxx, log_PiPj, temperature):
+        """
+        Get the tempered scores ``Nxx * (Pi * Pj) ** (1 / temperature - 1)``
+        of pairs, from their logs.
+        """
+        return torch.exp(
+            log_Nxx.to(torch.float64)
+            + (1 / temperature - 1) * log_PiPj.to(torch.float64)
+        )
+
+    def masses(self, temperature, chunk_size=2**24):
+        """
+        Work out the total tempered score of the pairs in each sector, a
+        chunk of pairs at a time.
+        """
+        masses = torch.zeros(len(self), dtype=torch.float64)
+        num_pairs = int(self.offsets[-1])
+        for start in range(0, num_pairs, chunk_size):
+            stop = min(start + chunk_size, num_pairs)
+            scores = self.temper(
+                self.arrays['log_Nxx'][start:stop],
+                self.arrays['log_PiPj'][start:stop], temperature
+            )
+            sectors = torch.searchsorted(
+                self.offsets[1:], torch.arange(start, stop), right=True)
+            masses.index_add_(0, sectors, scores)
+        return masses
+
+    @staticmethod
+    def build(
+            cooccurrence_path, path, min_cooccurrence_count=None,
+            verbose=True
+    ):
+        """
+        Read the sectors of the store at ``cooccurrence_path`` one at a time,
+        writing their arrays to a new directory at ``path``.
+        """
+        os.makedirs(path)
+        Nx = np.load(os.path.join(cooccurrence_path, 'Nx.npy'))
+        Nxt = np.load(os.path.join(cooccurrence_path, 'Nxt.npy'))
+        log_Pi = np.log(Nx.reshape(-1) / Nx.sum())
+        log_Pj = np.log(Nxt.reshape(-1) / Nx.sum())
+        sector_ids = h.shards.Shards(
+            h.cooccurrence.CooccurrenceSector.get_sector_factor(
+                cooccurrence_path))
+        offsets = [0]
+        files = {
+            name: open(os.path.join(path, '{}.bin'.format(name)), 'wb')
+            for name in SectorTables.ARRAYS
+        }
+        try:
+            for sector_id in sector_ids:
+                if verbose:
+                    print('Tabulating sector {}'.format(sector_id))
+                Nxx = sparse.load_npz(os.path.join(
+                    cooccurrence_path,
+                    'Nxx-{}-{}-{}.npz'.format(*h.shards.serialize(sector_id))
+                ))
+                if min_cooccurrence_count is not None:
+                    Nxx = h.cooccurrence.pruning.prune_min_count(
+                        Nxx, min_cooccurrence_count)
+                Nxx = Nxx.tocoo()
+                I = Nxx.row.astype(np.int64) * sector_id.step + sector_id.i
+                J = Nxx.col.astype(np.int64) * sector_id.step + sector_id.j
+                arrays = {
+                    'I': I, 'J': J, 'log_Nxx': np.log(Nxx.data),
+                    'log_PiPj': log_Pi[I] + log_Pj[J],
+                }
+                for name, dtype in SectorTables.ARRAYS.items():
+                    files[name].write(arrays[name].astype(dtype).tobytes())
+                offsets.append(offsets[-1] + len(I))
+        finally:
+            for f in files.values():
+                f.close()
+        np.save(
+            os.path.join(path, 'offsets.npy'), np.array(offsets, np.int64))
+
+    @staticmethod
+    def get(
+            cooccurrence_path, min_cooccurrence_count=None, table_dir=None,
+            verbose=True
+    ):
+        """
+        Get the tables for the given cooccurrence store and count threshold,
+        from an entry in ``table_dir`` keyed as in ``SamplingTables.get``,
+        building it first if needed.  If ``table_dir`` is ``None``, they are
+        built in a temporary directory, which is deleted along with them.
+        """
+        if table_dir is None:
+            path = os.path.join(tempfile.mkdtemp(), 'sector-tables')
+            SectorTables.build(
+                cooccurrence_path, path, min_cooccurrence_count, verbose)
+            tables = SectorTables(path)
+            tables.cleanup = weakref.finalize(
+                tables, shutil.rmtree, os.path.dirname(path), True)
+            return tables
+        cache = h.cache.ShardCache(table_dir)
+        key = cache.key(
+            cooccurrence_path, tables='sectors',
+            min_cooccurrence_count=min_cooccurrence_count
+        )
+        path = cache.path(key)
+        with cache.lock(key):
+            if not os.path.exists(path):
+                if verbose:
+                    print('Building sector tables in {}'.format(path))
+                # Write the entry in full before moving it into place.
+                temp_path = '{}.tmp-{}'.format(path, os.getpid())
+                if os.path.exists(temp_path):
+                    shutil.rmtree(temp_path)
+                SectorTables.build(
+                    cooccurrence_path, temp_path, min_cooccurrence_count,
+                    verbose
+                )
+                os.rename(temp_path, path)
+        return SectorTables(path)
+
+
+SAMPLERS = {
+    'categorical': Categorical,
+    'alias': AliasSampler,
+}
+
+
+def get_sampler(sampler, probs, device=None):
+    """
+    Make a sampler of the kind named by ``sampler`` (a key of ``SAMPLERS``)
+    over the distribution proportional to ``probs``.
+    """
+    if sampler not in SAMPLERS:
+        raise ValueError(
+            "Unknown sampler: {}.  Expected one of {}.".format(
+                sampler, sorted(SAMPLERS)))
+    return SAMPLERS[sampler](probs, device=h.utils.get_device(device))
+
+
+def benchmark(num_outcomes, batch_size, num_batches=10, device=None):
+    """
+    Time building each kind of sampler over a random distribution with
+    ``num_outcomes`` outcomes, and drawing ``num_batches`` batches of
+    ``batch_size`` samples from it.  Returns a dict mapping each sampler's
+    name to its ``(setup_seconds, seconds_per_batch)``.
+    """
+    device = torch.device(h.utils.get_device(device))
+    probs = torch.rand(num_outcomes, device=device) ** 4
+    timings = {}
+    for name in SAMPLERS:
+        start = time.time()
+        sampler = get_sampler(name, probs, device=device)
+        setup_time = time.time() - start
+        start = time.time()
+        for batch in range(num_batches):
+            sampler.sample(sample_shape=(batch_size,))
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        timings[name] = (setup_time, (time.time() - start) / num_batches)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the setup and sampling times of the samplers.")
+    parser.add_argument(
+        '--num-outcomes', '-n', type=int, nargs='+',
+        default=[10**4, 10**6, 10**7],
+        help="Sizes of the distributions to sample from.")
+    parser.add_argument(
+        '--batch-size', '-b', type=int, default=100000,
+        help="Number of samples drawn per batch.")
+    parser.add_argument(
+        '--num-batches', type=int, default=10,
+        help="Number of batches to time.")
+    parser.add_argument(
+        '--device', default=None, help="Device to sample on.")
+    args = parser.parse_args()
+
+    print('{:>12} {:>12} {:>12} {:>14}'.format(
+        'outcomes', 'sampler', 'setup (s)', 'batch (ms)'))
+    for num_outcomes in args.num_outcomes:
+        timings = benchmark(
+            num_outcomes, args.batch_size, args.num_batches, args.device)
+        for name, (setup_time, batch_time) in timings.items():
+            print('{:>12} {:>12} {:>12.3f} {:>14.3f}'.format(
+                num_outcomes, name, setup_time, batch_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,10 @@ class TempScheduler:
         temperatures, which should both be the same length.  The milestones are
         epoch numbers; when a given milestone is reached, the corresponding
         temperature will be applied
+
+        Instead of a loss, anything with a ``set_temperature`` method can be
+        given, such as a sample loader, and that method is used to apply the
+        temperatures.
         """
         self.loss = tempered_loss
         self.milestones = milestones
@@ -23,9 +27,31 @@ class TempScheduler:
 
         # On reaching milestone, update temp, and point to new milestone.
         if self.milestones[self.pointer] <= self.cur_epoch:
-            self.loss.temperature = self.temperatures[self.pointer]
+            self.set_temperature(self.temperatures[self.pointer])
             self.pointer += 1
 
+    def set_temperature(self, temperature):
+        if hasattr(self.loss, 'set_temperature'):
+            self.loss.set_temperature(temperature)
+        else:
+            self.loss.temperature = temperature
+
+    def state_dict(self):
+        return {
+            'cur_epoch': self.cur_epoch,
+            'pointer': self.pointer,
+            'temperature': self.loss.temperature
+        }
+
+    def load_state_dict(self, state):
+        """
+        Restore the position reached by an earlier scheduler, including the
+        temperature it had applied to the loss.
+        """
+        self.cur_epoch = state['cur_epoch']
+        self.pointer = state['pointer']
+        self.set_temperature(state['temperature'])
+
 
 class LearningRateScheduler:
     def __init__(self,
@@ -52,6 +78,17 @@ class LearningRateScheduler:
     def step(self):
         raise NotImplementedError('Not implemented!')
 
+    def state_dict(self):
+        return {'cur_epoch': self.cur_epoch}
+
+    def load_state_dict(self, state):
+        """
+        Restore the position reached by an earlier scheduler, and re-apply
+        the learning rate it had set.
+        """
+        self.cur_epoch = state['cur_epoch'] - 1
+        self.step()
+
 
 class LinearLRScheduler(LearningRateScheduler):
 
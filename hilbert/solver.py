@@ -1,3 +1,7 @@
+import os
+import random
+
+import numpy as np
 import torch
 
 import hilbert as h
@@ -84,8 +88,95 @@ class Solver(object):
         return self.learner.get_params()
 
 
+    def state_dict(self, to_cpu=False):
+        """
+        Collect everything needed to continue training exactly where it left
+        off: the learner's parameters, the optimizer's state (e.g. Adam's
+        moments), the schedulers' positions, the loader's state if it keeps
+        any, and the state of the random number generators.
+
+        Sample loaders that draw batches in background producers can't give
+        back the batches their producers had drawn ahead, so after resuming
+        they draw fresh ones, from seeds not used before the checkpoint.
+
+        By default, tensors in the result share memory with the live training
+        state.  If ``to_cpu`` is ``True``, they are copied to the CPU, so
+        that the result is unaffected by further training.
+        """
+        state = {
+            'learner': self.learner.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'schedulers': [
+                scheduler.state_dict() for scheduler in self.schedulers],
+            'loader': None,
+            'rng': {
+                'torch': torch.get_rng_state(),
+                'cuda': (
+                    torch.cuda.get_rng_state_all()
+                    if torch.cuda.is_available() else None
+                ),
+                'numpy': np.random.get_state(),
+                'python': random.getstate(),
+            }
+        }
+        if hasattr(self.loader, 'state_dict'):
+            state['loader'] = self.loader.state_dict()
+        if to_cpu:
+            state = copy_to_cpu(state)
+        return state
+
+
+    def load_state_dict(self, state):
+        """
+        Restore the training state produced by ``state_dict``.  The solver
+        must have been built with the same configuration.
+        """
+        if len(state['schedulers']) != len(self.schedulers):
+            raise ValueError(
+                "Checkpoint has {} schedulers, but the solver has {}.".format(
+                    len(state['schedulers']), len(self.schedulers))
+            )
+        self.learner.load_state_dict(state['learner'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        for scheduler, scheduler_state in zip(
+            self.schedulers, state['schedulers']
+        ):
+            scheduler.load_state_dict(scheduler_state)
+        if state['loader'] is not None:
+            self.loader.load_state_dict(state['loader'])
+
+        rng = state['rng']
+        torch.set_rng_state(rng['torch'])
+        if rng['cuda'] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(rng['cuda'])
+        np.random.set_state(rng['numpy'])
+        random.setstate(rng['python'])
+
+
+    def save_checkpoint(self, path, **extra):
+        """
+        Write the solver's training state to ``path``, along with any
+        ``extra`` values the caller wants back on resuming (such as how many
+        updates have been run).  The file is replaced atomically, so an
+        interruption during the write leaves the previous checkpoint intact.
+        """
+        save_checkpoint(path, self.state_dict(), **extra)
+
+
+    def load_checkpoint(self, path):
+        """
+        Restore the training state saved at ``path`` by ``save_checkpoint``,
+        and return the ``extra`` values that were saved with it.
+        """
+        checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+        self.load_state_dict(checkpoint['solver'])
+        return checkpoint['extra']
+
+
     def cycle(self, updates_per_cycle=1, monitor_closely=False):
         grad_accumulation_step = self.gradient_accumulation
+        wait_time = getattr(self.loader, 'transfer_wait_time', None)
+        stream_wait_time = getattr(self.loader, 'stream_wait_time', None)
 
         # Run a bunch of updates.
         for update_id in range(updates_per_cycle):
@@ -150,4 +241,42 @@ class Solver(object):
         self.optimizer.zero_grad()
         tracer.declare('loss', self.cur_loss.item())
 
+        # Report how long was spent waiting for batches to reach the device.
+        if wait_time is not None:
+            tracer.declare(
+                'transfer_wait_time',
+                self.loader.transfer_wait_time - wait_time
+            )
+        # And how long was spent waiting for streamed shards to be read.
+        if stream_wait_time is not None:
+            tracer.declare(
+                'stream_wait_time',
+                self.loader.stream_wait_time - stream_wait_time
+            )
+
         return self.cur_loss.item()
+
+
+def copy_to_cpu(state):
+    """
+    Copy every tensor found in the (arbitrarily nested) dicts, lists, and
+    tuples of ``state`` onto the CPU.
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {key: copy_to_cpu(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(copy_to_cpu(value) for value in state)
+    return state
+
+
+def save_checkpoint(path, state, **extra):
+    """
+    Atomically write a solver ``state``, as produced by
+    ``Solver.state_dict``, to ``path`` in the format read by
+    ``Solver.load_checkpoint``.
+    """
+    temp_path = path + '.tmp'
+    torch.save({'solver': state, 'extra': extra}, temp_path)
+    os.replace(temp_path, path)
@@ -0,0 +1,139 @@
+import gc
+import os
+import shutil
+from unittest import TestCase, main
+
+import torch
+
+import hilbert as h
+
+
+class TestShardCache(TestCase):
+
+    def test_dense_loader_cache(self):
+        cooccurrence_path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+        cache_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-shard-cache')
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+
+        options = {
+            'shard_factor': 2, 'include_unigrams': True,
+            'undersampling': 1e-5, 'smoothing': 3/4, 'verbose': False
+        }
+        expected = h.loader.DenseLoader(cooccurrence_path, **options)
+
+        # The first cached loader fills the cache, the second reads from it.
+        for trial in range(2):
+            found = h.loader.DenseLoader(
+                cooccurrence_path, cache_dir=cache_dir, **options)
+            self.assertEqual(len(h.cache.ShardCache(cache_dir).keys()), 1)
+            self.assertEqual(len(found), len(expected))
+            for (found_id, found_data), (expected_id, expected_data) in zip(
+                found, expected
+            ):
+                self.assertEqual(found_id, expected_id)
+                for found_tensors, expected_tensors in zip(
+                    found_data, expected_data
+                ):
+                    for found_tensor, expected_tensor in zip(
+                        found_tensors, expected_tensors
+                    ):
+                        self.assertTrue(
+                            torch.equal(found_tensor, expected_tensor))
+
+        # Changing the preprocessing makes a new entry.
+        h.loader.DenseLoader(
+            cooccurrence_path, cache_dir=cache_dir,
+            **{**options, 'smoothing': None}
+        )
+        self.assertEqual(len(h.cache.ShardCache(cache_dir).keys()), 2)
+
+        # Sparse shards are cached separately, and read back intact.
+        for trial in range(2):
+            found = h.loader.DenseLoader(
+                cooccurrence_path, cache_dir=cache_dir, sparse=True,
+                **options
+            )
+            self.assertEqual(len(h.cache.ShardCache(cache_dir).keys()), 3)
+            for (found_id, found_data), (expected_id, expected_data) in zip(
+                found, expected
+            ):
+                for found_tensor, expected_tensor in zip(
+                    found_data[0], expected_data[0]
+                ):
+                    self.assertTrue(torch.equal(found_tensor, expected_tensor))
+
+        shutil.rmtree(cache_dir)
+
+
+    def test_key(self):
+        cooccurrence_path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+        key = h.cache.ShardCache.key(
+            cooccurrence_path, shard_factor=1, dtype=torch.float32)
+
+        # The key is deterministic, and sensitive to every option.
+        self.assertEqual(key, h.cache.ShardCache.key(
+            cooccurrence_path, dtype=torch.float32, shard_factor=1))
+        self.assertNotEqual(key, h.cache.ShardCache.key(
+            cooccurrence_path, shard_factor=2, dtype=torch.float32))
+        self.assertNotEqual(key, h.cache.ShardCache.key(
+            cooccurrence_path, shard_factor=1, dtype=torch.float64))
+        self.assertNotEqual(key, h.cache.ShardCache.key(
+            os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence-sectors'),
+            shard_factor=1, dtype=torch.float32
+        ))
+
+
+class TestSharedShardStore(TestCase):
+
+    def test_shared_loaders(self):
+        cooccurrence_path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+        shared_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-shared-store')
+        if os.path.exists(shared_dir):
+            shutil.rmtree(shared_dir)
+        store = h.cache.SharedShardStore(shared_dir)
+
+        options = {
+            'shard_factor': 2, 'undersampling': 1e-5, 'smoothing': 3/4,
+            'verbose': False
+        }
+        expected = h.loader.DenseLoader(cooccurrence_path, **options)
+
+        # The first loader publishes the shards, the second attaches to them.
+        loaders = [
+            h.loader.DenseLoader(
+                cooccurrence_path, shared_dir=shared_dir, **options)
+            for i in range(2)
+        ]
+        keys = store.keys()
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(store.num_users(keys[0]), 2)
+        for loader in loaders:
+            for (found_id, found_data), (expected_id, expected_data) in zip(
+                loader, expected
+            ):
+                self.assertEqual(found_id, expected_id)
+                for found, expected_tensor in zip(
+                    found_data[0] + found_data[1],
+                    expected_data[0] + expected_data[1]
+                ):
+                    self.assertTrue(torch.equal(found, expected_tensor))
+
+        # The entry lasts until its last user is done with it.
+        loaders[0].release()
+        self.assertEqual(store.num_users(keys[0]), 1)
+        self.assertEqual(len(store.keys()), 1)
+        del loaders, loader
+        gc.collect()
+        self.assertEqual(len(store.keys()), 0)
+
+        # Users that exit without releasing are not counted.
+        handle = store.attach(keys[0])
+        os.close(handle[0])
+        self.assertEqual(store.num_users(keys[0]), 0)
+
+        shutil.rmtree(shared_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -57,7 +57,7 @@ class TestCooccurrence(TestCase):
 
         # Except for the cooccurrence matrix Nxx, which is in sparse
         # matrix form, the other statistics are `torch.Tensor`s.
-        self.assertTrue(isinstance(cooccurrence.Nxx, sparse.lil_matrix))
+        self.assertTrue(isinstance(cooccurrence.Nxx, sparse.csr_matrix))
         self.assertTrue(isinstance(cooccurrence.Nx, torch.Tensor))
         self.assertTrue(isinstance(cooccurrence.Nxt, torch.Tensor))
         self.assertTrue(isinstance(cooccurrence.uNx, torch.Tensor))
@@ -249,6 +249,52 @@ class TestCooccurrence(TestCase):
         self.assertTrue(cooccurrence.count('socks', 'car'), 1)
 
 
+    def test_counts(self):
+        cooccurrence, unigram, Nxx = get_test_cooccurrence()
+        dense = Nxx.toarray()
+        tokens1 = unigram.dictionary.tokens[:10]
+        tokens2 = unigram.dictionary.tokens[5:15]
+        expected = [
+            cooccurrence.count(token1, token2)
+            for token1, token2 in zip(tokens1, tokens2)
+        ]
+        found = cooccurrence.counts(tokens1, tokens2)
+        self.assertTrue(np.array_equal(found, expected))
+
+        # Lookups by ID work in batch, for arrays or tensors, including for
+        # pairs that never cooccur.
+        I, J = np.meshgrid(
+            np.arange(dense.shape[0]), np.arange(dense.shape[1]))
+        I, J = I.reshape(-1), J.reshape(-1)
+        self.assertTrue(
+            np.array_equal(cooccurrence.count_ids(I, J), dense[I, J]))
+        found = cooccurrence.count_ids(torch.tensor(I), torch.tensor(J))
+        self.assertTrue(isinstance(found, torch.Tensor))
+        self.assertTrue(np.array_equal(found.numpy(), dense[I, J]))
+
+        # The index follows changes to the counts.
+        cooccurrence.apply_w2v_undersampling(1e-5)
+        self.assertTrue(np.allclose(
+            cooccurrence.count_ids(I, J), cooccurrence.Nxx.toarray()[I, J]))
+
+
+    def test_pair_index(self):
+        matrix = sparse.random(50, 40, 0.1, format='coo')
+        dense = matrix.toarray()
+        index = h.cooccurrence.PairIndex(matrix)
+        self.assertEqual(len(index), matrix.nnz)
+        I = np.random.randint(0, 50, 1000)
+        J = np.random.randint(0, 40, 1000)
+        self.assertTrue(np.array_equal(index.lookup(I, J), dense[I, J]))
+        found = index.lookup(I, J, default=-1)
+        self.assertTrue(np.array_equal(
+            found, np.where(dense[I, J] == 0, -1, dense[I, J])))
+
+        empty = h.cooccurrence.PairIndex(sparse.coo_matrix((5, 5)))
+        self.assertTrue(np.array_equal(
+            empty.lookup(np.arange(5), np.arange(5)), np.zeros(5)))
+
+
     def test_get_sector(self):
         dictionary, array, unigram = self.get_test_cooccurrence_stats()
         cooccurrence, unigram, Nxx = get_test_cooccurrence()
@@ -0,0 +1,115 @@
+import os
+import shutil
+from unittest import TestCase, main
+
+import numpy as np
+from scipy import sparse
+
+import hilbert as h
+
+
+def get_test_Nxx():
+    path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+    return sparse.load_npz(os.path.join(path, 'Nxx.npz'))
+
+
+class TestPruning(TestCase):
+
+    def test_prune_min_count(self):
+        Nxx = get_test_Nxx()
+        dense = Nxx.toarray()
+        for threshold in [0, 1, 5, 20]:
+            found = h.cooccurrence.pruning.prune_min_count(Nxx, threshold)
+            expected = np.where(dense > threshold, dense, 0)
+            self.assertTrue(isinstance(found, sparse.csr_matrix))
+            self.assertTrue(np.array_equal(found.toarray(), expected))
+
+        # The old entry point agrees.
+        found = h.cooccurrence.CooccurrenceSector.remove_infrequent_cooccurrence(
+            Nxx, 5)
+        self.assertTrue(np.array_equal(
+            found.toarray(), np.where(dense > 5, dense, 0)))
+
+
+    def test_prune_top_k(self):
+        Nxx = get_test_Nxx()
+        dense = Nxx.toarray()
+        k = 7
+        found = h.cooccurrence.pruning.prune_top_k(Nxx, k).toarray()
+        for row, found_row in zip(dense, found):
+            num_nonzero = np.count_nonzero(row)
+            self.assertEqual(np.count_nonzero(found_row), min(k, num_nonzero))
+            # Kept counts are never smaller than dropped ones.
+            kept = found_row[found_row > 0]
+            dropped = row[(found_row == 0) & (row > 0)]
+            if len(kept) and len(dropped):
+                self.assertTrue(kept.min() >= dropped.max())
+
+
+    def test_prune_pmi(self):
+        Nxx = get_test_Nxx()
+        dense = Nxx.toarray()
+        Nx = dense.sum(axis=1, keepdims=True)
+        Nxt = dense.sum(axis=0, keepdims=True)
+        N = dense.sum()
+        found = h.cooccurrence.pruning.prune_pmi(Nxx, Nx, Nxt, N, 0.5)
+        with np.errstate(divide='ignore'):
+            pmi = np.log(dense * N / (Nx * Nxt))
+        expected = np.where(pmi > 0.5, dense, 0)
+        self.assertTrue(np.array_equal(found.toarray(), expected))
+
+
+    def test_prune_mass(self):
+        Nxx = get_test_Nxx()
+        total = Nxx.sum()
+        for mass in [0.5, 0.9, 1]:
+            found = h.cooccurrence.pruning.prune_mass(Nxx, mass)
+            self.assertTrue(found.sum() >= mass * total)
+            # Dropping the smallest kept count would fall short.
+            smallest = found.data.min()
+            kept_above = found.data[found.data > smallest].sum()
+            self.assertTrue(kept_above < mass * total)
+        with self.assertRaises(ValueError):
+            h.cooccurrence.pruning.prune_mass(Nxx, 0)
+
+
+    def test_prune_store(self):
+        in_path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence-sectors')
+        out_path = os.path.join(h.CONSTANTS.TEST_DIR, 'test-pruned-store')
+        if os.path.exists(out_path):
+            shutil.rmtree(out_path)
+
+        sector_factor = 3
+        vocab = 500
+        full = np.zeros((vocab, vocab))
+        for sector in h.shards.Shards(sector_factor):
+            full[sector] = sparse.load_npz(os.path.join(
+                in_path, 'Nxx-{}-{}-{}.npz'.format(*sector.serialize())
+            )).toarray()
+
+        h.cooccurrence.pruning.prune_store(
+            in_path, out_path, min_count=2, top_k=50, mass=0.95,
+            verbose=False
+        )
+
+        # Pruning the assembled matrix gives the same result.
+        expected = h.cooccurrence.pruning.prune(
+            full, min_count=2, top_k=50, mass=0.95).toarray()
+        found = np.zeros((vocab, vocab))
+        for sector in h.shards.Shards(sector_factor):
+            cooccurrence_sector = h.cooccurrence.CooccurrenceSector.load(
+                out_path, sector, verbose=False)
+            found[sector] = cooccurrence_sector.Nxx.toarray()
+        self.assertTrue(np.allclose(found, expected))
+
+        # Marginals are consistent with the pruned counts.
+        Nx = np.load(os.path.join(out_path, 'Nx.npy'))
+        Nxt = np.load(os.path.join(out_path, 'Nxt.npy'))
+        self.assertTrue(np.allclose(Nx, expected.sum(axis=1, keepdims=True)))
+        self.assertTrue(np.allclose(Nxt, expected.sum(axis=0, keepdims=True)))
+
+        shutil.rmtree(out_path)
+
+
+if __name__ == '__main__':
+    main()
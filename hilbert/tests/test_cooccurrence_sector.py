@@ -86,6 +86,24 @@ class TestCooccurrenceSector(TestCase):
         # Test equality
         self.assertTrue(np.allclose(Nxx_dense, Nxx))
 
+        # The number of workers doesn't affect the result.
+        for found, expected in zip(
+            h.cooccurrence.CooccurrenceSector.load_coo(
+                save_path, verbose=False, num_workers=1),
+            (Nxx_data, I, J, Nx, Nxt)
+        ):
+            self.assertTrue(torch.equal(found, expected))
+
+        # Infrequent counts can be dropped while loading.
+        Nxx_data, I, J = h.cooccurrence.CooccurrenceSector.load_coo(
+            save_path, include_marginals=False, min_cooccurrence_count=1,
+            verbose=False
+        )
+        Nxx_dense = sparse.coo_matrix((
+            np.array(Nxx_data), (np.array(I), np.array(J))
+        ), shape=Nxx.shape).toarray()
+        self.assertTrue(np.allclose(Nxx_dense, np.where(Nxx > 1, Nxx, 0)))
+
 
     def get_test_cooccurrence_sector(self):
         cooccurrence = h.cooccurrence.Cooccurrence.load(
@@ -143,7 +161,7 @@ class TestCooccurrenceSector(TestCase):
 
             # Except for the cooccurrence matrix Nxx, which is in sparse
             # matrix form, the other statistics are `torch.Tensor`s.
-            self.assertTrue(isinstance(cooccurrence_sector.Nxx, sparse.lil_matrix))
+            self.assertTrue(isinstance(cooccurrence_sector.Nxx, sparse.csr_matrix))
             self.assertTrue(isinstance(cooccurrence_sector._Nx, torch.Tensor))
             self.assertTrue(isinstance(cooccurrence_sector._Nxt, torch.Tensor))
             self.assertTrue(isinstance(cooccurrence_sector._uNx, torch.Tensor))
@@ -442,6 +460,74 @@ class TestCooccurrenceSector(TestCase):
         self.assertTrue(torch.allclose(expected_uN, cooccurrence_sector.uN))
 
 
+    def test_count_ids(self):
+        path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+        for sector in h.shards.Shards(3):
+            cooccurrence_sector = h.cooccurrence.CooccurrenceSector.load(
+                path, sector, verbose=False)
+            dense = cooccurrence_sector.Nxx.toarray()
+            I, J = np.nonzero(np.ones(dense.shape))
+            self.assertTrue(np.array_equal(
+                cooccurrence_sector.count_ids(I, J), dense[I, J]))
+
+            tokens1 = cooccurrence_sector.row_dictionary.tokens[:10]
+            tokens2 = cooccurrence_sector.column_dictionary.tokens[5:15]
+            expected = [
+                cooccurrence_sector.count(token1, token2)
+                for token1, token2 in zip(tokens1, tokens2)
+            ]
+            self.assertTrue(np.array_equal(
+                cooccurrence_sector.counts(tokens1, tokens2), expected))
+
+
+    def test_load_relative_shards(self):
+        path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+        for sector in h.shards.Shards(3):
+            cooccurrence_sector = h.cooccurrence.CooccurrenceSector.load(
+                path, sector, verbose=False)
+            found = cooccurrence_sector.load_relative_shards(2, device='cpu')
+            self.assertEqual(len(found), 4)
+            for shard_id, found_data in found:
+                expected_data = cooccurrence_sector.load_relative_shard(
+                    shard_id, device='cpu')
+                for found_tensor, expected_tensor in zip(
+                    found_data, expected_data
+                ):
+                    self.assertTrue(torch.equal(found_tensor, expected_tensor))
+
+
+    def test_shared_unigram(self):
+        # Sectors loaded with a shared unigram can each be smoothed and
+        # undersampled, without affecting each other or the unigram.
+        path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+        unigram = h.unigram.Unigram.load(path, verbose=False)
+        uNx = list(unigram.Nx)
+        smoothed = []
+        for sector in h.shards.Shards(3):
+            cooccurrence_sector = h.cooccurrence.CooccurrenceSector.load(
+                path, sector, verbose=False, unigram=unigram)
+            expected = h.cooccurrence.CooccurrenceSector.load(
+                path, sector, verbose=False)
+            self.assertTrue(cooccurrence_sector.unigram is unigram)
+            self.assertEqual(
+                cooccurrence_sector.row_dictionary.token_ids,
+                expected.row_dictionary.token_ids
+            )
+            cooccurrence_sector.apply_w2v_undersampling(1e-5)
+            cooccurrence_sector.apply_unigram_smoothing(0.75)
+            expected.apply_w2v_undersampling(1e-5)
+            expected.apply_unigram_smoothing(0.75)
+            for found_tensor, expected_tensor in zip(
+                cooccurrence_sector.load_unigram_shard(),
+                expected.load_unigram_shard()
+            ):
+                self.assertTrue(torch.allclose(found_tensor, expected_tensor))
+            smoothed.append(cooccurrence_sector.unigram)
+
+        self.assertEqual(unigram.Nx, uNx)
+        self.assertTrue(all(s is smoothed[0] for s in smoothed))
+
+
     def test_apply_w2v_undersampling(self):
 
         t = 1e-5
@@ -104,3 +104,30 @@ class TestDictionary(TestCase):
         # Cleanup
         os.remove(write_path)
 
+
+    def test_dictionary_view(self):
+        tokens, dictionary = self.get_test_dictionary()
+        for index in [slice(0, None, 1), slice(1, None, 3), slice(2, 50, 4)]:
+            view = h.dictionary.DictionaryView(dictionary, index)
+            expected = h.dictionary.Dictionary(dictionary.tokens[index])
+
+            # Lookups agree with a dictionary built from the selected tokens.
+            self.assertEqual(len(view), len(expected))
+            for token in dictionary.tokens:
+                self.assertEqual(token in view, token in expected)
+                self.assertEqual(
+                    view.get_id_safe(token), expected.get_id_safe(token))
+            for idx in range(len(expected)):
+                self.assertEqual(view.get_token(idx), expected.get_token(idx))
+                self.assertEqual(view.get_id(expected.tokens[idx]), idx)
+            with self.assertRaises(KeyError):
+                view.get_id('not-a-token')
+
+            # Token lists and mappings are only built when asked for.
+            self.assertTrue(view._tokens is None)
+            self.assertEqual(view.tokens, expected.tokens)
+            self.assertEqual(view.token_ids, expected.token_ids)
+
+            with self.assertRaises(TypeError):
+                view.add_token('new-token')
+
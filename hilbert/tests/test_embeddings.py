@@ -444,6 +444,140 @@ class TestEmbeddings(TestCase):
         shutil.rmtree(out_path)
 
 
+    def test_save_load_mapped(self):
+
+        d = 30
+        vocab = 5000
+        dictionary = get_test_dictionary()
+        V = np.random.random((vocab, d))
+        W = np.random.random((vocab, d))
+        vb = np.random.random(vocab)
+        wb = np.random.random(vocab)
+        out_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-embeddings-mapped')
+        out_path = os.path.join(out_dir, 'embeddings.hbe')
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+
+        # Vectors, covectors, biases and dictionary all survive the round trip.
+        embeddings1 = h.embeddings.Embeddings(
+            V, W, vb, wb, dictionary=dictionary, device='cpu')
+        embeddings1.save_mapped(out_path)
+        embeddings2 = h.embeddings.Embeddings.load_mapped(
+            out_path, device='cpu')
+        self.assertTrue(isinstance(embeddings2.V, torch.Tensor))
+        self.assertTrue(torch.allclose(embeddings1.V, embeddings2.V))
+        self.assertTrue(torch.allclose(embeddings1.W, embeddings2.W))
+        self.assertTrue(torch.allclose(embeddings1.vb, embeddings2.vb))
+        self.assertTrue(torch.allclose(embeddings1.wb, embeddings2.wb))
+        self.assertEqual(
+            embeddings1.dictionary.tokens, embeddings2.dictionary.tokens)
+        self.assertTrue(torch.allclose(embeddings2['dog'], embeddings1['dog']))
+
+        # Writing to the loaded tensors does not alter the file.
+        embeddings2.V[0] = 0
+        embeddings3 = h.embeddings.Embeddings.load_mapped(
+            out_path, device='cpu')
+        self.assertTrue(torch.allclose(embeddings1.V, embeddings3.V))
+
+        # Covectors, biases, and dictionary are optional.
+        embeddings1 = h.embeddings.Embeddings(V, device='cpu')
+        embeddings1.save_mapped(out_path)
+        embeddings2 = h.embeddings.Embeddings.load_mapped(
+            out_path, device='cpu')
+        self.assertTrue(torch.allclose(embeddings1.V, embeddings2.V))
+        self.assertTrue(embeddings2.W is None)
+        self.assertTrue(embeddings2.vb is None)
+        self.assertTrue(embeddings2.dictionary is None)
+
+        # Other files are rejected.
+        with self.assertRaises(ValueError):
+            h.embeddings.Embeddings.load_mapped(
+                os.path.join(h.CONSTANTS.TEST_DIR, 'dictionary'))
+
+        shutil.rmtree(out_dir)
+
+
+    def test_word2vec_glove_formats(self):
+
+        d = 30
+        vocab = 5000
+        tokens = get_test_dictionary().tokens
+        tokens[:3] = ['has space', '100%', 'naïve']
+        dictionary = h.dictionary.Dictionary(tokens)
+        V = np.random.normal(size=(vocab, d)).astype(np.float32)
+        out_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-embeddings-export')
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.makedirs(out_dir)
+        embeddings = h.embeddings.Embeddings(
+            V, dictionary=dictionary, device='cpu')
+
+        # Binary word2vec is exact; chunking should not affect the result.
+        # (Its tokens can't contain spaces.)
+        binary_tokens = ['has_space'] + tokens[1:]
+        binary_embeddings = h.embeddings.Embeddings(
+            V, dictionary=h.dictionary.Dictionary(binary_tokens), device='cpu')
+        path = os.path.join(out_dir, 'vectors.bin')
+        binary_embeddings.save_word2vec(path, chunk_size=333)
+        found = h.embeddings.Embeddings.load_word2vec(
+            path, device='cpu', chunk_size=777)
+        self.assertTrue(torch.equal(found.V, embeddings.V))
+        self.assertEqual(found.dictionary.tokens, binary_tokens)
+        self.assertEqual(found.dictionary.get_id('100%'), 1)
+
+        # Text formats are exact up to the formatting precision.
+        path = os.path.join(out_dir, 'vectors.txt')
+        embeddings.save_word2vec(path, binary=False, chunk_size=333)
+        found = h.embeddings.Embeddings.load_word2vec(
+            path, binary=False, device='cpu', chunk_size=777)
+        self.assertTrue(torch.allclose(found.V, embeddings.V, atol=1e-6))
+        self.assertEqual(found.dictionary.tokens, tokens)
+
+        # GloVe has no header, so the first token's space needs an explicit d.
+        path = os.path.join(out_dir, 'glove.txt')
+        embeddings.save_glove(path, chunk_size=333)
+        found = h.embeddings.Embeddings.load_glove(
+            path, d=d, device='cpu', chunk_size=777)
+        self.assertTrue(torch.allclose(found.V, embeddings.V, atol=1e-6))
+        self.assertEqual(found.dictionary.tokens, tokens)
+
+        # Trailing blank lines, or a missing final newline, don't change the
+        # number of vectors.
+        with open(path, 'rb') as f:
+            contents = f.read()
+        for ending in [contents + b'\n\n', contents.rstrip(b'\n')]:
+            with open(path, 'wb') as f:
+                f.write(ending)
+            found = h.embeddings.Embeddings.load_glove(
+                path, d=d, device='cpu', chunk_size=777)
+            self.assertTrue(torch.allclose(found.V, embeddings.V, atol=1e-6))
+            self.assertEqual(found.dictionary.tokens, tokens)
+
+        # Fields can be separated by runs of spaces and tabs.
+        lines = contents.decode('utf8').splitlines()
+        with open(path, 'w') as f:
+            for line in lines:
+                token, *values = line.rsplit(' ', d)
+                f.write(token + '\t ' + '  \t'.join(values) + ' \n')
+        found = h.embeddings.Embeddings.load_glove(
+            path, d=d, device='cpu', chunk_size=777)
+        self.assertTrue(torch.allclose(found.V, embeddings.V, atol=1e-6))
+        self.assertEqual(found.dictionary.tokens, tokens)
+
+        # Vectors trimmed to fewer rows than expected don't hold on to the
+        # larger array.
+        found_V, found_tokens = h.embeddings._read_text_vectors(
+            path, 0, vocab + 2, d, 777)
+        self.assertEqual(found_V.shape, (vocab, d))
+        self.assertIsNone(found_V.base)
+
+        # A dictionary is needed to export.
+        with self.assertRaises(ValueError):
+            h.embeddings.Embeddings(V, device='cpu').save_glove(path)
+
+        shutil.rmtree(out_dir)
+
+
     def test_embeddings_recognize_loading_normalized(self):
         in_path = os.path.join(
             h.CONSTANTS.TEST_DIR, 'test-embeddings-normalized')
@@ -36,3 +36,40 @@ class TestBuildDependencySolver(TestCase):
         )
 
         solver.cycle(10)
+
+
+class TestBuildMLESampleSolver(TestCase):
+
+    def test_without_replacement_conflicts(self):
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'test-sample-loader')
+        for options in [
+            {'balanced': True},
+            {'balanced': False, 'gibbs': True},
+            {'balanced': False, 'max_sectors': 1},
+        ]:
+            with self.assertRaises(ValueError):
+                h.factories.build_mle_sample_solver(
+                    cooccurrence_path, without_replacement=True,
+                    device='cpu', verbose=False, **options
+                )
+
+    def test_max_sectors_conflicts(self):
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'test-sample-loader')
+        for options in [{'balanced': True}, {'balanced': False, 'gibbs': True}]:
+            with self.assertRaises(ValueError):
+                h.factories.build_mle_sample_solver(
+                    cooccurrence_path, max_sectors=1, device='cpu',
+                    verbose=False, **options
+                )
+
+    def test_num_bands_needs_balanced(self):
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'test-sample-loader')
+        for options in [{'balanced': False}, {'balanced': False, 'gibbs': True}]:
+            with self.assertRaises(ValueError):
+                h.factories.build_mle_sample_solver(
+                    cooccurrence_path, num_bands=4, device='cpu',
+                    verbose=False, **options
+                )
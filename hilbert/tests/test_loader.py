@@ -23,15 +23,18 @@ class TestLoader(TestCase):
         include_unigrams = False, True
         undersampling = None, torch.tensor(1e-5)
         smoothing = None, 3 / 4
+        sparse_shards = False, True
         verbose = False
 
         sector_factor = h.cooccurrence.CooccurrenceSector.get_sector_factor(
             cooccurrence_path)
         sectors = h.shards.Shards(sector_factor)
         options = itertools.product(
-            shard_factor, include_unigrams, undersampling, smoothing)
+            shard_factor, include_unigrams, undersampling, smoothing,
+            sparse_shards
+        )
 
-        for sh_factor, uni, usamp, smooth in options:
+        for sh_factor, uni, usamp, smooth, sparse_shard in options:
 
             loader = h.loader.DenseLoader(
                 cooccurrence_path=cooccurrence_path,
@@ -40,6 +43,7 @@ class TestLoader(TestCase):
                 undersampling=usamp,
                 smoothing=smooth,
                 verbose=verbose,
+                sparse=sparse_shard,
             )
             shards = h.shards.Shards(sh_factor)
 
@@ -55,6 +59,7 @@ class TestLoader(TestCase):
                     cooc_sector.apply_unigram_smoothing(smooth)
                 expected_cooccurrence = cooc_sector.load_relative_shard(shard)
                 for found, expected in zip(cooccurrence, expected_cooccurrence):
+                    self.assertFalse(found.is_sparse)
                     self.assertTrue(torch.allclose(expected, found))
                 if uni:
                     expected_unigram = cooc_sector.load_relative_unigram_shard(
@@ -65,6 +70,91 @@ class TestLoader(TestCase):
                     self.assertTrue(unigram is None)
 
 
+    def test_dense_loader_streaming(self):
+        cooccurrence_path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+        for shard_factor, sparse_shards, buffer_size in itertools.product(
+            (1, 2), (False, True), (1, 3)
+        ):
+            options = {
+                'cooccurrence_path': cooccurrence_path,
+                'shard_factor': shard_factor, 'undersampling': 1e-5,
+                'smoothing': 3/4, 'sparse': sparse_shards, 'verbose': False
+            }
+            expected_loader = h.loader.DenseLoader(**options)
+            loader = h.loader.DenseLoader(buffer_size=buffer_size, **options)
+            self.assertTrue(loader.preloaded_batches is None)
+            self.assertEqual(len(loader), len(expected_loader))
+
+            # Every pass streams the same shards as are preloaded.  Buffers
+            # are recycled, so compare each shard as it is served.
+            for trial in range(2):
+                num_batches = 0
+                for (found_id, found_data), (expected_id, expected_data) in (
+                    zip(loader, expected_loader)
+                ):
+                    self.assertEqual(found_id, expected_id)
+                    for found, expected in zip(
+                        found_data[0] + found_data[1],
+                        expected_data[0] + expected_data[1]
+                    ):
+                        self.assertTrue(torch.equal(found, expected))
+                    num_batches += 1
+                self.assertEqual(num_batches, len(expected_loader))
+
+            # Waiting on the stream is timed apart from copying to the device.
+            self.assertGreater(loader.stream_wait_time, 0)
+            self.assertEqual(expected_loader.stream_wait_time, 0)
+
+            # Prefetching serves the same shards.
+            loader = h.loader.DenseLoader(
+                buffer_size=buffer_size, prefetch_depth=2, **options)
+            prefetching_loader = h.loader.DenseLoader(
+                prefetch_depth=2, **options)
+            for found_loader in (loader, prefetching_loader):
+                num_batches = 0
+                for (found_id, found_data), (expected_id, expected_data) in (
+                    zip(found_loader, expected_loader)
+                ):
+                    self.assertEqual(found_id, expected_id)
+                    for found, expected in zip(
+                        found_data[0] + found_data[1],
+                        expected_data[0] + expected_data[1]
+                    ):
+                        self.assertTrue(torch.equal(found, expected))
+                    num_batches += 1
+                self.assertEqual(num_batches, len(expected_loader))
+                self.assertTrue(found_loader.transfer_wait_time >= 0)
+                self.assertTrue(found_loader.stream_wait_time >= 0)
+
+            # Abandoning a pass part way through is fine.
+            next(iter(loader))
+            self.assertEqual(
+                sum(1 for batch in loader), len(expected_loader))
+            loader.close()
+
+
+    def test_dense_loader_parallel_preload(self):
+        cooccurrence_path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence')
+        for sparse_shards in (False, True):
+            options = {
+                'cooccurrence_path': cooccurrence_path, 'shard_factor': 2,
+                'undersampling': 1e-5, 'smoothing': 3/4,
+                'sparse': sparse_shards, 'verbose': False
+            }
+            expected_loader = h.loader.DenseLoader(**options)
+            loader = h.loader.DenseLoader(num_workers=2, **options)
+            self.assertEqual(len(loader), len(expected_loader))
+            for (found_id, found_data), (expected_id, expected_data) in zip(
+                loader, expected_loader
+            ):
+                self.assertEqual(found_id, expected_id)
+                for found, expected in zip(
+                    found_data[0] + found_data[1],
+                    expected_data[0] + expected_data[1]
+                ):
+                    self.assertTrue(torch.equal(found, expected))
+
+
 class TestCPUSampleLoader(TestCase):
 
     def test_cpu_sample_loader_probabilities(self):
@@ -116,6 +206,183 @@ class TestCPUSampleLoader(TestCase):
         # Was the proposal distribution as expected?
         self.assertTrue(torch.allclose(Qxx_sample, Qxx_expected, atol=5e-4))
 
+    def test_cpu_sample_loader_producers(self):
+        num_samples = 50
+        batch_size = 10000
+        torch.random.manual_seed(1)
+        cooc_path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence-10')
+        vocab = h.dictionary.Dictionary.check_vocab(
+            os.path.join(cooc_path, 'dictionary'))
+        loader = h.loader.CPUSampleLoader(
+            cooc_path, batch_size=batch_size, device='cpu', num_workers=2,
+            ring_size=3
+        )
+
+        # Batches come from the producers' ring, so must be copied out, and
+        # each worker must draw different samples.
+        batches = []
+        for sample_num in range(num_samples):
+            for IJ, batch_data in loader:
+                batches.append((IJ, batch_data))
+        loader.close()
+        for k, (IJ, batch_data) in enumerate(batches):
+            self.assertEqual(IJ.shape, (batch_size, 2))
+            self.assertTrue(torch.equal(
+                batch_data['exp_pmi'],
+                loader.exp_pmi.lookup(IJ[:, 0], IJ[:, 1]).float()
+            ))
+            if k > 0:
+                self.assertFalse(torch.equal(IJ, batches[k-1][0]))
+
+        # Coalesced batches hold each distinct pair once, with its count.
+        loader = h.loader.CPUSampleLoader(
+            cooc_path, batch_size=batch_size, device='cpu', coalesce=True)
+        IJ, batch_data = next(iter(loader))
+        self.assertEqual(len(IJ.unique(dim=0)), len(IJ))
+        self.assertEqual(batch_data['counts'].sum(), batch_size)
+        self.assertEqual(batch_data['num_samples'], batch_size)
+        self.assertTrue(torch.equal(
+            batch_data['exp_pmi'],
+            loader.exp_pmi.lookup(IJ[:, 0], IJ[:, 1]).float()
+        ))
+
+        # Samples are still drawn from the proposal distribution.
+        IJ = torch.cat([IJ for IJ, batch_data in batches])
+        Qxx_sample = torch.bincount(
+            IJ[:, 0] * vocab + IJ[:, 1], minlength=vocab * vocab
+        ).view(vocab, vocab).float() / len(IJ)
+        cooc = h.cooccurrence.Cooccurrence.load(cooc_path)
+        Qxx_expected = (cooc.Nx / cooc.N) * (cooc.Nxt / cooc.N)
+        self.assertTrue(torch.allclose(Qxx_sample, Qxx_expected, atol=5e-4))
+
+
+class TestStratifiedSampleLoader(TestCase):
+
+    def test_stratified_sample_loader(self):
+        torch.random.manual_seed(1)
+        batch_size = 200
+        num_batches = 2000
+        cooc_path = os.path.join(h.CONSTANTS.TEST_DIR, 'cooccurrence-10')
+        loader = h.loader.StratifiedSampleLoader(
+            cooc_path, temperature=2, batch_size=batch_size, num_bands=3,
+            device='cpu'
+        )
+        cooc = h.cooccurrence.Cooccurrence.load(cooc_path)
+        Qi = (cooc.Nx.view(-1) / cooc.N) ** 0.5
+        Qj = (cooc.Nxt.view(-1) / cooc.N) ** 0.5
+        Qxx = torch.outer(Qi / Qi.sum(), Qj / Qj.sum())
+
+        # Every stratum gets a sample, and the strata cover all pairs.
+        counts = loader.allocate(batch_size)
+        self.assertEqual(len(counts), 9)
+        self.assertEqual(counts.sum(), batch_size)
+        self.assertTrue((counts > 0).all())
+        self.assertTrue(torch.allclose(
+            loader.stratum_probs.sum(), torch.tensor(1, dtype=torch.float64)))
+
+        # Samples lie in their strata, and weighting them by their strata's
+        # probabilities gives unbiased estimates.
+        exp_pmi = torch.tensor(cooc.Nxx.toarray()) / cooc.N / torch.outer(
+            cooc.Nx.view(-1) / cooc.N, cooc.Nxt.view(-1) / cooc.N)
+        estimates = []
+        for batch_num in range(num_batches):
+            for IJ, batch_data in loader:
+                self.assertEqual(IJ.shape, (batch_size, 2))
+                stratum_probs = Qxx[
+                    loader.row_edges[0]:loader.row_edges[1],
+                    loader.col_edges[0]:loader.col_edges[1]
+                ].sum()
+                self.assertTrue((IJ[:counts[0], 0] < loader.row_edges[1]).all())
+                self.assertTrue((IJ[:counts[0], 1] < loader.col_edges[1]).all())
+                self.assertTrue(torch.allclose(
+                    batch_data['weights'][0],
+                    (stratum_probs * batch_size / counts[0]).float()
+                ))
+                estimates.append(
+                    (batch_data['weights'] * batch_data['exp_pmi']).mean())
+        self.assertTrue(torch.allclose(
+            torch.stack(estimates).mean(), (Qxx * exp_pmi).sum().float(),
+            atol=2e-3
+        ))
+
+        # Coalesced batches keep each distinct pair's weight.
+        loader = h.loader.StratifiedSampleLoader(
+            cooc_path, temperature=2, batch_size=batch_size, num_bands=3,
+            device='cpu', coalesce=True
+        )
+        IJ, batch_data = next(iter(loader))
+        self.assertEqual(batch_data['counts'].sum(), batch_size)
+        self.assertEqual(len(batch_data['weights']), len(IJ))
+
+        with self.assertRaises(ValueError):
+            h.loader.StratifiedSampleLoader(
+                cooc_path, batch_size=5, num_bands=3, device='cpu')
+
+
+class TestSectorSampleLoader(TestCase):
+
+    def test_sector_sample_loader_probabilities(self):
+        torch.manual_seed(3141592)
+        batch_size = 200000
+        num_batches = 10
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'test-sample-loader')
+
+        for temperature in [1, 3]:
+            loader = h.loader.SectorSampleLoader(
+                cooccurrence_path, temperature=temperature,
+                batch_size=batch_size, batches_per_draw=3, max_sectors=2,
+                device='cpu', verbose=False
+            )
+            # Sector masses are found from the tables alone, and samplers
+            # are only built when sectors are used.
+            self.assertEqual(len(loader.sectors), 0)
+
+            # The samples follow the same global distribution as those of
+            # the loader that holds all counts in memory.
+            tables = h.sampler.SamplingTables.get(
+                cooccurrence_path, temperature, verbose=False)
+            vocab = len(tables['Pi_tempered'])
+            expected_pij = torch.zeros(vocab * vocab, dtype=torch.float64)
+            expected_pij.index_add_(
+                0, tables['I'].long() * vocab + tables['J'].long(),
+                tables['Nxx_tempered'].double()
+            )
+            expected_pij /= expected_pij.sum()
+            expected_pi = tables['Pi_tempered'] / tables['Pi_tempered'].sum()
+
+            positive_counts = torch.zeros(vocab * vocab, dtype=torch.float64)
+            negative_counts = torch.zeros(vocab, dtype=torch.float64)
+            for batch_num in range(num_batches):
+                for IJ_sample, batch_data in loader:
+                    self.assertEqual(IJ_sample.shape, (batch_size * 2, 2))
+                    positives = IJ_sample[:batch_size]
+                    positive_counts += torch.bincount(
+                        positives[:, 0] * vocab + positives[:, 1],
+                        minlength=vocab * vocab
+                    )
+                    negative_counts += torch.bincount(
+                        IJ_sample[batch_size:, 0], minlength=vocab)
+                self.assertLessEqual(len(loader.sectors), 2)
+
+            found_pij = positive_counts / positive_counts.sum()
+            found_pi = negative_counts / negative_counts.sum()
+            self.assertTrue(torch.allclose(
+                found_pij, expected_pij, atol=1e-3))
+            self.assertTrue(torch.allclose(
+                found_pi, expected_pi.double(), atol=1e-3))
+
+        # Retempering drops the old samplers, and gives the same masses as a
+        # new loader, from the same tables.
+        loader.set_temperature(2)
+        fresh = h.loader.SectorSampleLoader(
+            cooccurrence_path, temperature=2, max_sectors=2, device='cpu',
+            verbose=False
+        )
+        self.assertTrue(torch.allclose(
+            loader.sector_masses, fresh.sector_masses))
+        self.assertEqual(len(loader.sectors), 0)
+
 
 class TestGPUSampleLoader(TestCase):
 
@@ -123,7 +390,11 @@ class TestGPUSampleLoader(TestCase):
         for temperature in [1, 2, 5, 10]:
             self.do_cooccurrence_sample_loader_probabilities_test(temperature)
 
-    def do_cooccurrence_sample_loader_probabilities_test(self, temperature):
+    def test_cooccurrence_sample_loader_alias_sampler(self):
+        self.do_cooccurrence_sample_loader_probabilities_test(2, 'alias')
+
+    def do_cooccurrence_sample_loader_probabilities_test(
+            self, temperature, sampler_name='categorical'):
         """
         Draw a large number of samples, and calculate the empirical probability
         for each outcome.  It should be close to the probability vector with
@@ -137,7 +408,7 @@ class TestGPUSampleLoader(TestCase):
             h.CONSTANTS.TEST_DIR, 'test-sample-loader')
         sampler = h.loader.GPUSampleLoader(
             cooccurrence_path, temperature=temperature,
-            batch_size=batch_size, verbose=False
+            batch_size=batch_size, sampler=sampler_name, verbose=False
         )
         Nxx_data, I, J, Nx, Nxt = h.cooccurrence.CooccurrenceSector.load_coo(
             cooccurrence_path, verbose=False)
@@ -186,6 +457,96 @@ class TestGPUSampleLoader(TestCase):
         self.assertTrue(np.allclose(found_pi, expected_pi_tempered, atol=1e-3))
         self.assertTrue(np.allclose(found_pj, expected_pj_tempered, atol=1e-3))
 
+    def test_cooccurrence_sample_loader_without_replacement(self):
+        torch.manual_seed(3141592)
+        batch_size = 4
+        temperature = 2
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'test-sample-loader')
+        loader = h.loader.GPUSampleLoader(
+            cooccurrence_path, temperature=temperature, batch_size=batch_size,
+            device='cpu', verbose=False, without_replacement=True
+        )
+        Nxx_data, I, J, Nx, Nxt = h.cooccurrence.CooccurrenceSector.load_coo(
+            cooccurrence_path, verbose=False)
+        num_pairs = len(Nxx_data)
+        num_batches = -(-num_pairs // batch_size)
+
+        # Over an epoch, every pair is visited once, and the weighted visits
+        # add up to the tempered distribution.
+        vocab = Nx.shape[0]
+        keys = I.long() * vocab + J.long()
+        visits = torch.zeros(vocab * vocab)
+        weighted_visits = torch.zeros(vocab * vocab)
+        for batch_num in range(num_batches):
+            for IJ_sample, batch_data in loader:
+                self.assertEqual(IJ_sample.shape, (batch_size * 2, 2))
+                positives = IJ_sample[:batch_size]
+                visited = positives[:, 0] * vocab + positives[:, 1]
+                weights = batch_data['positive_weights']
+                if batch_num == num_batches - 1:
+                    last = num_pairs - batch_num * batch_size
+                    visited, weights = visited[:last], weights[:last]
+                visits.index_add_(0, visited, torch.ones(len(visited)))
+                weighted_visits.index_add_(0, visited, weights)
+        self.assertTrue(torch.equal(visits[keys], torch.ones(num_pairs)))
+        self.assertEqual(visits.sum(), num_pairs)
+
+        Pi = Nx.view(-1) / Nx.sum()
+        Pj = Nxt.view(-1) / Nx.sum()
+        expected = Nxx_data * (Pi[I.long()] * Pj[J.long()]) ** (
+            1 / temperature - 1)
+        expected /= expected.sum()
+        self.assertTrue(torch.allclose(
+            weighted_visits[keys] / num_pairs, expected, atol=1e-6))
+
+        # The walk continues from a saved state.
+        restored = h.loader.GPUSampleLoader(
+            cooccurrence_path, temperature=temperature, batch_size=batch_size,
+            device='cpu', verbose=False, without_replacement=True
+        )
+        restored.load_state_dict(loader.state_dict())
+        self.assertEqual(loader.epoch, 1)
+        self.assertTrue(torch.equal(
+            next(iter(restored))[0][:batch_size],
+            next(iter(loader))[0][:batch_size]
+        ))
+
+    def test_cooccurrence_sample_loader_coalesce(self):
+        batch_size = 1000
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'test-sample-loader')
+        batches = []
+        for coalesce in [False, True]:
+            torch.manual_seed(3141592)
+            loader = h.loader.GPUSampleLoader(
+                cooccurrence_path, batch_size=batch_size, device='cpu',
+                verbose=False, coalesce=coalesce
+            )
+            batches.append(next(iter(loader)))
+        (IJ_sample, _), (IJ_coalesced, batch_data) = batches
+
+        # Each half holds its distinct pairs once, and expanding them by their
+        # counts gives back the same samples.
+        boundary = batch_data['boundary']
+        counts = batch_data['counts']
+        self.assertEqual(batch_data['num_samples'], batch_size)
+        self.assertEqual(len(IJ_coalesced), len(counts))
+        self.assertLess(len(IJ_coalesced), 2 * batch_size)
+        for found, expected, found_counts in [
+            (IJ_coalesced[:boundary], IJ_sample[:batch_size],
+                counts[:boundary]),
+            (IJ_coalesced[boundary:], IJ_sample[batch_size:],
+                counts[boundary:]),
+        ]:
+            self.assertEqual(found_counts.sum(), batch_size)
+            self.assertEqual(len(found.unique(dim=0)), len(found))
+            self.assertTrue(torch.equal(
+                found.repeat_interleave(found_counts.long(), dim=0),
+                expected.unique(dim=0, sorted=True).repeat_interleave(
+                    expected.unique(dim=0, return_counts=True)[1], dim=0)
+            ))
+
     def as_counts(self, IJ):
         """
         Take advantage of scipy's coo_matrix constructor as a way to accumulate
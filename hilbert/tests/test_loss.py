@@ -80,6 +80,35 @@ class TestLoss(TestCase):
             self.assertTrue(torch.allclose(found_loss, expected_loss))
 
 
+    def test_sparse_losses(self):
+        cooccurrence, _, _ = get_test_cooccurrence(verbose=False)
+        cooccurrence_data = cooccurrence.load_shard()
+        unigram_data = cooccurrence.load_unigram_shard()
+        Nxx, Nx, Nxt, N = cooccurrence_data
+        sparse_data = ((Nxx.to_sparse(), Nx, Nxt, N), unigram_data)
+        dense_data = (cooccurrence_data, unigram_data)
+        ncomponents = np.prod(Nxx.shape)
+        torch.random.manual_seed(0)
+        M_hat = torch.randn(Nxx.shape, device=Nxx.device)
+
+        loss_pairs = [
+            (h.loss.GloveLoss(ncomponents), h.loss.SparseGloveLoss(ncomponents)),
+            (h.loss.SGNSLoss(ncomponents), h.loss.SparseSGNSLoss(ncomponents)),
+        ] + [
+            (
+                h.loss.MLELoss(ncomponents, temperature=temperature),
+                h.loss.SparseMLELoss(ncomponents, temperature=temperature)
+            )
+            for temperature in [1, 10]
+        ]
+        for dense_loss, sparse_loss in loss_pairs:
+            expected = dense_loss(M_hat, dense_data)
+            # Sparse losses accept sparse or dense counts.
+            for batch_data in [sparse_data, dense_data]:
+                found = sparse_loss(M_hat, batch_data)
+                self.assertTrue(torch.allclose(found, expected, rtol=1e-4))
+
+
     def test_sample_mle_loss(self):
         batch_size = 100
         M_hat_pos = torch.rand(batch_size)
@@ -90,6 +119,31 @@ class TestLoss(TestCase):
         found_loss = loss_obj(torch.cat((M_hat_pos, M_hat_neg)), None)
         self.assertTrue(torch.allclose(found_loss, expected_loss))
 
+        # Positives can carry importance weights.
+        weights = torch.rand(batch_size)
+        numerator = -(
+            (weights * M_hat_pos).sum() - torch.exp(M_hat_neg).sum())
+        found_loss = loss_obj(
+            torch.cat((M_hat_pos, M_hat_neg)), {'positive_weights': weights})
+        self.assertTrue(torch.allclose(found_loss, numerator / batch_size))
+
+        # Coalesced batches give the same loss, and gradient, as full ones.
+        M_hat = torch.rand((4, 5), requires_grad=True)
+        IJ_sample = torch.randint(4, (2 * batch_size, 2))
+        IJ_sample[:, 1] = torch.randint(5, (2 * batch_size,))
+        pair_weights = torch.rand((4, 5))
+        batch_data = {
+            'positive_weights': pair_weights[tuple(IJ_sample[:batch_size].t())]}
+        expected_loss = loss_obj(M_hat[tuple(IJ_sample.t())], batch_data)
+        expected_grad, = torch.autograd.grad(expected_loss, M_hat)
+        IJ_coalesced, coalesced_data = h.loader.coalesce_sample_batch(
+            IJ_sample, batch_data, 5)
+        self.assertLess(len(IJ_coalesced), len(IJ_sample))
+        found_loss = loss_obj(M_hat[tuple(IJ_coalesced.t())], coalesced_data)
+        found_grad, = torch.autograd.grad(found_loss, M_hat)
+        self.assertTrue(torch.allclose(found_loss, expected_loss))
+        self.assertTrue(torch.allclose(found_grad, expected_grad))
+
 
     def test_balanced_sample_mle_loss(self):
         batch_size = 100
@@ -101,4 +155,25 @@ class TestLoss(TestCase):
         found_loss = loss_obj.forward(inner_products, {'exp_pmi':exp_pmis})
         self.assertTrue(torch.allclose(found_loss, expected_loss))
 
+        # Stratified samples are weighted by their strata.
+        weights = torch.rand(batch_size)
+        expected_loss = (weights * (
+            torch.exp(inner_products) - exp_pmis * inner_products
+        )).sum() / batch_size
+        found_loss = loss_obj.forward(
+            inner_products, {'exp_pmi': exp_pmis, 'weights': weights})
+        self.assertTrue(torch.allclose(found_loss, expected_loss))
+
+        # Coalesced pairs are weighted by their multiplicities.
+        counts = torch.randint(1, 5, (batch_size,)).float()
+        expected_loss = torch.repeat_interleave(
+            torch.exp(inner_products) - exp_pmis * inner_products,
+            counts.long()
+        ).sum() / counts.sum()
+        found_loss = loss_obj.forward(inner_products, {
+            'exp_pmi': exp_pmis, 'counts': counts,
+            'num_samples': int(counts.sum())
+        })
+        self.assertTrue(torch.allclose(found_loss, expected_loss))
+
 
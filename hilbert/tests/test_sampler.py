@@ -0,0 +1,189 @@
+import os
+import shutil
+from unittest import TestCase, main
+
+import torch
+
+import hilbert as h
+
+
+class TestAliasSampler(TestCase):
+
+    def get_table_probs(self, sampler):
+        """
+        Work out the probability of drawing each outcome implied by the alias
+        table: each column is picked with probability ``1/n``, and yields its
+        own outcome with probability ``prob``, its alias otherwise.
+        """
+        probs = sampler.prob.clone()
+        probs.index_add_(0, sampler.alias, 1 - sampler.prob)
+        return probs / len(sampler)
+
+    def test_table(self):
+        torch.manual_seed(0)
+        for num_outcomes in [1, 2, 7, 1000, 100000]:
+            scores = torch.rand(num_outcomes, dtype=torch.float64) ** 6
+            scores[::3] = 0
+            scores[-1] = 1
+            uniform = torch.ones(num_outcomes)
+            point = torch.zeros(num_outcomes)
+            point[num_outcomes // 2] = 1
+            for probs in [scores, uniform, point]:
+                sampler = h.sampler.AliasSampler(probs, device='cpu')
+                self.assertEqual(len(sampler), num_outcomes)
+                self.assertTrue(torch.allclose(
+                    self.get_table_probs(sampler),
+                    probs.to(torch.float64) / probs.sum(),
+                    atol=1e-8
+                ))
+
+    def test_sample(self):
+        torch.manual_seed(0)
+        num_samples = 1000000
+        probs = torch.tensor([0, 0.5, 3, 1, 0.25, 0, 2, 1.25])
+        sampler = h.sampler.AliasSampler(probs, device='cpu')
+        samples = sampler.sample(sample_shape=(num_samples,))
+        self.assertEqual(samples.shape, (num_samples,))
+        self.assertEqual(samples.dtype, torch.int64)
+        found = torch.bincount(samples, minlength=len(probs)).float()
+        self.assertTrue(torch.allclose(
+            found / num_samples, probs / probs.sum(), atol=2e-3))
+
+        samples = sampler.sample(sample_shape=(10, 20))
+        self.assertEqual(samples.shape, (10, 20))
+
+    def test_save_load(self):
+        path = os.path.join(h.CONSTANTS.TEST_DIR, 'test-alias-sampler')
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        probs = torch.rand(1000)
+        sampler = h.sampler.AliasSampler(probs, device='cpu')
+        sampler.save(path)
+        loaded = h.sampler.AliasSampler.load(path, device='cpu')
+        self.assertTrue(torch.equal(loaded.table, sampler.table))
+        torch.manual_seed(0)
+        expected = sampler.sample(sample_shape=(100,))
+        torch.manual_seed(0)
+        self.assertTrue(torch.equal(
+            loaded.sample(sample_shape=(100,)), expected))
+        shutil.rmtree(path)
+
+    def test_bad_probs(self):
+        for probs in [
+            torch.zeros(5), torch.tensor([1, -1, 1]), torch.zeros(0),
+            torch.ones((2, 2))
+        ]:
+            with self.assertRaises(ValueError):
+                h.sampler.AliasSampler(probs, device='cpu')
+
+    def test_get_sampler(self):
+        probs = torch.rand(10)
+        self.assertIsInstance(
+            h.sampler.get_sampler('alias', probs, device='cpu'),
+            h.sampler.AliasSampler
+        )
+        self.assertIsInstance(
+            h.sampler.get_sampler('categorical', probs, device='cpu'),
+            h.sampler.Categorical
+        )
+        with self.assertRaises(ValueError):
+            h.sampler.get_sampler('gibbs', probs, device='cpu')
+
+
+
+class TestSamplingTables(TestCase):
+
+    def test_get(self):
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'test-sample-loader')
+        table_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-sampling-tables')
+        if os.path.exists(table_dir):
+            shutil.rmtree(table_dir)
+
+        expected = h.sampler.SamplingTables.get(
+            cooccurrence_path, 2, verbose=False)
+        Nxx_data, I, J, Nx, Nxt = h.cooccurrence.CooccurrenceSector.load_coo(
+            cooccurrence_path, verbose=False)
+        Pi = Nx.view(-1) / Nx.sum()
+        self.assertTrue(torch.allclose(expected['Pi_tempered'], Pi ** 0.5))
+        self.assertTrue(torch.allclose(
+            expected['Nxx_tempered'],
+            Nxx_data * (Pi ** -0.5)[I.long()]
+                * (Nxt.view(-1) / Nx.sum())[J.long()] ** -0.5
+        ))
+
+        # The first call builds and saves the tables, the second maps them.
+        for trial in range(2):
+            found = h.sampler.SamplingTables.get(
+                cooccurrence_path, 2.0, table_dir=table_dir, verbose=False)
+            self.assertEqual(len(os.listdir(table_dir)), 2)
+            for name in expected.tensors:
+                self.assertTrue(torch.equal(found[name], expected[name]))
+            for name in h.sampler.SamplingTables.DISTRIBUTIONS:
+                self.assertTrue(torch.equal(
+                    found.alias_table(name),
+                    h.sampler.AliasSampler(expected[name], device='cpu').table
+                ))
+
+        # Loaders draw the same samples from the mapped tables.
+        for sampler in h.sampler.SAMPLERS:
+            samples = []
+            for loader_table_dir in [None, table_dir]:
+                torch.manual_seed(0)
+                loader = h.loader.GPUSampleLoader(
+                    cooccurrence_path, temperature=2, batch_size=1000,
+                    sampler=sampler, device='cpu', verbose=False,
+                    table_dir=loader_table_dir
+                )
+                samples.append(loader.sample(1000))
+            self.assertTrue(torch.equal(*samples))
+        self.assertEqual(len(os.listdir(table_dir)), 2)
+
+        shutil.rmtree(table_dir)
+
+
+class TestSectorTables(TestCase):
+
+    def test_get(self):
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'test-sample-loader')
+        table_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-sector-tables')
+        if os.path.exists(table_dir):
+            shutil.rmtree(table_dir)
+
+        # The first call builds and saves the tables, the second maps them.
+        for trial in range(2):
+            tables = h.sampler.SectorTables.get(
+                cooccurrence_path, table_dir=table_dir, verbose=False)
+            self.assertEqual(len(os.listdir(table_dir)), 2)
+            self.assertEqual(len(tables), 9)
+
+            # Each sector's pairs lie in that sector.
+            sector_ids = h.shards.Shards(3)
+            for k, sector_id in enumerate(sector_ids):
+                sector = tables.sector(k)
+                self.assertTrue((sector['I'] % 3 == sector_id.i).all())
+                self.assertTrue((sector['J'] % 3 == sector_id.j).all())
+
+            # Together, the sectors' masses are the total tempered score.
+            for temperature in [1, 2, 5]:
+                expected = h.sampler.SamplingTables.get(
+                    cooccurrence_path, temperature, verbose=False)
+                self.assertTrue(torch.allclose(
+                    tables.masses(temperature, chunk_size=4).sum(),
+                    expected['Nxx_tempered'].sum().double()
+                ))
+
+        # Without a table_dir, the tables are kept in a temporary directory
+        # for as long as they are used.
+        tables = h.sampler.SectorTables.get(cooccurrence_path, verbose=False)
+        path = tables.path
+        self.assertTrue(os.path.exists(path))
+        del tables
+        self.assertFalse(os.path.exists(path))
+
+        shutil.rmtree(table_dir)
+
+
+if __name__ == '__main__':
+    main()
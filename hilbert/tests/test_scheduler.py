@@ -1,3 +1,4 @@
+import os
 from unittest import TestCase, main
 import hilbert as h
 import torch
@@ -52,6 +53,37 @@ class TestSchedulers(TestCase):
             self.assertEqual(loss.temperature, temperatures[-1])
 
 
+    def test_temp_scheduler_sample_loader(self):
+        options = {'batch_size': 1000, 'device': 'cpu', 'verbose': False}
+        for loader_class, cooccurrence_dir in [
+            (h.loader.GPUSampleLoader, 'test-sample-loader'),
+            (h.loader.CPUSampleLoader, 'cooccurrence-10')
+        ]:
+            cooccurrence_path = os.path.join(
+                h.CONSTANTS.TEST_DIR, cooccurrence_dir)
+            loader = loader_class(cooccurrence_path, temperature=2, **options)
+            temp_scheduler = h.scheduler.TempScheduler(loader, [1, 3], [5, 1])
+            self.assertEqual(loader.temperature, 2)
+            temp_scheduler.step()
+            self.assertEqual(loader.temperature, 5)
+
+            # The loader samples as if it had been built at the temperature.
+            expected = loader_class(
+                cooccurrence_path, temperature=5, **options)
+            for name in ['positive_sampler', 'negative_sampler', 'I_sampler']:
+                if hasattr(loader, name):
+                    self.assertTrue(torch.allclose(
+                        getattr(loader, name).probs,
+                        getattr(expected, name).probs,
+                        atol=1e-6
+                    ))
+
+            temp_scheduler.step()
+            temp_scheduler.step()
+            self.assertEqual(loader.temperature, 1)
+            self.assertEqual(temp_scheduler.state_dict()['temperature'], 1)
+
+
 
 
     def test_linear_lr_scheduler(self):
@@ -1,4 +1,6 @@
 import os
+import shutil
+import threading
 import hilbert as h
 import torch
 from unittest import TestCase, main
@@ -32,5 +34,154 @@ class TestSolver(TestCase):
             solver.cycle(updates_per_cycle=1000)
 
 
+    def test_checkpoint_resume(self):
+        """
+        Resuming from a checkpoint should continue training exactly as if it
+        had never been interrupted, including optimizer moments, scheduler
+        position, and sampling randomness.
+        """
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'cooccurrence-sectors')
+        out_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-solver-checkpoint')
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.makedirs(out_dir)
+        path = os.path.join(out_dir, 'checkpoint')
+
+        # The sector-streaming loader also resumes with the samples it had
+        # drawn ahead.
+        for options in [{}, {'max_sectors': 1}]:
+            def build():
+                return h.factories.build_mle_sample_solver(
+                    corpus_stats_path=cooccurrence_path, batch_size=100,
+                    balanced=False, dimensions=10, scheduler_str='linear',
+                    end_learning_rate=0, num_updates=20, device='cpu',
+                    verbose=False, **options
+                )
+
+            solver = build()
+            solver.cycle(updates_per_cycle=5)
+            solver.save_checkpoint(path, num_updates=5)
+
+            # A CPU copy of the state isn't affected by further training.
+            snapshot = solver.state_dict(to_cpu=True)
+            V = snapshot['learner']['V'].clone()
+            solver.cycle(updates_per_cycle=5)
+            self.assertTrue(torch.equal(snapshot['learner']['V'], V))
+            self.assertFalse(torch.equal(solver.learner.V.detach().cpu(), V))
+            expected = [
+                p.detach().clone() for p in solver.learner.parameters()]
+
+            resumed = build()
+            extra = resumed.load_checkpoint(path)
+            self.assertEqual(extra, {'num_updates': 5})
+            self.assertEqual(resumed.schedulers[0].cur_epoch, 5)
+            resumed.cycle(updates_per_cycle=5)
+            params = resumed.learner.parameters()
+            for param, expected_param in zip(params, expected):
+                self.assertTrue(torch.equal(param, expected_param))
+
+        shutil.rmtree(out_dir)
+
+
+    def test_checkpoint_resume_producers(self):
+        """
+        Batches drawn ahead by background producers are lost on resuming,
+        so resumed runs draw fresh batches, from seeds that weren't used
+        before the checkpoint, and all resumed runs draw the same ones.
+        """
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'cooccurrence-sectors')
+        out_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-solver-producers')
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.makedirs(out_dir)
+        path = os.path.join(out_dir, 'checkpoint')
+
+        def build():
+            return h.factories.build_mle_sample_solver(
+                corpus_stats_path=cooccurrence_path, batch_size=100,
+                balanced=False, dimensions=10, num_workers=1, device='cpu',
+                verbose=False
+            )
+
+        solver = build()
+        solver.cycle(updates_per_cycle=3)
+        solver.save_checkpoint(path)
+        solver.loader.close()
+
+        found = []
+        for trial in range(2):
+            resumed = build()
+            resumed.load_checkpoint(path)
+            self.assertEqual(resumed.loader.producer_starts, 2)
+            resumed.cycle(updates_per_cycle=3)
+            found.append(resumed.learner.V.detach().clone())
+            resumed.loader.close()
+        self.assertTrue(torch.equal(*found))
+
+        shutil.rmtree(out_dir)
+
+
+
+class TestBackgroundWriter(TestCase):
+
+    def test_write_in_background(self):
+        cooccurrence_path = os.path.join(
+            h.CONSTANTS.TEST_DIR, 'cooccurrence-sectors')
+        out_dir = os.path.join(h.CONSTANTS.TEST_DIR, 'test-background-writer')
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.makedirs(out_dir)
+        checkpoint_path = os.path.join(out_dir, 'checkpoint')
+        solver = h.factories.build_mle_sample_solver(
+            corpus_stats_path=cooccurrence_path, batch_size=100,
+            balanced=False, dimensions=10, device='cpu', verbose=False
+        )
+        solver.cycle(updates_per_cycle=2)
+        writer = h.runners.run_base.BackgroundWriter(solver)
+
+        # Hold up serializing the checkpoint, to see that write() returns
+        # while it is still in progress.
+        started = threading.Event()
+        proceed = threading.Event()
+        save_checkpoint = h.solver.save_checkpoint
+        def slow_save_checkpoint(*args, **kwargs):
+            started.set()
+            proceed.wait()
+            save_checkpoint(*args, **kwargs)
+        h.solver.save_checkpoint = slow_save_checkpoint
+        try:
+            writer.write(
+                os.path.join(out_dir, '2'), checkpoint_path, num_updates=2)
+            self.assertTrue(started.wait(10))
+            self.assertTrue(writer.thread.is_alive())
+            self.assertFalse(os.path.exists(checkpoint_path))
+
+            # Training doesn't change what is being written.
+            V = solver.learner.V.detach().clone()
+            solver.cycle(updates_per_cycle=2)
+            proceed.set()
+            writer.wait()
+        finally:
+            h.solver.save_checkpoint = save_checkpoint
+
+        checkpoint = torch.load(
+            checkpoint_path, map_location='cpu', weights_only=False)
+        self.assertEqual(checkpoint['extra'], {'num_updates': 2})
+        self.assertTrue(torch.equal(checkpoint['solver']['learner']['V'], V))
+
+        # The snapshot buffers are reused by later writes.
+        buffers = [buffer.data_ptr() for buffer in writer.state_buffers]
+        writer.write(os.path.join(out_dir, '4'), checkpoint_path)
+        writer.wait()
+        self.assertEqual(
+            [buffer.data_ptr() for buffer in writer.state_buffers], buffers)
+        self.assertTrue(torch.equal(
+            writer.state_buffers[0], solver.learner.state_dict()['V']))
+
+        shutil.rmtree(out_dir)
+
+
 if __name__ == '__main__':
     main()
@@ -70,6 +70,30 @@ class TestUnigram(TestCase):
         # Attempting to apply smoothing twice is an error
         with self.assertRaises(ValueError):
             unigram.apply_smoothing(alpha)
+        with self.assertRaises(ValueError):
+            unigram.get_smoothed(alpha)
+
+
+    def test_get_smoothed(self):
+
+        alpha = 0.6
+        unigram = h.unigram.Unigram(verbose=False)
+        for token in load_test_tokens():
+            unigram.add(token)
+        counts = list(unigram.Nx)
+
+        # The smoothed version shares the dictionary, and the original is
+        # left as it was.
+        smoothed = unigram.get_smoothed(alpha)
+        self.assertEqual(smoothed.Nx, [c**alpha for c in counts])
+        self.assertTrue(smoothed.smoothed)
+        self.assertTrue(smoothed.dictionary is unigram.dictionary)
+        self.assertEqual(unigram.Nx, counts)
+        self.assertFalse(unigram.smoothed)
+
+        # It is only made once.
+        self.assertTrue(unigram.get_smoothed(alpha) is smoothed)
+        self.assertTrue(unigram.get_smoothed(1) is unigram)
 
 
     def test_unigram_creation_from_Nx(self):
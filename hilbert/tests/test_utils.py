@@ -121,3 +121,44 @@ class TestUtils(TestCase):
         self.assertTrue(torch.allclose(found, expected))
 
 
+    def test_densify_shards(self):
+        source = sparse.random(31, 29, 0.2, format='csr')
+        dense = source.toarray()
+        dtype = h.CONSTANTS.DEFAULT_DTYPE
+        for shard_factor in [1, 2, 3, 5]:
+            found = h.utils.densify_shards(source, shard_factor)
+            shards = h.shards.Shards(shard_factor)
+            self.assertEqual(len(found), len(shards))
+            for shard, found_shard in zip(shards, found):
+                expected = torch.tensor(dense[shard], dtype=dtype)
+                self.assertTrue(torch.allclose(found_shard, expected))
+
+
+    def test_sparse_shards(self):
+        source = sparse.random(31, 29, 0.2, format='csr')
+        dense = source.toarray()
+        dtype = h.CONSTANTS.DEFAULT_DTYPE
+        for shard_factor in [1, 2, 3, 5]:
+            found = h.utils.sparse_shards(source, shard_factor)
+            shards = h.shards.Shards(shard_factor)
+            self.assertEqual(len(found), len(shards))
+            for shard, found_shard in zip(shards, found):
+                self.assertTrue(found_shard.is_sparse)
+                self.assertEqual(
+                    found_shard._nnz(), np.count_nonzero(dense[shard]))
+                expected = torch.tensor(dense[shard], dtype=dtype)
+                self.assertTrue(torch.allclose(found_shard.to_dense(), expected))
+
+
+    def test_densify_shard(self):
+        source = sparse.random(31, 29, 0.2, format='csr')
+        dense = source.toarray()
+        dtype = h.CONSTANTS.DEFAULT_DTYPE
+        for shard in [
+            h.shards.whole, h.shards.Shards(4)[6],
+            (slice(2, 20, 3), slice(1, None, 7)), slice(5, 9), slice(None)
+        ]:
+            found = h.utils.densify_shard(source, shard)
+            expected = torch.tensor(dense[shard], dtype=dtype)
+            self.assertTrue(torch.allclose(found, expected))
+
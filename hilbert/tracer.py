@@ -14,10 +14,10 @@ class Tracer:
         self.trace_file = None if write_path is None else open(write_path, 'w')
         self.verbose = verbose
 
-    def open(self, path):
+    def open(self, path, mode='w'):
         if self.trace_file is not None:
             self.trace_file.close()
-        self.trace_file = open(path, 'w')
+        self.trace_file = open(path, mode)
 
     def start(self, args):
         self.trace('\n'.join(
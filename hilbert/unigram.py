@@ -43,6 +43,7 @@ class Unigram(object):
 
         self.check_sorted()
         self.smoothed = False
+        self._smoothed_versions = {}
 
     def check_sorted(self):
         """
@@ -68,6 +69,25 @@ class Unigram(object):
         self.Nx = [count ** alpha for count in self.Nx]
         self.N = sum(self.Nx)
 
+    def get_smoothed(self, alpha):
+        """
+        Return a smoothed version of this unigram, as by ``apply_smoothing``,
+        leaving this one unchanged.  The smoothed version shares this
+        unigram's dictionary, and is made only once for each ``alpha``, so
+        that users of a shared unigram can all share its smoothed version too.
+        """
+        if alpha == 1 or alpha is None:
+            return self
+        if self.smoothed:
+            raise ValueError(
+                "Attempting to apply unigram smoothing multiple times!")
+        if alpha not in self._smoothed_versions:
+            smoothed = Unigram(
+                dictionary=self.dictionary, Nx=self.Nx, verbose=self.verbose)
+            smoothed.apply_smoothing(alpha)
+            self._smoothed_versions[alpha] = smoothed
+        return self._smoothed_versions[alpha]
+
     def __getitem__(self, shard):
         return self.load_shard(shard)
 
@@ -39,9 +39,9 @@ def load_shard(
         dtype=h.CONSTANTS.DEFAULT_DTYPE,
         device=None):
     # Handle Scipy sparse matrix types
-    if isinstance(source, (sparse.csr_matrix, sparse.lil_matrix)):
+    if sparse.issparse(source):
         shard = shard or slice(None)
-        return torch.tensor(source[shard].toarray(), dtype=dtype, device=device)
+        return densify_shard(source, shard, dtype=dtype, device=device)
 
     # Handle Numpy matrix types
     elif isinstance(source, np.matrix):
@@ -56,6 +56,148 @@ def load_shard(
     return torch.tensor(source[shard], dtype=dtype, device=device)
 
 
+def sparse_coordinates(source):
+    """
+    Get the row indices, column indices, and values of the stored entries of
+    the scipy sparse matrix ``source`` as tensors, without densifying it.
+    """
+    source = sparse.coo_matrix(source)
+    return (
+        torch.from_numpy(source.row.astype(np.int64)),
+        torch.from_numpy(source.col.astype(np.int64)),
+        torch.from_numpy(source.data)
+    )
+
+
+def densify_shard(
+        source,
+        shard=None,
+        dtype=h.CONSTANTS.DEFAULT_DTYPE,
+        device=None
+):
+    """
+    Materialize ``source[shard]`` as a dense tensor, where ``source`` is a
+    scipy sparse matrix and ``shard`` is a slice or pair of slices.  The
+    position of each stored entry within the shard is worked out
+    arithmetically from the slices' start and step, and the values are
+    scattered into a zeroed tensor, so the sparse matrix is never sliced.
+    """
+    if shard is None:
+        shard = h.shards.whole
+    if isinstance(shard, slice):
+        shard = (shard, slice(None))
+    num_rows, num_cols = source.shape
+    row_range = range(*shard[0].indices(num_rows))
+    col_range = range(*shard[1].indices(num_cols))
+
+    # Negative steps are uncommon enough to leave to scipy.
+    if row_range.step < 0 or col_range.step < 0:
+        return torch.tensor(
+            source[tuple(shard)].toarray(), dtype=dtype, device=device)
+
+    rows, cols, values = sparse_coordinates(source)
+    rows = rows - row_range.start
+    cols = cols - col_range.start
+    keep = (
+        (rows >= 0) & (rows % row_range.step == 0)
+        & (rows // row_range.step < len(row_range))
+        & (cols >= 0) & (cols % col_range.step == 0)
+        & (cols // col_range.step < len(col_range))
+    )
+    dense = torch.zeros((len(row_range), len(col_range)), dtype=dtype)
+    dense.index_put_(
+        (rows[keep] // row_range.step, cols[keep] // col_range.step),
+        values[keep].to(dtype), accumulate=True
+    )
+    return dense.to(device)
+
+
+def densify_shards(
+        source,
+        shard_factor,
+        dtype=h.CONSTANTS.DEFAULT_DTYPE,
+        pin_memory=False,
+        out=None
+):
+    """
+    Materialize every shard of the scipy sparse matrix ``source`` for the
+    given ``shard_factor`` as dense CPU tensors, in one pass over its stored
+    entries.  Returns a list of tensors, ordered like
+    ``h.shards.Shards(shard_factor)``.
+
+    The ``(i,j)``th entry belongs to shard ``(i % shard_factor) * shard_factor
+    + j % shard_factor`` at position ``(i // shard_factor, j //
+    shard_factor)``.  All shards are views into a single preallocated buffer,
+    which is page-locked if ``pin_memory`` is ``True``, ready for fast
+    transfer to the GPU.  To reuse an existing buffer instead, pass it as
+    ``out``, a 1D tensor with at least as many elements as ``source``.
+    """
+    num_rows, num_cols = source.shape
+    f = shard_factor
+    shard_rows = [len(range(i, num_rows, f)) for i in range(f)]
+    shard_cols = [len(range(j, num_cols, f)) for j in range(f)]
+    sizes = [rows * cols for rows in shard_rows for cols in shard_cols]
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    # Find where each stored entry lands in the flat buffer of all shards.
+    rows, cols, values = sparse_coordinates(source)
+    shard_num = (rows % f) * f + cols % f
+    row_length = torch.tensor(shard_cols).repeat(f)
+    flat_index = (
+        torch.from_numpy(starts.astype(np.int64))[shard_num]
+        + (rows // f) * row_length[shard_num] + cols // f
+    )
+
+    if out is None:
+        buffer = torch.zeros(sum(sizes), dtype=dtype, pin_memory=pin_memory)
+    elif out.numel() < sum(sizes):
+        raise ValueError(
+            'Buffer holds {} elements, but {} are needed.'.format(
+                out.numel(), sum(sizes))
+        )
+    else:
+        buffer = out[:sum(sizes)].zero_()
+    buffer.index_put_((flat_index,), values.to(dtype), accumulate=True)
+    return [
+        buffer[start:start+size].view(shard_rows[k // f], shard_cols[k % f])
+        for k, (start, size) in enumerate(zip(starts, sizes))
+    ]
+
+
+def sparse_shards(
+        source,
+        shard_factor,
+        dtype=h.CONSTANTS.DEFAULT_DTYPE
+):
+    """
+    Like ``densify_shards``, but keeps each shard sparse: returns a list of
+    coalesced ``torch.sparse_coo_tensor``s, ordered like
+    ``h.shards.Shards(shard_factor)``, holding only the stored entries of
+    ``source`` that fall in each shard.  Call ``to_dense()`` on a shard,
+    ideally after moving it to its target device, to materialize it.
+    """
+    num_rows, num_cols = source.shape
+    f = shard_factor
+    rows, cols, values = sparse_coordinates(source)
+
+    # Group the stored entries by shard, with one stable sort.
+    shard_num = (rows % f) * f + cols % f
+    order = torch.argsort(shard_num, stable=True)
+    counts = torch.bincount(shard_num, minlength=f * f).tolist()
+    indices = torch.stack((rows[order] // f, cols[order] // f))
+    values = values[order].to(dtype)
+
+    shards = []
+    for k, (shard_indices, shard_values) in enumerate(zip(
+        torch.split(indices, counts, dim=1), torch.split(values, counts)
+    )):
+        shape = (
+            len(range(k // f, num_rows, f)), len(range(k % f, num_cols, f)))
+        shards.append(torch.sparse_coo_tensor(
+            shard_indices, shard_values, shape).coalesce())
+    return shards
+
+
 def norm(array_or_tensor, ord=2, axis=None, keepdims=False):
     if isinstance(array_or_tensor, np.ndarray):
         return np.linalg.norm(array_or_tensor, ord, axis, keepdims)